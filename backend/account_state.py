@@ -0,0 +1,347 @@
+"""
+Estado da conta em memória: posições, margem, saldo sacável e ordens abertas.
+
+Semeado por REST (clearinghouseState + frontendOpenOrders) e mantido pelos
+canais de usuário do WebSocket:
+
+- webData2: snapshot completo da conta (substitui posições, margem e ordens)
+- orderUpdates: ordens abertas/canceladas/executadas, aplicadas por oid
+- userFills: execuções; ajustam o tamanho/preço de entrada da posição até o
+  próximo webData2 trazer a margem recalculada pela exchange
+
+Leituras (GET /api/account, stream de conta) nunca vão ao upstream no caminho
+quente; só recorrem ao REST se o feed de conta estiver parado e o snapshot velho.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Callable, Deque, Dict, List, Optional, Sequence, Set, Tuple, Union
+
+from dedup import RecentKeys
+from market_data import SingleFlight
+from upstream import Priority, UpstreamScheduler
+
+logger = logging.getLogger(__name__)
+
+# orderUpdates statuses that keep an order resting; anything else removes it
+OPEN_STATUSES = {"open", "triggered"}
+
+
+class AccountUnavailable(Exception):
+    """Sem endereço de conta ou sem snapshot (REST falhou e o feed não entregou nada)"""
+
+
+def _float(value: Any) -> Optional[float]:
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_margin(summary: Optional[dict]) -> dict:
+    summary = summary or {}
+    return {
+        "account_value": _float(summary.get("accountValue")),
+        "total_ntl_pos": _float(summary.get("totalNtlPos")),
+        "total_raw_usd": _float(summary.get("totalRawUsd")),
+        "total_margin_used": _float(summary.get("totalMarginUsed")),
+    }
+
+
+def parse_position(position: dict) -> dict:
+    leverage = position.get("leverage") or {}
+    return {
+        "coin": position.get("coin"),
+        "size": _float(position.get("szi")) or 0.0,
+        "entry_price": _float(position.get("entryPx")),
+        "position_value": _float(position.get("positionValue")),
+        "unrealized_pnl": _float(position.get("unrealizedPnl")),
+        "return_on_equity": _float(position.get("returnOnEquity")),
+        "liquidation_price": _float(position.get("liquidationPx")),
+        "margin_used": _float(position.get("marginUsed")),
+        "leverage": _float(leverage.get("value")),
+        "leverage_type": leverage.get("type"),
+        "max_leverage": _float(position.get("maxLeverage")),
+    }
+
+
+def parse_order(order: dict) -> dict:
+    return {
+        "oid": order.get("oid"),
+        "cloid": order.get("cloid"),
+        "coin": order.get("coin"),
+        "side": "buy" if order.get("side") == "B" else "sell",
+        "limit_price": _float(order.get("limitPx")),
+        "size": _float(order.get("sz")),
+        "orig_size": _float(order.get("origSz")),
+        "order_type": order.get("orderType", "Limit"),
+        "reduce_only": bool(order.get("reduceOnly", False)),
+        "trigger_price": _float(order.get("triggerPx")),
+        "timestamp": order.get("timestamp"),
+    }
+
+
+class AccountState:
+    """Espelho em memória da conta, versionado a cada mudança"""
+
+    def __init__(self, upstream: UpstreamScheduler, get_info_client: Callable,
+                 rest_ttl: float = 5.0, fills_history: int = 200,
+                 on_change: Optional[Callable[[str, "AccountState"], None]] = None):
+        self.upstream = upstream
+        self.get_info_client = get_info_client
+        self.rest_ttl = rest_ttl
+        self.on_change = on_change  # called with (reason, state) after every applied change
+        self.flight = SingleFlight()
+        self.user: Optional[str] = None
+        self.positions: Dict[str, dict] = {}
+        self.margin_summary = parse_margin(None)
+        self.cross_margin_summary = parse_margin(None)
+        self.cross_maintenance_margin_used: Optional[float] = None
+        self.withdrawable: Optional[float] = None
+        self.open_orders: Dict[int, dict] = {}
+        self.recent_fills: Deque[dict] = deque(maxlen=fills_history)
+        self._seen_tids = RecentKeys(fills_history * 5)
+        self.version = 0
+        self.seeded = False
+        self.source: Optional[str] = None
+        self.last_update: Optional[str] = None
+        self._updated_at: Optional[float] = None
+        self.stats = {"rest_seeds": 0, "rest_errors": 0, "web_data": 0, "order_updates": 0, "fills": 0}
+        self.last_error: Optional[str] = None
+        self._background: Set[asyncio.Task] = set()
+
+    def set_user(self, user: Optional[str]):
+        """Troca de conta: descarta o estado da anterior"""
+        user = user.lower() if user else None
+        if user == self.user:
+            return
+        self.user = user
+        self.positions = {}
+        self.open_orders = {}
+        self.recent_fills.clear()
+        self._seen_tids.clear()
+        self.withdrawable = None
+        self.margin_summary = parse_margin(None)
+        self.cross_margin_summary = parse_margin(None)
+        self.cross_maintenance_margin_used = None
+        self.seeded = False
+        self._changed("reset", None)
+
+    def age(self) -> Optional[float]:
+        return time.monotonic() - self._updated_at if self._updated_at is not None else None
+
+    def _changed(self, reason: str, source: Optional[str]):
+        self.version += 1
+        if source is not None:
+            self.source = source
+            self._updated_at = time.monotonic()
+            self.last_update = datetime.now().isoformat()
+        if self.on_change is not None:
+            self.on_change(reason, self)
+
+    # --- snapshots (REST seed and webData2) ---
+
+    def apply_clearinghouse(self, state: dict, open_orders: Optional[List[dict]], source: str):
+        self.margin_summary = parse_margin(state.get("marginSummary"))
+        self.cross_margin_summary = parse_margin(state.get("crossMarginSummary"))
+        self.cross_maintenance_margin_used = _float(state.get("crossMaintenanceMarginUsed"))
+        self.withdrawable = _float(state.get("withdrawable"))
+        positions = {}
+        for item in state.get("assetPositions", []):
+            position = parse_position(item.get("position", {}))
+            if position["coin"] and position["size"]:
+                positions[position["coin"]] = position
+        self.positions = positions
+        if open_orders is not None:
+            self.open_orders = {order["oid"]: parse_order(order) for order in open_orders if order.get("oid") is not None}
+        self.seeded = True
+        self._changed("snapshot", source)
+
+    async def seed(self, priority: Priority = Priority.ACCOUNT):
+        """Snapshot REST (coalescido): no startup, no resync do feed ou com o feed parado"""
+        if not self.user:
+            raise AccountUnavailable("ACCOUNT_ADDRESS not configured")
+        user = self.user
+
+        async def fetch():
+            info_client = await self.get_info_client()
+            if info_client is None:
+                raise AccountUnavailable("Info client not initialized")
+            try:
+                state = await self.upstream.info(info_client, "user_state", user, priority=priority)
+                orders = await self.upstream.info(info_client, "frontend_open_orders", user, priority=priority)
+            except Exception as e:
+                self.stats["rest_errors"] += 1
+                self.last_error = f"{type(e).__name__}: {e}"
+                logger.error(f"❌ ERRO ao obter estado da conta: {self.last_error}")
+                raise AccountUnavailable(self.last_error) from e
+            if user != self.user:
+                return  # account switched while the request was in flight
+            self.stats["rest_seeds"] += 1
+            self.last_error = None
+            self.apply_clearinghouse(state or {}, orders or [], "rest")
+
+        await self.flight.do(("account", user), fetch)
+
+    def revalidate(self):
+        """Seed REST em background (servindo o snapshot atual enquanto isso)"""
+        if self.flight.in_flight(("account", self.user)):
+            return
+
+        async def run():
+            try:
+                await self.seed()
+            except AccountUnavailable:
+                pass  # already recorded in last_error
+
+        task = asyncio.create_task(run())
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    # --- WebSocket user channels ---
+
+    def apply_message(self, data: dict) -> bool:
+        """Aplica uma mensagem dos canais de usuário; False se não era de conta"""
+        channel = data.get("channel")
+        payload = data.get("data")
+        if channel == "webData2" and isinstance(payload, dict):
+            if not self._for_me(payload.get("user")):
+                return True
+            self.stats["web_data"] += 1
+            state = payload.get("clearinghouseState")
+            if isinstance(state, dict):
+                self.apply_clearinghouse(state, payload.get("openOrders"), "websocket")
+            return True
+        if channel == "orderUpdates" and isinstance(payload, list):
+            for update in payload:
+                self._apply_order_update(update)
+            self._changed("orders", "websocket")
+            return True
+        if channel == "userFills" and isinstance(payload, dict):
+            if not self._for_me(payload.get("user")):
+                return True
+            applied = [fill for fill in payload.get("fills", []) if self._apply_fill(fill, payload.get("isSnapshot", False))]
+            if applied:
+                self._changed("fills", "websocket")
+            return True
+        return False
+
+    def _for_me(self, user: Optional[str]) -> bool:
+        return not user or not self.user or user.lower() == self.user
+
+    def _apply_order_update(self, update: dict):
+        order = update.get("order") or {}
+        oid = order.get("oid")
+        if oid is None:
+            return
+        self.stats["order_updates"] += 1
+        if update.get("status") in OPEN_STATUSES:
+            self.open_orders[oid] = parse_order(order)
+        else:
+            self.open_orders.pop(oid, None)
+
+    def _apply_fill(self, fill: dict, is_snapshot: bool) -> bool:
+        tid = fill.get("tid")
+        if tid is not None and self._seen_tids.seen(tid):
+            return False
+        self.recent_fills.append(fill)
+        self.stats["fills"] += 1
+        if is_snapshot:
+            return True  # history only: positions come from the clearinghouse snapshot
+        coin = fill.get("coin")
+        px = _float(fill.get("px"))
+        sz = _float(fill.get("sz"))
+        start = _float(fill.get("startPosition"))
+        if not coin or px is None or sz is None or start is None:
+            return True
+        signed = sz if fill.get("side") == "B" else -sz
+        new_size = start + signed
+        position = self.positions.get(coin)
+        if abs(new_size) < 1e-12:
+            self.positions.pop(coin, None)
+            return True
+        if position is None:
+            position = parse_position({"coin": coin, "szi": start, "entryPx": px})
+            self.positions[coin] = position
+        entry = position.get("entry_price") or px
+        if start == 0 or (start > 0) != (new_size > 0):
+            entry = px  # opened or flipped
+        elif abs(new_size) > abs(start):
+            entry = (abs(start) * entry + sz * px) / abs(new_size)
+        # Margin and PnL figures are refreshed by the next webData2
+        position.update(size=new_size, entry_price=entry)
+        return True
+
+    # --- open-order index (cancel / modify) ---
+
+    def find_order(self, order_id: Union[int, str]) -> Optional[dict]:
+        """Ordem aberta por oid (inteiro) ou cloid ("0x..." de 16 bytes)"""
+        if isinstance(order_id, int):
+            return self.open_orders.get(order_id)
+        cloid = order_id.lower()
+        return next((o for o in self.open_orders.values() if (o.get("cloid") or "").lower() == cloid), None)
+
+    def select_orders(self, oids: Sequence[int] = (), cloids: Sequence[str] = (), symbol: Optional[str] = None,
+                      all_orders: bool = False) -> Tuple[List[dict], List[Union[int, str]]]:
+        """Ordens abertas que casam com algum critério, e os ids pedidos que não estão abertos"""
+        if all_orders:
+            return list(self.open_orders.values()), []
+        selected: Dict[int, dict] = {}
+        missing: List[Union[int, str]] = []
+        for order_id in [*oids, *cloids]:
+            order = self.find_order(order_id)
+            if order is None:
+                missing.append(order_id)
+            else:
+                selected[order["oid"]] = order
+        if symbol:
+            selected.update((o["oid"], o) for o in self.open_orders.values() if o["coin"] == symbol)
+        return list(selected.values()), missing
+
+    def drop_orders(self, oids: Sequence[int]):
+        """Tira do índice ordens que a exchange já confirmou canceladas/substituídas (o orderUpdates vem depois)"""
+        removed = [oid for oid in oids if self.open_orders.pop(oid, None) is not None]
+        if removed:
+            self._changed("orders", "exchange")
+
+    # --- reads ---
+
+    def needs_rest(self, feed_connected: bool) -> bool:
+        if not self.seeded:
+            return True
+        age = self.age()
+        return not feed_connected and (age is None or age >= self.rest_ttl)
+
+    def snapshot(self) -> dict:
+        age = self.age()
+        return {
+            "user": self.user,
+            "version": self.version,
+            "source": self.source,
+            "last_update": self.last_update,
+            "age_seconds": round(age, 3) if age is not None else None,
+            "margin_summary": self.margin_summary,
+            "cross_margin_summary": self.cross_margin_summary,
+            "cross_maintenance_margin_used": self.cross_maintenance_margin_used,
+            "withdrawable": self.withdrawable,
+            "positions": list(self.positions.values()),
+            "open_orders": sorted(self.open_orders.values(), key=lambda o: o.get("timestamp") or 0),
+        }
+
+    def etag(self) -> str:
+        return f'"account-{self.version}"'
+
+    def metrics(self) -> dict:
+        age = self.age()
+        return {
+            **self.stats,
+            "seeded": self.seeded,
+            "version": self.version,
+            "source": self.source,
+            "age_s": round(age, 3) if age is not None else None,
+            "positions": len(self.positions),
+            "open_orders": len(self.open_orders),
+            "last_error": self.last_error,
+        }
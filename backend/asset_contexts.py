@@ -0,0 +1,226 @@
+"""
+Tabela de contexto dos ativos: funding, mark/oracle, open interest e volume 24h.
+
+- Carga em lote: um meta_and_asset_ctxs traz o universo inteiro numa chamada
+  (recarregada quando vence, em background, como o cache de market data).
+- Stream: mensagens activeAssetCtx atualizam os ativos assinados entre as cargas.
+- Consultas (filtrar/ordenar/limitar) saem em bytes JSON guardados por versão da
+  tabela: a mesma consulta, sem mudança na tabela, não refaz filtro, sort nem JSON.
+  Updates do stream só trocam essa versão no máximo a cada `screen_ttl` segundos
+  (cargas em lote trocam na hora); o ativo individual sempre sai da linha atual.
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, List, Optional, Set
+
+import orjson
+
+from market_data import MarketDataUnavailable, SingleFlight
+from upstream import Priority, UpstreamScheduler
+
+logger = logging.getLogger(__name__)
+
+# Perp funding is paid hourly
+FUNDING_PERIODS_PER_YEAR = 24 * 365
+
+SORT_FIELDS = ("funding", "funding_abs", "open_interest_usd", "day_volume_usd", "change_24h_pct", "premium",
+               "mark_price", "symbol")
+
+
+def _float(value: Any) -> Optional[float]:
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_asset_ctx(symbol: str, ctx: dict, max_leverage: Optional[int] = None, source: str = "rest") -> dict:
+    """Linha da tabela a partir do contexto da API (strings numéricas -> floats, derivados calculados)"""
+    mark = _float(ctx.get("markPx"))
+    prev_day = _float(ctx.get("prevDayPx"))
+    funding = _float(ctx.get("funding"))
+    open_interest = _float(ctx.get("openInterest"))
+    impact = ctx.get("impactPxs") or [None, None]
+    return {
+        "symbol": symbol,
+        "funding": funding,
+        "funding_annualized_pct": funding * FUNDING_PERIODS_PER_YEAR * 100 if funding is not None else None,
+        "premium": _float(ctx.get("premium")),
+        "mark_price": mark,
+        "oracle_price": _float(ctx.get("oraclePx")),
+        "mid_price": _float(ctx.get("midPx")),
+        "impact_bid": _float(impact[0]) if len(impact) > 0 else None,
+        "impact_ask": _float(impact[1]) if len(impact) > 1 else None,
+        "open_interest": open_interest,
+        "open_interest_usd": open_interest * mark if open_interest is not None and mark else None,
+        "day_volume_usd": _float(ctx.get("dayNtlVlm")),
+        "prev_day_price": prev_day,
+        "change_24h_pct": (mark / prev_day - 1) * 100 if mark and prev_day else None,
+        "max_leverage": max_leverage,
+        "source": source,
+        "updated_at": datetime.now().isoformat(),
+    }
+
+
+class AssetContextTable:
+    def __init__(self, upstream: UpstreamScheduler, get_info_client: Callable[[], Awaitable[Any]],
+                 refresh_interval: float = 60.0, max_cached_queries: int = 64, screen_ttl: float = 5.0):
+        self.upstream = upstream
+        self.get_info_client = get_info_client
+        self.refresh_interval = refresh_interval
+        self.rows: Dict[str, dict] = {}
+        self.version = 0
+        # Version the screening queries are cached against: lags stream updates by up to screen_ttl
+        self.screen_version = 0
+        self.screen_ttl = screen_ttl
+        self._screened_at = 0.0
+        self.last_error: Optional[str] = None
+        self.flight = SingleFlight()
+        self._loaded_at: Optional[float] = None
+        self._background: Set[asyncio.Task] = set()
+        # Encoded query results for the current version (LRU)
+        self._queries: "OrderedDict[Hashable, bytes]" = OrderedDict()
+        self._queries_version = 0
+        self._max_cached_queries = max_cached_queries
+        self.stats = {"bulk_loads": 0, "bulk_errors": 0, "stream_updates": 0, "queries": 0, "query_cache_hits": 0}
+
+    # --- updates ---
+
+    def load(self, meta_and_ctxs: Any) -> int:
+        """Aplica um [meta, ctxs] do meta_and_asset_ctxs (universo inteiro)"""
+        meta, ctxs = meta_and_ctxs
+        rows = {}
+        for asset, ctx in zip(meta.get("universe", []), ctxs):
+            if asset.get("isDelisted"):
+                continue
+            rows[asset["name"]] = parse_asset_ctx(asset["name"], ctx, asset.get("maxLeverage"))
+        self.rows = rows
+        self._loaded_at = time.monotonic()
+        self.version += 1
+        self.screen_version = self.version
+        self._screened_at = self._loaded_at
+        self.stats["bulk_loads"] += 1
+        return len(rows)
+
+    def apply_message(self, data: dict) -> Optional[dict]:
+        """activeAssetCtx do WebSocket; retorna a linha atualizada (None se não é desse canal)"""
+        if data.get("channel") != "activeAssetCtx" or not isinstance(data.get("data"), dict):
+            return None
+        coin = data["data"].get("coin")
+        ctx = data["data"].get("ctx")
+        if not coin or not isinstance(ctx, dict):
+            return None
+        previous = self.rows.get(coin)
+        row = parse_asset_ctx(coin, ctx, previous.get("max_leverage") if previous else None, source="websocket")
+        self.rows[coin] = row
+        self.version += 1
+        self.stats["stream_updates"] += 1
+        return row
+
+    async def refresh(self, priority: Priority = Priority.MARKET_DATA) -> int:
+        """Recarga em lote (coalescida)"""
+        return await self.flight.do("__asset_ctxs__", lambda: self._fetch(priority))
+
+    async def _fetch(self, priority: Priority) -> int:
+        try:
+            info_client = await self.get_info_client()
+            if info_client is None:
+                raise MarketDataUnavailable("Info client not initialized")
+            result = await self.upstream.info(info_client, "meta_and_asset_ctxs", priority=priority)
+            count = self.load(result)
+        except Exception as e:
+            self.stats["bulk_errors"] += 1
+            self.last_error = str(e)
+            logger.error(f"❌ ERRO ao obter contextos dos ativos: {type(e).__name__}: {e}")
+            if isinstance(e, MarketDataUnavailable):
+                raise
+            raise MarketDataUnavailable(str(e)) from e
+        self.last_error = None
+        logger.info(f"📋 Asset contexts loaded for {count} assets")
+        return count
+
+    @property
+    def age(self) -> Optional[float]:
+        """Segundos desde a última carga em lote"""
+        return time.monotonic() - self._loaded_at if self._loaded_at is not None else None
+
+    async def ensure_loaded(self):
+        """Sem tabela -> espera a carga; vencida -> responde com ela e recarrega em background"""
+        age = self.age
+        if age is None:
+            await self.refresh()
+        elif age >= self.refresh_interval and not self.flight.in_flight("__asset_ctxs__"):
+            async def run():
+                try:
+                    await self.refresh()
+                except MarketDataUnavailable:
+                    pass  # already recorded in last_error; keep serving the last table
+
+            task = asyncio.create_task(run())
+            self._background.add(task)
+            task.add_done_callback(self._background.discard)
+
+    # --- reads ---
+
+    def get(self, symbol: str) -> Optional[dict]:
+        return self.rows.get(symbol)
+
+    def select(self, sort: str = "open_interest_usd", descending: bool = True, limit: Optional[int] = None,
+               symbols: Optional[Iterable[str]] = None, min_open_interest_usd: Optional[float] = None,
+               min_volume_usd: Optional[float] = None, min_funding: Optional[float] = None,
+               max_funding: Optional[float] = None) -> List[dict]:
+        """Filtra e ordena as linhas; valores ausentes do campo de ordenação vão para o fim"""
+        if sort not in SORT_FIELDS:
+            raise ValueError(f"sort must be one of {', '.join(SORT_FIELDS)}")
+        wanted = set(symbols) if symbols is not None else None
+
+        def keep(row: dict) -> bool:
+            return ((wanted is None or row["symbol"] in wanted)
+                    and (min_open_interest_usd is None or (row["open_interest_usd"] or 0) >= min_open_interest_usd)
+                    and (min_volume_usd is None or (row["day_volume_usd"] or 0) >= min_volume_usd)
+                    and (min_funding is None or (row["funding"] is not None and row["funding"] >= min_funding))
+                    and (max_funding is None or (row["funding"] is not None and row["funding"] <= max_funding)))
+
+        rows = [row for row in self.rows.values() if keep(row)]
+        if sort == "symbol":
+            rows.sort(key=lambda row: row["symbol"], reverse=descending)
+        else:
+            field = "funding" if sort == "funding_abs" else sort
+            transform = abs if sort == "funding_abs" else (lambda value: value)
+            present = [row for row in rows if row[field] is not None]
+            present.sort(key=lambda row: transform(row[field]), reverse=descending)
+            rows = present + [row for row in rows if row[field] is None]
+        return rows[:limit] if limit is not None else rows
+
+    def query(self, **params) -> bytes:
+        """select() já serializado; reaproveitado enquanto a versão da tabela não muda"""
+        self.stats["queries"] += 1
+        now = time.monotonic()
+        if self.screen_version != self.version and now - self._screened_at >= self.screen_ttl:
+            self.screen_version = self.version
+            self._screened_at = now
+        if self._queries_version != self.screen_version:
+            self._queries.clear()
+            self._queries_version = self.screen_version
+        key = tuple(sorted((name, tuple(sorted(value)) if isinstance(value, (set, frozenset, list)) else value)
+                           for name, value in params.items()))
+        body = self._queries.get(key)
+        if body is not None:
+            self.stats["query_cache_hits"] += 1
+            self._queries.move_to_end(key)
+            return body
+        rows = self.select(**params)
+        body = orjson.dumps({"success": True, "version": self.screen_version, "total": len(self.rows),
+                             "count": len(rows), "assets": rows})
+        self._queries[key] = body
+        while len(self._queries) > self._max_cached_queries:
+            self._queries.popitem(last=False)
+        return body
+
+    def metrics(self) -> dict:
+        age = self.age
+        return {**self.stats, "assets": len(self.rows), "version": self.version, "screen_version": self.screen_version,
+                "age_seconds": round(age, 3) if age is not None else None, "last_error": self.last_error}
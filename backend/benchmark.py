@@ -0,0 +1,412 @@
+#!/usr/bin/env python3
+"""
+Benchmark end-to-end do backend contra o servidor de replay local.
+
+Sobe replay_server.py (ticks sintéticos) e o backend (uvicorn) em processos
+separados, mede latência (p50/p99/max) e throughput dos endpoints quentes e do
+fan-out de /ws/price, e grava o resultado em JSON para comparar versões.
+
+Uso:
+    python benchmark.py --output results.json
+    python benchmark.py --output new.json --compare results.json --threshold 20
+    python benchmark.py --only ws_fanout --ws-clients 1,100,1000
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import resource
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+import requests
+import websockets
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', stream=sys.stderr)
+logger = logging.getLogger("benchmark")
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BACKEND_DIR)
+SCENARIOS = ["market_hit", "market_miss", "cache_prices", "order_market", "order_limit", "ws_fanout"]
+# Throwaway key: the replay server never verifies signatures
+BENCH_SECRET_KEY = "0x" + "11" * 32
+BENCH_ACCOUNT = "0x" + "22" * 20
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(sorted_values: List[float], pct: float) -> Optional[float]:
+    """Percentil por nearest-rank (lista já ordenada)"""
+    if not sorted_values:
+        return None
+    rank = max(int(round(pct / 100.0 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def summarize(latencies_ms: List[float], wall_seconds: float, errors: int = 0, **extra) -> dict:
+    values = sorted(latencies_ms)
+    return {
+        "count": len(values),
+        "errors": errors,
+        "p50_ms": round(percentile(values, 50), 3) if values else None,
+        "p99_ms": round(percentile(values, 99), 3) if values else None,
+        "max_ms": round(values[-1], 3) if values else None,
+        "mean_ms": round(sum(values) / len(values), 3) if values else None,
+        "throughput_per_s": round(len(values) / wall_seconds, 1) if wall_seconds > 0 else None,
+        **extra,
+    }
+
+
+def wait_until_up(url: str, timeout: float = 30.0, method: str = "get", **kwargs):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            requests.request(method, url, timeout=1, **kwargs)
+            return
+        except requests.RequestException:
+            time.sleep(0.2)
+    raise RuntimeError(f"Server did not come up: {url}")
+
+
+class Stack:
+    """Replay server + backend em subprocessos"""
+
+    def __init__(self, replay_speed: float, replay_rate: float, verbose: bool):
+        self.replay_port = free_port()
+        self.backend_port = free_port()
+        self.replay_speed = replay_speed
+        self.replay_rate = replay_rate
+        self.output = None if verbose else subprocess.DEVNULL
+        self.processes: List[subprocess.Popen] = []
+
+    @property
+    def replay_url(self) -> str:
+        return f"http://127.0.0.1:{self.replay_port}"
+
+    @property
+    def backend_url(self) -> str:
+        return f"http://127.0.0.1:{self.backend_port}"
+
+    def start(self):
+        self.processes.append(subprocess.Popen(
+            [sys.executable, os.path.join(BACKEND_DIR, "replay_server.py"), "--synthetic",
+             "--speed", str(self.replay_speed), "--rate", str(self.replay_rate), "--port", str(self.replay_port)],
+            stdout=self.output, stderr=self.output,
+        ))
+        wait_until_up(f"{self.replay_url}/replay/status")
+
+        env = dict(os.environ)
+        env.update({
+            "HYPERLIQUID_API_URL": self.replay_url,
+            "HYPERLIQUID_WS_URL": f"ws://127.0.0.1:{self.replay_port}/ws",
+            "ACCOUNT_ADDRESS": BENCH_ACCOUNT,
+            "SECRET_KEY": BENCH_SECRET_KEY,
+            "WEBSOCKET_ENABLED": "false",
+            "PRICE_SOURCE": "rest",
+        })
+        self.processes.append(subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", BACKEND_DIR,
+             "--host", "127.0.0.1", "--port", str(self.backend_port), "--log-level", "warning"],
+            cwd=BACKEND_DIR, env=env, stdout=self.output, stderr=self.output,
+        ))
+        wait_until_up(f"{self.backend_url}/healthz")
+        self.wait_ready()
+
+    def wait_ready(self, timeout: float = 60.0):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if requests.get(f"{self.backend_url}/readyz", timeout=5).status_code == 200:
+                return
+            time.sleep(0.2)
+        raise RuntimeError("Backend never became ready (see /readyz)")
+
+    def stop(self):
+        for process in reversed(self.processes):
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+class Samples:
+    """Latências brutas de um lote de requisições, agrupadas por classe"""
+
+    def __init__(self):
+        self.buckets: Dict[str, List[float]] = {}
+        self.errors = 0
+        self.wall_seconds = 0.0
+
+    def summary(self, label: str = "all", **extra) -> dict:
+        return summarize(self.buckets.get(label, []), self.wall_seconds, self.errors, **extra)
+
+
+def run_http(request_fn: Callable[[requests.Session, int], requests.Response], total: int, concurrency: int,
+             classify: Optional[Callable[[requests.Response], str]] = None) -> Samples:
+    """Dispara `total` requisições com `concurrency` threads"""
+    local = threading.local()
+    lock = threading.Lock()
+    samples = Samples()
+
+    def one(i):
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        start = time.perf_counter()
+        try:
+            response = request_fn(session, i)
+            elapsed = (time.perf_counter() - start) * 1000
+            ok = response.status_code < 500
+        except requests.RequestException:
+            response, elapsed, ok = None, None, False
+        with lock:
+            if not ok:
+                samples.errors += 1
+                return
+            label = classify(response) if classify else "all"
+            samples.buckets.setdefault(label, []).append(elapsed)
+
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(total)))
+    samples.wall_seconds = time.perf_counter() - wall_start
+    return samples
+
+
+def cached_label(response: requests.Response) -> str:
+    try:
+        body = response.json()
+    except ValueError:
+        return "miss"
+    if body.get("stale"):
+        return "stale"
+    return "hit" if body.get("cached") else "miss"
+
+
+def bench_market_hit(stack: Stack, args) -> dict:
+    url = f"{stack.backend_url}/api/market/{args.symbol}"
+    requests.get(url, timeout=30)  # warm the cache
+    samples = run_http(lambda s, i: s.get(url, timeout=30), args.requests, args.concurrency, cached_label)
+    return samples.summary("hit", misses=len(samples.buckets.get("miss", [])))
+
+
+def bench_market_miss(stack: Stack, args) -> dict:
+    """Cold misses (símbolos nunca buscados) e respostas stale após o TTL.
+
+    Cada rodada dispara `concurrency` requisições simultâneas por símbolo, então
+    misses concorrentes do mesmo símbolo exercitam a coalescência.
+    """
+    universe = requests.post(f"{stack.replay_url}/info", json={"type": "meta"}, timeout=5).json()["universe"]
+    symbols = [asset["name"] for asset in universe]
+    per_round = [symbol for symbol in symbols for _ in range(args.concurrency)]
+    buckets: Dict[str, List[float]] = {}
+    errors = 0
+    wall = 0.0
+    for round_number in range(args.miss_rounds):
+        if round_number:
+            time.sleep(args.cache_ttl + 0.2)
+        samples = run_http(
+            lambda s, i: s.get(f"{stack.backend_url}/api/market/{per_round[i]}", timeout=30),
+            len(per_round), len(per_round), cached_label,
+        )
+        for label, values in samples.buckets.items():
+            buckets.setdefault(label, []).extend(values)
+        errors += samples.errors
+        wall += samples.wall_seconds
+    return {
+        label: summarize(buckets.get(label, []), wall, errors, symbols=len(symbols), rounds=args.miss_rounds)
+        for label in ("miss", "stale")
+    }
+
+
+def bench_cache_prices(stack: Stack, args) -> dict:
+    url = f"{stack.backend_url}/api/cache/prices"
+    return run_http(lambda s, i: s.get(url, timeout=30), args.requests, args.concurrency).summary()
+
+
+def bench_order(stack: Stack, args, order_type: str) -> dict:
+    url = f"{stack.backend_url}/api/order"
+    mid = float(requests.post(f"{stack.replay_url}/info", json={"type": "allMids"}, timeout=5).json()[args.symbol])
+    body = {"symbol": args.symbol, "side": "buy", "order_type": order_type, "size": 0, "quantity_usd": 50.0}
+    if order_type == "limit":
+        # Far enough below the market to rest on the book, inside the 20%-180% band
+        body["price"] = round(mid * 0.9, 1)
+    total = max(args.requests // 10, 20)
+    return run_http(lambda s, i: s.post(url, json=body, timeout=30), total, args.concurrency).summary()
+
+
+async def _ws_fanout(stack: Stack, clients: int, duration: float) -> dict:
+    ws_url = stack.backend_url.replace("http://", "ws://") + "/ws/price"
+    latencies: List[float] = []
+    received = [0]
+    connected = []
+
+    async def client():
+        try:
+            async with websockets.connect(ws_url, ping_interval=None, max_queue=None, open_timeout=30) as ws:
+                connected.append(ws)
+                async for text in ws:
+                    now_ms = time.time() * 1000
+                    msg = json.loads(text)
+                    if msg.get("type") != "price_update":
+                        continue
+                    received[0] += 1
+                    if msg.get("trade_time"):
+                        latencies.append(now_ms - msg["trade_time"])
+        except (websockets.exceptions.WebSocketException, OSError):
+            pass
+
+    tasks = []
+    for _ in range(clients):
+        tasks.append(asyncio.create_task(client()))
+        if len(tasks) % 50 == 0:
+            await asyncio.sleep(0.05)
+    deadline = time.time() + 30
+    while len(connected) < clients and time.time() < deadline:
+        await asyncio.sleep(0.1)
+    latencies.clear()
+    received[0] = 0
+    status_before = requests.get(f"{stack.replay_url}/replay/status", timeout=5).json()
+    start = time.perf_counter()
+    await asyncio.sleep(duration)
+    wall = time.perf_counter() - start
+    status_after = requests.get(f"{stack.replay_url}/replay/status", timeout=5).json()
+    for ws in connected:
+        await ws.close()
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    upstream = status_after["messages_sent"] - status_before["messages_sent"]
+    return summarize(
+        latencies, wall, clients - len(connected),
+        clients=clients, connected=len(connected), messages_received=received[0],
+        upstream_messages=upstream,
+    )
+
+
+def bench_ws_fanout(stack: Stack, args) -> dict:
+    requests.post(f"{stack.backend_url}/api/config", json={"websocket_enabled": True, "rest_enabled": True}, timeout=60)
+    time.sleep(2)  # let the upstream feed connect and subscribe
+    results = {}
+    try:
+        for clients in args.ws_clients:
+            logger.info(f"  /ws/price fan-out to {clients} client(s)...")
+            results[str(clients)] = asyncio.run(_ws_fanout(stack, clients, args.ws_duration))
+    finally:
+        requests.post(f"{stack.backend_url}/api/config", json={"websocket_enabled": False, "rest_enabled": True}, timeout=60)
+    return results
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> List[str]:
+    """Lista regressões de p99 (ou throughput) acima de `threshold` % em relação ao baseline"""
+    regressions = []
+
+    def walk(cur, base, path):
+        if not isinstance(cur, dict) or not isinstance(base, dict):
+            return
+        if "p99_ms" in cur and "p99_ms" in base:
+            if cur["p99_ms"] and base["p99_ms"] and cur["p99_ms"] > base["p99_ms"] * (1 + threshold / 100):
+                regressions.append(f"{path}: p99 {base['p99_ms']}ms -> {cur['p99_ms']}ms")
+            if cur.get("throughput_per_s") and base.get("throughput_per_s") and \
+                    cur["throughput_per_s"] < base["throughput_per_s"] * (1 - threshold / 100):
+                regressions.append(f"{path}: throughput {base['throughput_per_s']}/s -> {cur['throughput_per_s']}/s")
+            return
+        for key, value in cur.items():
+            walk(value, base.get(key), f"{path}.{key}" if path else key)
+
+    walk(current.get("results", {}), baseline.get("results", {}), "")
+    return regressions
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark end-to-end do backend (offline, contra replay_server.py)")
+    parser.add_argument("--only", default=",".join(SCENARIOS), help=f"cenários separados por vírgula: {','.join(SCENARIOS)}")
+    parser.add_argument("--symbol", default="BTC")
+    parser.add_argument("--requests", type=int, default=1000, help="requisições por cenário HTTP")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--cache-ttl", type=float, default=5.0, help="TTL do cache de market data no backend")
+    parser.add_argument("--miss-rounds", type=int, default=3)
+    parser.add_argument("--ws-clients", default="1,100,1000")
+    parser.add_argument("--ws-duration", type=float, default=10.0, help="segundos de medição por nível de fan-out")
+    parser.add_argument("--replay-speed", type=float, default=1.0)
+    parser.add_argument("--replay-rate", type=float, default=20.0, help="trades/s do feed sintético")
+    parser.add_argument("--output", help="arquivo JSON de saída (padrão: stdout)")
+    parser.add_argument("--compare", help="JSON de uma execução anterior para detectar regressões")
+    parser.add_argument("--threshold", type=float, default=20.0, help="% de piora tolerada no --compare")
+    parser.add_argument("--verbose", action="store_true", help="mostra a saída dos servidores")
+    args = parser.parse_args()
+    args.ws_clients = [int(n) for n in args.ws_clients.split(",") if n.strip()]
+    selected = [name.strip() for name in args.only.split(",") if name.strip()]
+
+    # 1,000 WebSocket clients need more file descriptors than the usual default
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (max(soft, min(hard, 8192)), hard))
+
+    benches = {
+        "market_hit": bench_market_hit,
+        "market_miss": bench_market_miss,
+        "cache_prices": bench_cache_prices,
+        "order_market": lambda stack, a: bench_order(stack, a, "market"),
+        "order_limit": lambda stack, a: bench_order(stack, a, "limit"),
+        "ws_fanout": bench_ws_fanout,
+    }
+    stack = Stack(args.replay_speed, args.replay_rate, args.verbose)
+    results = {}
+    try:
+        stack.start()
+        for name in selected:
+            logger.info(f"▶ {name}")
+            results[name] = benches[name](stack, args)
+            logger.info(f"  {json.dumps(results[name])}")
+    finally:
+        stack.stop()
+
+    report = {
+        "timestamp": datetime.now().isoformat(),
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parameters": {k: v for k, v in vars(args).items() if k not in ("output", "compare", "verbose")},
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+        logger.info(f"✅ Results written to {args.output}")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        for line in regressions:
+            logger.warning(f"⚠️ Regression: {line}")
+        if regressions:
+            sys.exit(1)
+        logger.info(f"✅ No regressions above {args.threshold}% vs {args.compare}")
+
+
+if __name__ == "__main__":
+    main()
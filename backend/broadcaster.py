@@ -0,0 +1,119 @@
+"""
+Broadcaster de eventos de preço para clientes push (/ws/price e SSE /api/stream/prices).
+
+Cada evento recebe um id crescente e fica num histórico curto, para que um
+cliente SSE que reconecta com Last-Event-ID receba só o que perdeu. Cada
+assinante tem sua fila: um cliente lento perde eventos antigos em vez de
+atrasar o feed ou os outros clientes.
+"""
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, Optional, Set
+
+import orjson
+
+logger = logging.getLogger(__name__)
+
+
+class Event:
+    __slots__ = ("id", "type", "symbol", "payload", "_json")
+
+    def __init__(self, event_id: int, event_type: str, symbol: Optional[str], payload: Dict[str, Any]):
+        self.id = event_id
+        self.type = event_type
+        self.symbol = symbol
+        self.payload = payload
+        self._json: Optional[str] = None
+
+    @property
+    def json(self) -> str:
+        """Serializado uma vez, compartilhado por todos os assinantes"""
+        if self._json is None:
+            self._json = orjson.dumps(self.payload, default=str).decode()
+        return self._json
+
+    def sse(self) -> str:
+        return f"id: {self.id}\nevent: {self.type}\ndata: {self.json}\n\n"
+
+
+class Subscriber:
+    def __init__(self, symbols: Optional[Set[str]], queue_size: int):
+        self.symbols = symbols  # None = all symbols
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.dropped = 0
+
+    def wants(self, event: Event) -> bool:
+        return event.symbol is None or self.symbols is None or event.symbol in self.symbols
+
+    def offer(self, event: Event):
+        if self.queue.full():
+            # Slow consumer: drop the oldest event, never block the publisher
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(event)
+
+
+class PriceBroadcaster:
+    def __init__(self, history: int = 1000, queue_size: int = 256):
+        self._history: Deque[Event] = deque(maxlen=history)
+        self._subscribers: Set[Subscriber] = set()
+        self._queue_size = queue_size
+        self.last_id = 0
+        self.stats = {"published": 0, "resumed": 0, "resume_misses": 0}
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def wanted_symbols(self, default: Iterable[str]) -> Set[str]:
+        """Símbolos que algum assinante quer (todos, se algum não filtra)"""
+        wanted: Set[str] = set()
+        for subscriber in self._subscribers:
+            if subscriber.symbols is None:
+                return set(default)
+            wanted |= subscriber.symbols
+        return wanted
+
+    def publish(self, event_type: str, payload: Dict[str, Any], symbol: Optional[str] = None) -> Event:
+        self.last_id += 1
+        event = Event(self.last_id, event_type, symbol, payload)
+        self._history.append(event)
+        self.stats["published"] += 1
+        for subscriber in self._subscribers:
+            if subscriber.wants(event):
+                subscriber.offer(event)
+        return event
+
+    def subscribe(self, symbols: Optional[Set[str]] = None, last_event_id: Optional[int] = None):
+        """Registra um assinante. Retorna (assinante, resumed).
+
+        Com last_event_id ainda coberto pelo histórico, os eventos perdidos já
+        entram na fila e resumed=True; senão o chamador deve mandar um snapshot.
+        """
+        subscriber = Subscriber(symbols, self._queue_size)
+        resumed = False
+        if last_event_id is not None:
+            oldest = self._history[0].id if self._history else self.last_id + 1
+            if last_event_id >= oldest - 1 and last_event_id <= self.last_id:
+                for event in self._history:
+                    if event.id > last_event_id and subscriber.wants(event):
+                        subscriber.offer(event)
+                resumed = True
+                self.stats["resumed"] += 1
+            else:
+                self.stats["resume_misses"] += 1
+        self._subscribers.add(subscriber)
+        return subscriber, resumed
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self._subscribers.discard(subscriber)
+
+    def metrics(self) -> dict:
+        return {
+            **self.stats,
+            "last_id": self.last_id,
+            "subscribers": len(self._subscribers),
+            "history": len(self._history),
+            "dropped": sum(s.dropped for s in self._subscribers),
+        }
@@ -0,0 +1,271 @@
+"""
+Histórico de candles com cache local em disco.
+
+Por (símbolo, intervalo) ficam os candles já baixados e a lista de faixas de
+tempo cobertas (ordenadas e fundidas quando se sobrepõem ou encostam). Um
+pedido busca upstream (candles_snapshot) só as sub-faixas que faltam, em
+pedaços de até MAX_CANDLES_PER_CALL; carregar de novo o mesmo gráfico sai
+inteiro do cache.
+
+- Só intervalos fechados há pelo menos um intervalo entram nas faixas
+  cobertas. O candle em aberto e o último fechado (que o upstream pode ainda
+  não ter publicado) formam a cauda, rebuscada quando tem mais de live_ttl
+  segundos; assim uma cauda vazia nunca fica marcada como coberta.
+- Faixas fechadas que o upstream devolve vazias (antes da listagem, além da
+  retenção) contam como cobertas, para não serem pedidas de novo.
+- Pedidos concorrentes do mesmo símbolo/intervalo passam por um lock: quem
+  espera encontra as faixas já preenchidas e não repete o fetch.
+- Cada símbolo/intervalo é um arquivo JSONL só de acréscimo (fora do event
+  loop): cada pedaço buscado vira uma linha com seus candles e sua faixa. Na
+  carga as linhas são aplicadas em ordem e, passando de COMPACT_AFTER_LINES,
+  o arquivo é reescrito (atomicamente) numa linha só.
+"""
+import asyncio
+import bisect
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import orjson
+
+from upstream import Priority, UpstreamScheduler, candle_weight
+
+logger = logging.getLogger(__name__)
+
+# Fixed-length intervals only: range arithmetic needs a constant bucket size ("1M" is calendar based)
+INTERVAL_MS = {
+    "1m": 60_000, "3m": 180_000, "5m": 300_000, "15m": 900_000, "30m": 1_800_000,
+    "1h": 3_600_000, "2h": 7_200_000, "4h": 14_400_000, "8h": 28_800_000, "12h": 43_200_000,
+    "1d": 86_400_000, "3d": 259_200_000, "1w": 604_800_000,
+}
+# The API returns at most this many candles per call
+MAX_CANDLES_PER_CALL = 5000
+# Appended records a cache file may hold before it is compacted on load
+COMPACT_AFTER_LINES = 64
+
+Range = Tuple[int, int]  # [start, end) in ms, aligned to the interval
+
+
+def merge_ranges(ranges: List[Range]) -> List[Range]:
+    """Ordena e funde faixas que se sobrepõem ou encostam"""
+    merged: List[Range] = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def missing_ranges(covered: List[Range], start: int, end: int) -> List[Range]:
+    """Partes de [start, end) fora das faixas cobertas (que devem estar fundidas)"""
+    gaps: List[Range] = []
+    cursor = start
+    for c_start, c_end in covered:
+        if c_end <= cursor:
+            continue
+        if c_start >= end:
+            break
+        if c_start > cursor:
+            gaps.append((cursor, c_start))
+        cursor = max(cursor, c_end)
+        if cursor >= end:
+            break
+    if cursor < end:
+        gaps.append((cursor, end))
+    return gaps
+
+
+def parse_candle(raw: dict) -> dict:
+    return {
+        "time": int(raw["t"]),
+        "close_time": int(raw.get("T", 0)),
+        "open": float(raw["o"]),
+        "high": float(raw["h"]),
+        "low": float(raw["l"]),
+        "close": float(raw["c"]),
+        "volume": float(raw.get("v", 0)),
+        "trades": int(raw.get("n", 0)),
+    }
+
+
+class CandleSeries:
+    """Candles e faixas cobertas de um símbolo/intervalo"""
+
+    def __init__(self, covered: Optional[List[Range]] = None, candles: Optional[List[dict]] = None):
+        self.covered: List[Range] = merge_ranges(covered or [])
+        self.candles: Dict[int, dict] = {c["time"]: c for c in candles or []}
+        self.times: List[int] = sorted(self.candles)
+        self.live_fetched_at = 0.0  # monotonic time the open candle was last fetched
+        self.lock = asyncio.Lock()
+
+    def add(self, candles: List[dict], covered: Optional[Range] = None):
+        for candle in candles:
+            self.candles[candle["time"]] = candle
+        self.times = sorted(self.candles)
+        if covered is not None:
+            self.covered = merge_ranges([*self.covered, covered])
+
+    def between(self, start: int, end: int) -> List[dict]:
+        lo = bisect.bisect_left(self.times, start)
+        hi = bisect.bisect_left(self.times, end)
+        return [self.candles[t] for t in self.times[lo:hi]]
+
+    def as_record(self) -> dict:
+        return {"covered": self.covered, "candles": [self.candles[t] for t in self.times]}
+
+
+class CandleHistory:
+    def __init__(self, upstream: UpstreamScheduler, get_info_client: Callable[[], Awaitable[Any]],
+                 cache_dir: Optional[str] = None, live_ttl: float = 5.0):
+        self.upstream = upstream
+        self.get_info_client = get_info_client
+        self.cache_dir = cache_dir
+        self.live_ttl = live_ttl
+        self.series: Dict[Tuple[str, str], CandleSeries] = {}
+        self.stats = {"requests": 0, "local_hits": 0, "upstream_calls": 0, "upstream_errors": 0,
+                      "candles_fetched": 0, "waited": 0, "saves": 0, "compactions": 0}
+
+    def _path(self, symbol: str, interval: str) -> Optional[str]:
+        if not self.cache_dir:
+            return None
+        return os.path.join(self.cache_dir, f"{symbol}_{interval}.jsonl")
+
+    def _read(self, path: Optional[str]) -> CandleSeries:
+        series = CandleSeries()
+        if path is None or not os.path.exists(path):
+            return series
+        try:
+            with open(path, "rb") as f:
+                lines = f.read().splitlines()
+        except OSError as e:
+            logger.error(f"Could not load candle cache {path}: {e}")
+            return series
+        covered: List[Range] = []
+        candles: List[dict] = []
+        for line in lines:
+            try:
+                record = orjson.loads(line)
+            except orjson.JSONDecodeError:
+                # A crash mid-append leaves a torn last line; the ranges before it are intact
+                logger.warning(f"Skipping unreadable line in candle cache {path}")
+                continue
+            covered.extend(tuple(r) for r in record.get("covered", []))
+            candles.extend(record.get("candles", []))
+        series = CandleSeries(covered, candles)
+        if len(lines) > COMPACT_AFTER_LINES:
+            self._compact(path, series)
+        return series
+
+    def _append(self, path: str, record: dict):
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "ab") as f:
+                f.write(orjson.dumps(record) + b"\n")
+            self.stats["saves"] += 1
+        except OSError as e:
+            logger.error(f"Could not save candle cache {path}: {e}")
+
+    def _compact(self, path: str, series: CandleSeries):
+        try:
+            tmp = f"{path}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(orjson.dumps(series.as_record()) + b"\n")
+            os.replace(tmp, path)
+            self.stats["compactions"] += 1
+        except OSError as e:
+            logger.error(f"Could not compact candle cache {path}: {e}")
+
+    async def _series(self, symbol: str, interval: str) -> CandleSeries:
+        key = (symbol, interval)
+        series = self.series.get(key)
+        if series is None:
+            loaded = await asyncio.to_thread(self._read, self._path(symbol, interval))
+            # Another request may have loaded it while this one read the file
+            series = self.series.setdefault(key, loaded)
+        return series
+
+    async def _fetch(self, symbol: str, interval: str, start: int, end: int) -> List[dict]:
+        info_client = await self.get_info_client()
+        if info_client is None:
+            raise RuntimeError("Info client not initialized")
+        self.stats["upstream_calls"] += 1
+        try:
+            raw = await self.upstream.run(info_client.candles_snapshot, symbol, interval, start, end - 1,
+                                          weight=candle_weight((end - start) // INTERVAL_MS[interval]),
+                                          priority=Priority.MARKET_DATA)
+        except Exception:
+            self.stats["upstream_errors"] += 1
+            raise
+        candles = [parse_candle(c) for c in raw or []]
+        self.stats["candles_fetched"] += len(candles)
+        return candles
+
+    async def get(self, symbol: str, interval: str, start: int, end: int) -> dict:
+        """Candles com abertura em [start, end); busca upstream só o que falta no cache"""
+        if interval not in INTERVAL_MS:
+            raise ValueError(f"interval must be one of {', '.join(INTERVAL_MS)}")
+        step = INTERVAL_MS[interval]
+        start -= start % step
+        end = min(end, int(time.time() * 1000) + step)
+        if end <= start:
+            raise ValueError("end must be after start")
+        self.stats["requests"] += 1
+        series = await self._series(symbol, interval)
+        open_bucket = int(time.time() * 1000) // step * step  # candle still forming
+        # The last closed candle may not be published upstream yet: it stays in the refetched tail
+        settled = open_bucket - step
+        closed_end = min(-(-end // step) * step, settled)
+        wants_live = end > settled
+        tail = (max(start, settled), open_bucket + step)
+
+        def live_due() -> bool:
+            return wants_live and time.monotonic() - series.live_fetched_at >= self.live_ttl
+
+        fetched: List[Range] = []
+        settled_candles: List[dict] = []
+        if missing_ranges(series.covered, start, closed_end) or live_due():
+            waited = series.lock.locked()
+            async with series.lock:
+                # Whatever a concurrent request already filled is not fetched again
+                gaps = missing_ranges(series.covered, start, closed_end)
+                if waited and not gaps and not live_due():
+                    self.stats["waited"] += 1
+                try:
+                    for gap_start, gap_end in gaps:
+                        chunk = MAX_CANDLES_PER_CALL * step
+                        for piece_start in range(gap_start, gap_end, chunk):
+                            piece = (piece_start, min(piece_start + chunk, gap_end))
+                            candles = await self._fetch(symbol, interval, *piece)
+                            series.add(candles, covered=piece)
+                            fetched.append(piece)
+                            settled_candles.extend(candles)
+                    if live_due():
+                        series.add(await self._fetch(symbol, interval, *tail))
+                        series.live_fetched_at = time.monotonic()
+                        fetched.append(tail)
+                finally:
+                    # Only settled pieces are persisted, appended; keep the ones fetched before a failure
+                    path = self._path(symbol, interval)
+                    pieces = [piece for piece in fetched if piece[1] <= settled]
+                    if path is not None and pieces:
+                        await asyncio.to_thread(self._append, path, {"covered": pieces, "candles": settled_candles})
+        if not fetched:
+            self.stats["local_hits"] += 1
+        candles = series.between(start, end)
+        return {
+            "symbol": symbol,
+            "interval": interval,
+            "start": start,
+            "end": end,
+            "count": len(candles),
+            "fetched_ranges": fetched,
+            "cached": not fetched,
+            "candles": candles,
+        }
+
+    def metrics(self) -> dict:
+        return {**self.stats, "series": len(self.series),
+                "candles_cached": sum(len(s.candles) for s in self.series.values())}
@@ -0,0 +1,148 @@
+"""
+Circuit breaker por classe de endpoint upstream (info, exchange, feed WebSocket).
+
+Fechado: chamadas passam e o resultado entra numa janela deslizante. Se a fração
+de falhas (erros de rede, 5xx/429, chamadas lentas) passar do limite, abre.
+Aberto: chamadas falham na hora com CircuitOpenError até o timeout vencer.
+Meio-aberto: uma chamada de prova passa; sucesso fecha, falha reabre com
+timeout dobrado (até open_max_seconds).
+"""
+import logging
+import time
+from collections import deque
+from threading import Lock
+from typing import Optional
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Upstream marcado como indisponível; não tentamos a chamada"""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"Upstream '{name}' circuit open, retry in {retry_after:.1f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+def is_upstream_failure(exc: BaseException) -> bool:
+    """Falhas que indicam upstream doente (e não um pedido inválido nosso)"""
+    status = getattr(exc, "status_code", None)
+    if isinstance(status, int):
+        return status >= 500 or status == 429
+    return isinstance(exc, (requests.exceptions.RequestException, ConnectionError, TimeoutError, OSError))
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_ratio: float = 0.5, min_calls: int = 5, window: int = 20,
+                 slow_call_seconds: float = 2.0, open_seconds: float = 5.0, open_max_seconds: float = 60.0):
+        self.name = name
+        self.failure_ratio = failure_ratio
+        self.min_calls = min_calls
+        self.slow_call_seconds = slow_call_seconds
+        self.open_seconds = open_seconds
+        self.open_max_seconds = open_max_seconds
+        self.state = CLOSED
+        self._lock = Lock()
+        self._outcomes: deque = deque(maxlen=window)  # True = bad (error or slow)
+        self._opened_at = 0.0
+        self._current_open = open_seconds
+        self._probe_in_flight = False
+        self.stats = {"calls": 0, "failures": 0, "slow_calls": 0, "rejected": 0, "opened": 0, "last_error": None}
+
+    def configure(self, failure_ratio: float, slow_call_seconds: float, open_seconds: float):
+        self.failure_ratio = failure_ratio
+        self.slow_call_seconds = slow_call_seconds
+        self.open_seconds = open_seconds
+
+    def retry_after(self) -> float:
+        """Segundos até a próxima prova (0 se chamadas são permitidas)"""
+        if self.state != OPEN:
+            return 0.0
+        return max(0.0, self._opened_at + self._current_open - time.monotonic())
+
+    def before_call(self):
+        """Levanta CircuitOpenError se a chamada não deve ir ao upstream"""
+        with self._lock:
+            if self.state == OPEN and self.retry_after() <= 0:
+                self.state = HALF_OPEN
+                self._probe_in_flight = False
+                logger.info(f"🟡 Circuit '{self.name}' half-open: probing upstream")
+            if self.state == HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return
+            if self.state == CLOSED:
+                return
+            self.stats["rejected"] += 1
+            raise CircuitOpenError(self.name, self.retry_after() or self._current_open)
+
+    def record_success(self, latency: float):
+        slow = latency >= self.slow_call_seconds
+        with self._lock:
+            self.stats["calls"] += 1
+            if slow:
+                self.stats["slow_calls"] += 1
+            if self.state == HALF_OPEN:
+                if slow:
+                    self._trip("slow probe")
+                else:
+                    self._close()
+                return
+            self._outcomes.append(slow)
+            self._evaluate()
+
+    def record_failure(self, exc: Optional[BaseException] = None):
+        with self._lock:
+            self.stats["calls"] += 1
+            self.stats["failures"] += 1
+            self.stats["last_error"] = f"{type(exc).__name__}: {exc}" if exc else None
+            if self.state == HALF_OPEN:
+                self._trip("probe failed")
+                return
+            self._outcomes.append(True)
+            self._evaluate()
+
+    def release_probe(self):
+        """A prova terminou sem dizer nada sobre o upstream (ex.: erro 4xx nosso)"""
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probe_in_flight = False
+
+    def _evaluate(self):
+        if self.state != CLOSED or len(self._outcomes) < self.min_calls:
+            return
+        bad = sum(self._outcomes)
+        if bad / len(self._outcomes) >= self.failure_ratio:
+            self._current_open = self.open_seconds
+            self._trip(f"{bad}/{len(self._outcomes)} recent calls failed or were slow")
+
+    def _trip(self, reason: str):
+        if self.state == HALF_OPEN:
+            self._current_open = min(self._current_open * 2, self.open_max_seconds)
+        self.state = OPEN
+        self._opened_at = time.monotonic()
+        self._probe_in_flight = False
+        self.stats["opened"] += 1
+        logger.warning(f"🔴 Circuit '{self.name}' OPEN for {self._current_open:.1f}s ({reason})")
+
+    def _close(self):
+        self.state = CLOSED
+        self._outcomes.clear()
+        self._current_open = self.open_seconds
+        self._probe_in_flight = False
+        logger.info(f"🟢 Circuit '{self.name}' closed: upstream recovered")
+
+    def metrics(self) -> dict:
+        return {
+            "state": self.state,
+            "retry_after_s": round(self.retry_after(), 2),
+            "window_bad": sum(self._outcomes),
+            "window_size": len(self._outcomes),
+            **self.stats,
+        }
@@ -0,0 +1,37 @@
+"""
+Deduplicação de eventos repetidos pelos feeds (fills por tid, fundings por tempo/ativo).
+
+Um set responde "já vi?" em O(1) e uma deque limitada lembra a ordem de chegada,
+para esquecer as chaves mais antigas: memória constante num processo de vida longa.
+"""
+from collections import deque
+from typing import Deque, Hashable, Set
+
+
+class RecentKeys:
+    """Últimas `capacity` chaves vistas"""
+
+    def __init__(self, capacity: int):
+        self.capacity = max(int(capacity), 1)
+        self._keys: Set[Hashable] = set()
+        self._order: Deque[Hashable] = deque()
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._keys
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def seen(self, key: Hashable) -> bool:
+        """True se a chave já foi vista; senão a registra (esquecendo a mais antiga além da capacidade)"""
+        if key in self._keys:
+            return True
+        self._keys.add(key)
+        self._order.append(key)
+        if len(self._order) > self.capacity:
+            self._keys.discard(self._order.popleft())
+        return False
+
+    def clear(self):
+        self._keys.clear()
+        self._order.clear()
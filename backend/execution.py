@@ -0,0 +1,305 @@
+"""
+Agendador de execução: ordens-mãe grandes quebradas em ordens filhas.
+
+Estratégias:
+- twap: `slices` fatias IOC iguais ao longo de `duration_seconds`; o que não
+  executar numa fatia é somado à próxima
+- iceberg: só `display_size` fica visível no livro (GTC em `limit_price`);
+  quando a fatia sai do livro, a próxima é colocada
+- pov: participa de `participation_rate` do volume negociado no mercado desde
+  o início (trades do feed WebSocket), em fatias IOC
+
+Cada mãe é uma task asyncio que passa a maior parte do tempo dormindo, então
+milhares de mães concorrentes custam pouco; as filhas passam pelo mesmo caminho
+de ordem (risco pré-trade, agendador upstream com prioridade de ordem).
+"""
+import asyncio
+import itertools
+import logging
+import time
+from collections import deque
+from datetime import datetime
+from typing import Awaitable, Callable, Deque, Dict, List, Optional
+
+from risk import RiskRejected
+
+logger = logging.getLogger(__name__)
+
+STRATEGIES = ("twap", "iceberg", "pov")
+# Parameters each strategy reads (everything else is dropped from the parent)
+STRATEGY_PARAMS = {
+    "twap": ("duration_seconds", "slices", "reduce_only"),
+    "iceberg": ("display_size", "limit_price", "poll_seconds", "reduce_only"),
+    "pov": ("participation_rate", "interval_seconds", "max_duration_seconds", "reduce_only"),
+}
+# Parameters without a sensible default
+REQUIRED_PARAMS = {"iceberg": ("display_size", "limit_price")}
+ACTIVE = ("pending", "running")
+# A parent fails after this many child errors in a row (instead of resending forever)
+MAX_CONSECUTIVE_CHILD_ERRORS = 5
+# A POV parent fails when the market volume it follows hasn't moved for this many intervals
+POV_STALL_INTERVALS = 150
+
+# (symbol, is_buy, size, limit_price or None for IOC at market, reduce_only) -> child result
+SubmitChild = Callable[[str, bool, float, Optional[float], bool], Awaitable[dict]]
+# (symbol, oid) -> {"status": "open" | "filled" | "canceled" | ..., "filled": size, "avg_price": price or None}
+ChildStatus = Callable[[str, int], Awaitable[dict]]
+CancelChild = Callable[[str, int], Awaitable[None]]
+
+
+class ParentOrder:
+    def __init__(self, parent_id: str, symbol: str, is_buy: bool, size: float, strategy: str, params: dict):
+        self.id = parent_id
+        self.symbol = symbol
+        self.is_buy = is_buy
+        self.size = size
+        self.strategy = strategy
+        self.params = params
+        self.status = "pending"
+        self.filled = 0.0
+        self.notional = 0.0
+        self.children: Deque[dict] = deque(maxlen=50)
+        self.children_sent = 0
+        self.error: Optional[str] = None
+        self.created_at = datetime.now().isoformat()
+        self.finished_at: Optional[str] = None
+        self.task: Optional[asyncio.Task] = None
+        self.resting_oid: Optional[int] = None  # iceberg clip currently on the book
+        self.consecutive_errors = 0
+        self.min_size = 0.0  # smallest child the venue takes, fixed at start
+
+    def unfinished(self) -> bool:
+        """Ainda falta pelo menos meia fatia mínima"""
+        return self.remaining > 0 and self.remaining >= self.min_size / 2
+
+    @property
+    def remaining(self) -> float:
+        return max(self.size - self.filled, 0.0)
+
+    def record(self, child: dict):
+        self.children_sent += 1
+        filled = child.get("filled") or 0.0
+        if filled > 0 and child.get("avg_price"):
+            self.filled += filled
+            self.notional += filled * child["avg_price"]
+        self.children.append({**child, "at": datetime.now().isoformat()})
+
+    def progress(self) -> dict:
+        return {
+            "id": self.id,
+            "symbol": self.symbol,
+            "side": "buy" if self.is_buy else "sell",
+            "strategy": self.strategy,
+            "params": self.params,
+            "status": self.status,
+            "size": self.size,
+            "filled": self.filled,
+            "remaining": self.remaining,
+            "progress": self.filled / self.size if self.size else 0.0,
+            "avg_price": self.notional / self.filled if self.filled else None,
+            "children_sent": self.children_sent,
+            "recent_children": list(self.children)[-10:],
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class ExecutionScheduler:
+    def __init__(self, submit_child: SubmitChild, child_status: ChildStatus, cancel_child: CancelChild,
+                 market_volume: Callable[[str], float], min_size: Callable[[str], float],
+                 on_update: Optional[Callable[[ParentOrder], None]] = None, history: int = 1000,
+                 volume_available: Optional[Callable[[], bool]] = None):
+        self.submit_child = submit_child
+        self.child_status = child_status
+        self.cancel_child = cancel_child
+        self.market_volume = market_volume  # cumulative traded size per symbol
+        self.volume_available = volume_available  # False while nothing feeds market_volume (trades feed off)
+        self.min_size = min_size  # smallest child worth sending (min notional / price, size decimals)
+        self.on_update = on_update
+        self.parents: Dict[str, ParentOrder] = {}
+        self._finished: Deque[str] = deque()
+        self._history = history
+        self._ids = itertools.count(1)
+        self.stats = {"parents": 0, "completed": 0, "canceled": 0, "failed": 0, "children": 0, "child_errors": 0}
+
+    def start(self, symbol: str, is_buy: bool, size: float, strategy: str, params: dict) -> ParentOrder:
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown strategy '{strategy}' (use {', '.join(STRATEGIES)})")
+        if size <= 0:
+            raise ValueError("Parent size must be positive")
+        params = {key: value for key, value in params.items() if key in STRATEGY_PARAMS[strategy]}
+        missing = [key for key in REQUIRED_PARAMS.get(strategy, ()) if not params.get(key)]
+        if missing:
+            raise ValueError(f"{strategy} executions need {' and '.join(missing)}")
+        for key, value in params.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool) and value <= 0:
+                raise ValueError(f"{key} must be positive")
+        if strategy == "pov" and self.volume_available is not None and not self.volume_available():
+            raise ValueError("pov executions follow the trades feed, which is not running")
+        min_size = self.min_size(symbol)
+        if not min_size or min_size <= 0:
+            raise ValueError(f"No minimum order size known for {symbol} yet (no price)")
+        parent = ParentOrder(f"exec-{next(self._ids)}", symbol, is_buy, size, strategy, params)
+        parent.min_size = min_size
+        self.parents[parent.id] = parent
+        self.stats["parents"] += 1
+        run = {"twap": self._twap, "iceberg": self._iceberg, "pov": self._pov}[strategy]
+        parent.task = asyncio.create_task(self._run(parent, run))
+        return parent
+
+    def get(self, parent_id: str) -> Optional[ParentOrder]:
+        return self.parents.get(parent_id)
+
+    def list(self, status: Optional[str] = None) -> List[ParentOrder]:
+        return [p for p in self.parents.values() if status is None or p.status == status]
+
+    async def cancel(self, parent_id: str) -> Optional[ParentOrder]:
+        parent = self.parents.get(parent_id)
+        if parent is None or parent.status not in ACTIVE:
+            return parent
+        parent.task.cancel()
+        try:
+            await parent.task
+        except asyncio.CancelledError:
+            pass
+        return parent
+
+    async def _run(self, parent: ParentOrder, strategy: Callable[[ParentOrder], Awaitable[None]]):
+        parent.status = "running"
+        self._notify(parent)
+        try:
+            await strategy(parent)
+            parent.status = "partial" if parent.unfinished() else "completed"
+            self.stats["completed"] += 1
+        except asyncio.CancelledError:
+            parent.status = "canceled"
+            self.stats["canceled"] += 1
+            if parent.resting_oid is not None:
+                try:
+                    await self.cancel_child(parent.symbol, parent.resting_oid)
+                except Exception as e:
+                    logger.warning(f"Could not cancel resting child {parent.resting_oid} of {parent.id}: {e}")
+                await self._settle_resting(parent)
+        except Exception as e:
+            parent.status = "failed"
+            parent.error = f"{type(e).__name__}: {e}"
+            self.stats["failed"] += 1
+            logger.error(f"❌ Execution {parent.id} failed: {parent.error}")
+        finally:
+            parent.finished_at = datetime.now().isoformat()
+            self._notify(parent)
+            self._retire(parent)
+
+    def _retire(self, parent: ParentOrder):
+        """Mantém só as últimas `history` mães terminadas"""
+        self._finished.append(parent.id)
+        while len(self._finished) > self._history:
+            self.parents.pop(self._finished.popleft(), None)
+
+    def _notify(self, parent: ParentOrder):
+        if self.on_update is not None:
+            self.on_update(parent)
+
+    async def _send(self, parent: ParentOrder, size: float, limit_price: Optional[float] = None) -> dict:
+        self.stats["children"] += 1
+        try:
+            child = await self.submit_child(parent.symbol, parent.is_buy, size, limit_price,
+                                            parent.params.get("reduce_only", False))
+        except RiskRejected as e:
+            # A risk rejection stops the parent: later slices would hit the same limit
+            raise RuntimeError(f"child rejected by pre-trade risk: {e}") from e
+        except Exception as e:
+            child = {"status": "error", "error": f"{type(e).__name__}: {e}", "filled": 0.0}
+        parent.record({"size": size, **child})
+        self._notify(parent)
+        if child.get("status") == "error":
+            self.stats["child_errors"] += 1
+            parent.consecutive_errors += 1
+            if parent.consecutive_errors >= MAX_CONSECUTIVE_CHILD_ERRORS:
+                raise RuntimeError(f"{parent.consecutive_errors} child orders failed in a row, "
+                                   f"last: {child.get('error')}")
+        else:
+            parent.consecutive_errors = 0
+        return child
+
+    async def _twap(self, parent: ParentOrder):
+        duration = float(parent.params.get("duration_seconds", 60.0))
+        slices = max(int(parent.params.get("slices", 10)), 1)
+        interval = duration / slices
+        for i in range(slices):
+            if not parent.unfinished():
+                return
+            # Spread what's left over the slices left (unfilled IOC size rolls forward)
+            size = max(parent.remaining / (slices - i), parent.min_size)
+            await self._send(parent, min(size, parent.remaining))
+            if i < slices - 1:
+                await asyncio.sleep(interval)
+
+    async def _iceberg(self, parent: ParentOrder):
+        display = float(parent.params["display_size"])
+        limit_price = float(parent.params["limit_price"])
+        poll = float(parent.params.get("poll_seconds", 1.0))
+        while parent.unfinished():
+            clip = min(max(display, parent.min_size), parent.remaining)
+            child = await self._send(parent, clip, limit_price)
+            if child.get("status") == "skipped":
+                return  # nothing left the venue would take (size rounds to zero)
+            if child.get("status") == "error":
+                await asyncio.sleep(poll)
+                continue
+            if child.get("status") != "resting":
+                continue  # crossed and filled immediately
+            parent.resting_oid = child["oid"]
+            while True:
+                await asyncio.sleep(poll)
+                state = await self.child_status(parent.symbol, parent.resting_oid)
+                if state.get("status") != "open":
+                    break
+            await self._settle_resting(parent, state)
+
+    async def _settle_resting(self, parent: ParentOrder, state: Optional[dict] = None):
+        """Contabiliza o que a fatia em repouso executou antes de sair do livro"""
+        oid = parent.resting_oid
+        if oid is None:
+            return
+        parent.resting_oid = None
+        if state is None:
+            try:
+                state = await self.child_status(parent.symbol, oid)
+            except Exception:
+                return
+        filled = state.get("filled") or 0.0
+        avg_price = state.get("avg_price")
+        if filled > 0:
+            parent.filled += filled
+            # Fill price unknown (fills not seen anywhere yet): the limit is the worst case for a resting order
+            parent.notional += filled * (avg_price or float(parent.params["limit_price"]))
+        parent.children.append({"oid": oid, "status": state.get("status"), "filled": filled, "avg_price": avg_price,
+                                "avg_price_estimated": filled > 0 and not avg_price,
+                                "at": datetime.now().isoformat()})
+        self._notify(parent)
+
+    async def _pov(self, parent: ParentOrder):
+        rate = float(parent.params.get("participation_rate", 0.1))
+        interval = float(parent.params.get("interval_seconds", 2.0))
+        deadline = time.monotonic() + float(parent.params.get("max_duration_seconds", 3600.0))
+        start_volume = last_volume = self.market_volume(parent.symbol)
+        idle = 0
+        while parent.unfinished():
+            if time.monotonic() > deadline:
+                return
+            await asyncio.sleep(interval)
+            volume = self.market_volume(parent.symbol)
+            idle = idle + 1 if volume == last_volume else 0
+            last_volume = volume
+            if idle >= POV_STALL_INTERVALS:
+                raise RuntimeError(f"no market volume for {parent.symbol} in {idle * interval:g}s "
+                                   f"(is the trades feed running?)")
+            target = rate * (volume - start_volume) - parent.filled
+            if target >= parent.min_size:
+                await self._send(parent, min(target, parent.remaining))
+
+    def metrics(self) -> dict:
+        active = sum(1 for p in self.parents.values() if p.status in ACTIVE)
+        return {**self.stats, "active": active, "tracked": len(self.parents)}
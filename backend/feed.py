@@ -0,0 +1,264 @@
+"""
+Feed WebSocket supervisionado da Hyperliquid.
+
+- Heartbeat: {"method": "ping"} a cada `heartbeat_interval`, com ou sem tráfego
+  (um feed que para logo depois de uma rajada é notado igual). Cada ping tem seu
+  prazo de pong, estimado do RTT medido dos pings (como o RTO do TCP: média
+  suavizada + 4 x variação), nunca abaixo de `heartbeat_timeout` nem acima de
+  MAX_PONG_DEADLINE; ping sem pong no prazo -> conexão morta (DeadConnection).
+  Links lentos ganham prazo maior sozinhos, links rápidos são vigiados em fração de segundo.
+- Falhas são tratadas por tipo de exceção; reconexões passam pelo circuit breaker do feed.
+- Ao (re)conectar: reinscreve tudo de uma vez e dispara o resync (snapshot REST),
+  para que o cache não fique velho até o próximo trade.
+- Métricas: tempo de detecção, de reconexão e de recuperação (queda -> resync completo).
+"""
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable, List, Optional
+
+import websockets
+from websockets.exceptions import InvalidURI, WebSocketException
+
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+
+logger = logging.getLogger(__name__)
+
+# Pong deadline before the first round trip is measured, and its ceiling afterwards
+INITIAL_PONG_DEADLINE = 1.0
+MAX_PONG_DEADLINE = 5.0
+
+
+class DeadConnection(Exception):
+    """Conexão aberta mas muda: heartbeat sem resposta"""
+
+
+def _summary(values: deque) -> dict:
+    if not values:
+        return {"last": None, "max": None, "mean": None}
+    return {
+        "last": round(values[-1], 3),
+        "max": round(max(values), 3),
+        "mean": round(sum(values) / len(values), 3),
+    }
+
+
+class PriceFeed:
+    """Supervisiona uma conexão WebSocket; deve ser iniciado de dentro do event loop principal"""
+
+    def __init__(self, url: str, subscriptions: List[dict],
+                 on_message: Callable[[dict], Awaitable[None]],
+                 on_resync: Callable[[], Awaitable[None]],
+                 breaker: CircuitBreaker,
+                 heartbeat_interval: float = 0.25, heartbeat_timeout: float = 0.5,
+                 reconnect_delay: float = 0.25, name: str = "prices"):
+        self.name = name
+        self.url = url
+        self.subscriptions = subscriptions
+        self.on_message = on_message
+        self.on_resync = on_resync
+        self.breaker = breaker
+        self.heartbeat_interval = heartbeat_interval
+        self.heartbeat_timeout = heartbeat_timeout
+        self.reconnect_delay = reconnect_delay
+        self._task: Optional[asyncio.Task] = None
+        self._delivered = False  # current session received market data
+        self.connected = False
+        self.last_message_at: Optional[float] = None
+        self._down_at: Optional[float] = None
+        self.stats = {
+            "connects": 0, "disconnects": 0, "dead_connections": 0, "messages": 0,
+            "pings": 0, "resyncs": 0, "resync_errors": 0, "session_errors": 0, "last_disconnect_reason": None,
+        }
+        self._detect = deque(maxlen=100)     # last message -> failure detected
+        self._reconnect = deque(maxlen=100)  # failure -> connected and subscribed
+        self._recover = deque(maxlen=100)    # failure -> resync snapshot applied
+        self._ping_rtt = deque(maxlen=100)
+        self._pings: deque = deque()  # send times of the pings still waiting for a pong (pongs come in order)
+        self._srtt: Optional[float] = None
+        self._rttvar = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def configure(self, heartbeat_interval: float, heartbeat_timeout: float):
+        self.heartbeat_interval = heartbeat_interval
+        self.heartbeat_timeout = heartbeat_timeout
+
+    def start(self):
+        if self.running:
+            return
+        self._task = asyncio.get_running_loop().create_task(self._supervise())
+        logger.info(f"🚀 WebSocket feed '{self.name}' started")
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self.connected = False
+        logger.info(f"🛑 WebSocket feed '{self.name}' stopped")
+
+    async def _supervise(self):
+        while True:
+            # Repeated failures open the circuit: wait it out instead of hammering the upstream
+            wait = self.breaker.retry_after()
+            if wait > 0:
+                logger.info(f"⏸️ WebSocket '{self.name}' circuit open, next attempt in {wait:.1f}s")
+                await asyncio.sleep(wait)
+                continue
+            try:
+                self.breaker.before_call()
+                await self._session()
+            except CircuitOpenError:
+                continue
+            except InvalidURI:
+                logger.error("Invalid WebSocket URI. Cannot reconnect.")
+                return
+            except (DeadConnection, WebSocketException,
+                    OSError, asyncio.TimeoutError) as e:
+                # A session that delivered data and later dropped doesn't count against the upstream
+                if not self._delivered:
+                    self.breaker.record_failure(e)
+                self._mark_down(e)
+            except Exception as e:
+                # Anything unexpected (a bug in a handler, a malformed frame...) must not end the supervisor
+                logger.exception(f"❌ WebSocket feed '{self.name}' session crashed: {type(e).__name__}: {e}")
+                self.stats["session_errors"] += 1
+                if not self._delivered:
+                    self.breaker.record_failure(e)
+                self._mark_down(e)
+            await asyncio.sleep(self.reconnect_delay)
+
+    def _mark_down(self, reason: BaseException):
+        now = time.monotonic()
+        if self.connected:
+            self.stats["disconnects"] += 1
+            if self.last_message_at is not None:
+                self._detect.append(now - self.last_message_at)
+        if isinstance(reason, DeadConnection):
+            self.stats["dead_connections"] += 1
+        self.connected = False
+        self.stats["last_disconnect_reason"] = f"{type(reason).__name__}: {reason}"
+        if self._down_at is None:
+            self._down_at = now
+        logger.warning(f"⚠️ WebSocket feed '{self.name}' down ({self.stats['last_disconnect_reason']}), reconnecting...")
+
+    async def _session(self):
+        connect_start = time.monotonic()
+        self._delivered = False
+        async with websockets.connect(self.url, ping_interval=None,
+                                      open_timeout=max(self.heartbeat_timeout * 5, 2.0)) as ws:
+            # Resubscribe everything at once, no pacing
+            for subscription in self.subscriptions:
+                await ws.send(json.dumps({"method": "subscribe", "subscription": subscription}))
+            self.breaker.record_success(time.monotonic() - connect_start)
+            self.connected = True
+            self.stats["connects"] += 1
+            self.last_message_at = time.monotonic()
+            down_at, self._down_at = self._down_at, None
+            if down_at is not None:
+                self._reconnect.append(time.monotonic() - down_at)
+            logger.info(f"✅ WebSocket '{self.name}' connected to {self.url} ({len(self.subscriptions)} subscriptions)")
+            resync = asyncio.create_task(self._resync(down_at))
+            tasks = {asyncio.create_task(self._read_loop(ws)), asyncio.create_task(self._heartbeat(ws))}
+            try:
+                done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                resync.cancel()
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+            for task in done:
+                task.result()  # DeadConnection, ConnectionClosed...
+
+    async def _resync(self, down_at: Optional[float]):
+        """Snapshot REST em paralelo com o stream, para não esperar o próximo trade"""
+        try:
+            await self.on_resync()
+        except Exception as e:
+            self.stats["resync_errors"] += 1
+            logger.error(f"WebSocket '{self.name}' resync failed: {type(e).__name__}: {e}")
+            return
+        self.stats["resyncs"] += 1
+        if down_at is not None:
+            self._recover.append(time.monotonic() - down_at)
+            logger.info(f"🔁 Feed '{self.name}' recovered in {self._recover[-1]:.3f}s")
+
+    def pong_deadline(self) -> float:
+        """Prazo de resposta de um ping, pelo RTT medido (srtt + 4 x rttvar)"""
+        estimate = INITIAL_PONG_DEADLINE if self._srtt is None else self._srtt + 4 * self._rttvar
+        return min(max(estimate, self.heartbeat_timeout), MAX_PONG_DEADLINE)
+
+    def _pong(self, received_at: float):
+        if not self._pings:
+            return
+        rtt = received_at - self._pings.popleft()
+        self._ping_rtt.append(rtt)
+        if self._srtt is None:
+            self._srtt, self._rttvar = rtt, rtt / 2
+        else:
+            self._rttvar = 0.75 * self._rttvar + 0.25 * abs(self._srtt - rtt)
+            self._srtt = 0.875 * self._srtt + 0.125 * rtt
+
+    async def _heartbeat(self, ws):
+        """Ping em cadência fixa; levanta DeadConnection quando o ping mais antigo passa do prazo"""
+        self._pings.clear()
+        while True:
+            wake_at = time.monotonic() + self.heartbeat_interval
+            await asyncio.sleep(self.heartbeat_interval)
+            now = time.monotonic()
+            if now - wake_at > self.heartbeat_interval:
+                # Our own loop stalled: a pong may be sitting unread, give the reader a turn first
+                continue
+            if self._pings and now - self._pings[0] > self.pong_deadline():
+                raise DeadConnection(f"no pong within {self.pong_deadline():.2f}s")
+            self._pings.append(now)
+            self.stats["pings"] += 1
+            await ws.send(json.dumps({"method": "ping"}))
+
+    async def _read_loop(self, ws):
+        while True:
+            msg = await ws.recv()
+            self.last_message_at = time.monotonic()
+            if isinstance(msg, bytes):
+                msg = msg.decode("utf-8", errors="replace")
+            try:
+                data = json.loads(msg)
+            except json.JSONDecodeError:
+                continue  # "Websocket connection established." and friends
+            if not isinstance(data, dict):
+                continue
+            channel = data.get("channel")
+            if channel == "pong":
+                self._pong(self.last_message_at)
+                continue
+            if channel in ("subscriptionResponse", "error"):
+                if channel == "error":
+                    logger.warning(f"WebSocket upstream error: {data.get('data')}")
+                continue
+            self.stats["messages"] += 1
+            self._delivered = True
+            try:
+                await self.on_message(data)
+            except Exception as e:
+                logger.error(f"Error processing WebSocket message: {type(e).__name__}: {e}")
+
+    def metrics(self) -> dict:
+        age = time.monotonic() - self.last_message_at if self.last_message_at and self.connected else None
+        return {
+            "running": self.running,
+            "connected": self.connected,
+            "heartbeat_interval_s": self.heartbeat_interval,
+            "heartbeat_timeout_s": self.heartbeat_timeout,
+            "pong_deadline_s": round(self.pong_deadline(), 3),
+            "last_message_age_s": round(age, 3) if age is not None else None,
+            **self.stats,
+            "detect_s": _summary(self._detect),
+            "reconnect_s": _summary(self._reconnect),
+            "time_to_recover_s": _summary(self._recover),
+            "ping_rtt_s": _summary(self._ping_rtt),
+            "circuit": self.breaker.metrics(),
+        }
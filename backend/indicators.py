@@ -0,0 +1,133 @@
+"""
+Indicadores incrementais calculados sobre o feed de trades.
+
+Cada trade atualiza o estado do símbolo em O(1), sem guardar histórico:
+médias e somas com decaimento exponencial no tempo (peso exp(-dt/janela)),
+que funcionam com trades em intervalos irregulares.
+
+- ema_fast / ema_slow: médias móveis exponenciais do preço
+- vwap: soma(preço * tamanho) / soma(tamanho), ambos decaídos
+- realized_vol: raiz da soma decaída dos log-retornos ao quadrado (na janela e anualizada)
+- rsi: 100 - 100 / (1 + ganhos / perdas), ganhos e perdas decaídos
+- imbalance: (compra - venda) / (compra + venda) do volume agressor decaído
+
+O estado de todos os símbolos fica numa matriz NumPy pré-alocada (uma linha por
+símbolo, cresce dobrando); o snapshot de todos sai vetorizado da matriz.
+"""
+import math
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+SECONDS_PER_YEAR = 365 * 24 * 3600
+
+DEFAULT_WINDOWS = {
+    "ema_fast": 60.0,
+    "ema_slow": 300.0,
+    "vwap": 300.0,
+    "volatility": 300.0,
+    "rsi": 840.0,
+    "imbalance": 60.0,
+}
+
+# Column layout of the state matrix
+FIELDS = ("price", "time", "trades", "ema_fast", "ema_slow", "pv", "vol", "r2", "gain", "loss", "buy", "sell")
+(PRICE, TIME, TRADES, EMA_FAST, EMA_SLOW, PV, VOL, R2, GAIN, LOSS, BUY, SELL) = range(len(FIELDS))
+
+
+class IndicatorEngine:
+    def __init__(self, symbols: Iterable[str] = (), windows: Optional[Dict[str, float]] = None, capacity: int = 16):
+        self.windows = {**DEFAULT_WINDOWS, **(windows or {})}
+        self.state = np.zeros((capacity, len(FIELDS)))
+        self.rows: Dict[str, int] = {}
+        self.updates = 0
+        for symbol in symbols:
+            self._row(symbol)
+
+    def _row(self, symbol: str) -> int:
+        row = self.rows.get(symbol)
+        if row is None:
+            row = len(self.rows)
+            if row >= len(self.state):
+                self.state = np.vstack([self.state, np.zeros_like(self.state)])
+            self.rows[symbol] = row
+        return row
+
+    def on_trade(self, symbol: str, price: float, size: float, is_buy: Optional[bool], time_ms: float):
+        """Aplica um trade; O(1) por trade"""
+        if price <= 0:
+            return
+        row = self._row(symbol)
+        (last_price, last_time, trades, ema_fast, ema_slow, pv, vol, r2, gain, loss, buy, sell) = self.state[row].tolist()
+        w = self.windows
+        if trades == 0:
+            ema_fast = ema_slow = price
+        else:
+            dt = max(time_ms - last_time, 0.0) / 1000
+            ema_fast += (1 - math.exp(-dt / w["ema_fast"])) * (price - ema_fast)
+            ema_slow += (1 - math.exp(-dt / w["ema_slow"])) * (price - ema_slow)
+            decay_vwap = math.exp(-dt / w["vwap"])
+            pv *= decay_vwap
+            vol *= decay_vwap
+            r2 *= math.exp(-dt / w["volatility"])
+            decay_rsi = math.exp(-dt / w["rsi"])
+            gain *= decay_rsi
+            loss *= decay_rsi
+            decay_flow = math.exp(-dt / w["imbalance"])
+            buy *= decay_flow
+            sell *= decay_flow
+            change = price - last_price
+            if change > 0:
+                gain += change
+            elif change < 0:
+                loss -= change
+            r2 += math.log(price / last_price) ** 2
+        pv += price * size
+        vol += size
+        if is_buy is True:
+            buy += size
+        elif is_buy is False:
+            sell += size
+        self.state[row] = (price, max(time_ms, last_time), trades + 1, ema_fast, ema_slow, pv, vol, r2, gain, loss,
+                           buy, sell)
+        self.updates += 1
+
+    def snapshot(self, symbols: Optional[Iterable[str]] = None) -> List[dict]:
+        """Indicadores derivados do estado, vetorizados sobre as linhas pedidas"""
+        names = [s for s in (symbols if symbols is not None else self.rows) if s in self.rows]
+        if not names:
+            return []
+        s = self.state[[self.rows[name] for name in names]]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            vwap = np.where(s[:, VOL] > 0, s[:, PV] / s[:, VOL], np.nan)
+            moves = s[:, GAIN] + s[:, LOSS]
+            rsi = np.where(moves > 0, 100.0 * s[:, GAIN] / moves, np.nan)  # == 100 - 100 / (1 + gain / loss)
+            flow = s[:, BUY] + s[:, SELL]
+            imbalance = np.where(flow > 0, (s[:, BUY] - s[:, SELL]) / flow, np.nan)
+        realized = np.sqrt(s[:, R2])
+        annualized = np.sqrt(s[:, R2] * SECONDS_PER_YEAR / self.windows["volatility"])
+
+        def value(x: float) -> Optional[float]:
+            return None if math.isnan(x) else round(float(x), 8)
+
+        return [
+            {
+                "symbol": name,
+                "price": float(s[i, PRICE]),
+                "time": int(s[i, TIME]),
+                "trades": int(s[i, TRADES]),
+                "ema_fast": value(s[i, EMA_FAST]),
+                "ema_slow": value(s[i, EMA_SLOW]),
+                "vwap": value(vwap[i]),
+                "realized_vol": value(realized[i]),
+                "realized_vol_annualized": value(annualized[i]),
+                "rsi": value(rsi[i]),
+                "imbalance": value(imbalance[i]),
+            }
+            for i, name in enumerate(names)
+            if s[i, TRADES] > 0
+        ]
+
+    def metrics(self) -> dict:
+        return {"symbols": len(self.rows), "capacity": len(self.state), "updates": self.updates,
+                "windows_s": self.windows}
@@ -0,0 +1,276 @@
+"""
+Livro de execuções (fills) e PnL por ativo, mantido de forma incremental.
+
+Alimentado pelos canais de usuário do WebSocket:
+
+- userFills: cada execução atualiza posição, preço médio de entrada, PnL
+  realizado (closedPnl da exchange; calculado localmente se ausente), taxas e volume
+- userFundings: pagamentos de funding somados por ativo
+
+O PnL não realizado é recalculado a cada tick de preço só para o ativo do
+tick (O(1)), e os totais da conta são mantidos por diferença - nenhuma
+varredura dos fills nem dos ativos no caminho quente. O log diário de fills
+é gravado em lotes numa thread, fora do event loop.
+"""
+import asyncio
+import logging
+import os
+from collections import deque
+from datetime import datetime
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+import orjson
+
+from dedup import RecentKeys
+
+logger = logging.getLogger(__name__)
+
+
+def _float(value: Any) -> float:
+    try:
+        return float(value) if value is not None else 0.0
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class SymbolPnL:
+    __slots__ = ("symbol", "position", "avg_entry", "realized_pnl", "fees", "funding", "volume", "fills",
+                 "mark", "unrealized_pnl", "last_fill_time")
+
+    def __init__(self, symbol: str):
+        self.symbol = symbol
+        self.position = 0.0
+        self.avg_entry: Optional[float] = None
+        self.realized_pnl = 0.0
+        self.fees = 0.0
+        self.funding = 0.0
+        self.volume = 0.0
+        self.fills = 0
+        self.mark: Optional[float] = None
+        self.unrealized_pnl = 0.0
+        self.last_fill_time = 0
+
+    def revalue(self) -> float:
+        """Recalcula o não realizado na marcação atual; retorna a variação"""
+        old = self.unrealized_pnl
+        if self.mark is not None and self.avg_entry is not None and self.position:
+            self.unrealized_pnl = self.position * (self.mark - self.avg_entry)
+        else:
+            self.unrealized_pnl = 0.0
+        return self.unrealized_pnl - old
+
+    def as_dict(self) -> dict:
+        return {
+            "symbol": self.symbol,
+            "position": self.position,
+            "avg_entry": self.avg_entry,
+            "mark": self.mark,
+            "realized_pnl": self.realized_pnl,
+            "unrealized_pnl": self.unrealized_pnl,
+            "fees": self.fees,
+            "funding": self.funding,
+            "net_pnl": self.realized_pnl + self.unrealized_pnl - self.fees + self.funding,
+            "volume": self.volume,
+            "fills": self.fills,
+        }
+
+
+class FillsLedger:
+    def __init__(self, history: int = 1000, log_dir: Optional[str] = None,
+                 entry_hint: Optional[Callable[[str], Optional[float]]] = None,
+                 on_change: Optional[Callable[[str, str, dict], None]] = None):
+        self.symbols: Dict[str, SymbolPnL] = {}
+        self.recent: Deque[dict] = deque(maxlen=history)
+        self.log_dir = log_dir  # daily fills_YYYY-MM-DD.jsonl next to the order log
+        self.entry_hint = entry_hint  # entry price of a position opened before the first fill we saw
+        self.on_change = on_change  # called with (event, symbol, payload) for fills, funding and marks
+        self._seen_tids = RecentKeys(history * 5)
+        self._seen_fundings = RecentKeys(history * 5)  # (time, coin)
+        self._pending: List[dict] = []  # fills waiting for the log writer
+        self._flush_task: Optional[asyncio.Task] = None
+        self.totals = {"realized_pnl": 0.0, "unrealized_pnl": 0.0, "fees": 0.0, "funding": 0.0, "volume": 0.0}
+        self.stats = {"fills": 0, "duplicates": 0, "position_resyncs": 0, "fundings": 0, "marks": 0}
+
+    def reset(self):
+        """Troca de conta: descarta tudo"""
+        self.symbols.clear()
+        self.recent.clear()
+        self._seen_tids.clear()
+        self._seen_fundings.clear()
+        self.totals = dict.fromkeys(self.totals, 0.0)
+
+    def _symbol(self, symbol: str) -> SymbolPnL:
+        entry = self.symbols.get(symbol)
+        if entry is None:
+            entry = self.symbols[symbol] = SymbolPnL(symbol)
+        return entry
+
+    # --- WebSocket user channels ---
+
+    def apply_message(self, data: dict) -> bool:
+        """Aplica userFills/userFundings; False se a mensagem não é do livro"""
+        channel = data.get("channel")
+        payload = data.get("data")
+        if not isinstance(payload, dict):
+            return False
+        if channel == "userFills":
+            # Snapshots arrive newest first; apply in trade order
+            fills = sorted(payload.get("fills", []), key=lambda f: (f.get("time", 0), f.get("tid", 0)))
+            for fill in fills:
+                self.apply_fill(fill, payload.get("isSnapshot", False))
+            return True
+        if channel == "userFundings":
+            for funding in payload.get("fundings", []):
+                self.apply_funding(funding)
+            return True
+        return False
+
+    def apply_fill(self, fill: dict, is_snapshot: bool = False) -> Optional[dict]:
+        tid = fill.get("tid")
+        if tid is not None and self._seen_tids.seen(tid):
+            self.stats["duplicates"] += 1
+            return None
+        coin = fill.get("coin")
+        if not coin:
+            return None
+        entry = self._symbol(coin)
+        time_ms = fill.get("time") or 0
+        if is_snapshot and time_ms < entry.last_fill_time:
+            return None  # older than what the live stream already applied
+        px = _float(fill.get("px"))
+        sz = _float(fill.get("sz"))
+        fee = _float(fill.get("fee"))
+        signed = sz if fill.get("side") == "B" else -sz
+        start = fill.get("startPosition")
+        if start is not None and abs(_float(start) - entry.position) > 1e-9:
+            # Missed fills (or the position predates the ledger): trust the exchange's start position
+            if entry.fills:
+                self.stats["position_resyncs"] += 1
+            entry.position = _float(start)
+            if entry.position and entry.avg_entry is None:
+                entry.avg_entry = (self.entry_hint(coin) if self.entry_hint else None) or px
+        old = entry.position
+        new = old + signed
+        realized = 0.0
+        if old and (old > 0) != (signed > 0):
+            closed = min(abs(old), sz)
+            realized = closed * (px - (entry.avg_entry or px)) * (1 if old > 0 else -1)
+        if "closedPnl" in fill:
+            realized = _float(fill["closedPnl"])  # exchange figure is authoritative
+        if not old or (new and (new > 0) != (old > 0)):
+            entry.avg_entry = px if new else None  # opened or flipped
+        elif abs(new) > abs(old):
+            entry.avg_entry = (abs(old) * entry.avg_entry + sz * px) / abs(new)
+        elif not new:
+            entry.avg_entry = None
+        entry.position = 0.0 if abs(new) < 1e-12 else round(new, 10)  # drop float noise from size sums
+        entry.realized_pnl += realized
+        entry.fees += fee
+        entry.volume += sz * px
+        entry.fills += 1
+        entry.last_fill_time = max(entry.last_fill_time, time_ms)
+        if entry.mark is None:
+            entry.mark = px
+        self.totals["realized_pnl"] += realized
+        self.totals["fees"] += fee
+        self.totals["volume"] += sz * px
+        self.totals["unrealized_pnl"] += entry.revalue()
+        self.stats["fills"] += 1
+        record = {
+            "tid": tid, "oid": fill.get("oid"), "time": time_ms, "symbol": coin,
+            "side": "buy" if signed > 0 else "sell", "price": px, "size": sz, "fee": fee,
+            "realized_pnl": realized, "position_after": entry.position, "avg_entry_after": entry.avg_entry,
+            "snapshot": is_snapshot,
+        }
+        self.recent.append(record)
+        if not is_snapshot:
+            self._write(record)
+        self._notify("fill", coin, {"fill": record, "symbol": entry.as_dict(), "totals": self.summary()})
+        return record
+
+    def apply_funding(self, funding: dict):
+        coin = funding.get("coin")
+        key = (funding.get("time") or 0, coin)
+        if not coin or self._seen_fundings.seen(key):
+            return
+        amount = _float(funding.get("usdc"))
+        entry = self._symbol(coin)
+        entry.funding += amount
+        self.totals["funding"] += amount
+        self.stats["fundings"] += 1
+        self._notify("funding", coin, {"symbol": entry.as_dict(), "totals": self.summary()})
+
+    # --- price ticks ---
+
+    def mark(self, symbol: str, price: float) -> Optional[dict]:
+        """Novo preço do ativo: revaloriza só esse ativo e ajusta o total por diferença"""
+        entry = self.symbols.get(symbol)
+        if entry is None or price == entry.mark:
+            return None
+        entry.mark = price
+        if not entry.position:
+            return None
+        self.totals["unrealized_pnl"] += entry.revalue()
+        self.stats["marks"] += 1
+        payload = {"symbol": symbol, "mark": price, "position": entry.position,
+                   "unrealized_pnl": entry.unrealized_pnl, "total_unrealized_pnl": self.totals["unrealized_pnl"]}
+        self._notify("mark", symbol, payload)
+        return payload
+
+    # --- reads ---
+
+    def summary(self) -> dict:
+        totals = dict(self.totals)
+        totals["net_pnl"] = totals["realized_pnl"] + totals["unrealized_pnl"] - totals["fees"] + totals["funding"]
+        return totals
+
+    def snapshot(self, symbol: Optional[str] = None) -> dict:
+        symbols = [self.symbols[symbol]] if symbol else list(self.symbols.values())
+        return {"totals": self.summary(), "symbols": [s.as_dict() for s in symbols]}
+
+    def fills(self, symbol: Optional[str] = None, limit: int = 100) -> List[dict]:
+        records = [f for f in self.recent if symbol is None or f["symbol"] == symbol]
+        return records[-limit:][::-1]
+
+    def order_fills(self, oid: int) -> Tuple[float, Optional[float]]:
+        """Tamanho executado e preço médio de uma ordem, pelos fills recentes"""
+        size = notional = 0.0
+        for fill in self.recent:
+            if fill["oid"] == oid:
+                size += fill["size"]
+                notional += fill["size"] * fill["price"]
+        return size, (notional / size if size else None)
+
+    def metrics(self) -> dict:
+        return {**self.stats, "symbols": len(self.symbols), "open_positions": sum(1 for s in self.symbols.values() if s.position)}
+
+    def _notify(self, event: str, symbol: str, payload: dict):
+        if self.on_change is not None:
+            self.on_change(event, symbol, payload)
+
+    def _write(self, record: dict):
+        if not self.log_dir:
+            return
+        self._pending.append(record)
+        if self._flush_task is None or self._flush_task.done():
+            try:
+                self._flush_task = asyncio.get_running_loop().create_task(self._flush())
+            except RuntimeError:
+                self._append(self._take())  # no loop (tests, scripts): write now
+
+    def _take(self) -> List[dict]:
+        records, self._pending = self._pending, []
+        return records
+
+    async def _flush(self):
+        # Fills arriving while a batch is being written go in the next one
+        while self._pending:
+            await asyncio.to_thread(self._append, self._take())
+
+    def _append(self, records: List[dict]):
+        try:
+            path = os.path.join(self.log_dir, f"fills_{datetime.now().strftime('%Y-%m-%d')}.jsonl")
+            with open(path, "ab") as f:
+                f.write(b"".join(orjson.dumps(record) + b"\n" for record in records))
+        except OSError as e:
+            logger.error(f"Error writing fills ledger: {e}")
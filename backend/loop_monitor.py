@@ -0,0 +1,142 @@
+"""
+Monitor de atraso do event loop.
+
+Uma task dorme `interval` e mede quanto acordou atrasada: esse atraso é o
+tempo em que o loop ficou preso em código síncrono (chamadas bloqueantes,
+I/O de arquivo, JSON grande, CPU). Os atrasos vão para um histograma
+cumulativo e uma janela recente (p50/p99/max).
+
+Uma thread watchdog acompanha o último tique da task; se o loop passar de
+`threshold` sem tique, captura a pilha da thread do loop naquele momento -
+isto é, o código que está bloqueando - e registra no log. Quando o loop
+volta, o tempo total do travamento é anotado no mesmo registro.
+"""
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from datetime import datetime
+from typing import Deque, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the lag histogram buckets, in milliseconds (last bucket is +Inf)
+LAG_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+class LoopLagMonitor:
+    def __init__(self, interval: float = 0.1, threshold: float = 0.1, window: int = 600, stalls: int = 50):
+        self.configure(interval, threshold)
+        self.buckets: List[int] = [0] * (len(LAG_BUCKETS_MS) + 1)
+        self.recent: Deque[float] = deque(maxlen=window)  # lag samples in ms
+        self.stalls: Deque[dict] = deque(maxlen=stalls)
+        self.samples = 0
+        self.stall_count = 0
+        self.lag_sum_ms = 0.0
+        self.max_lag_ms = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._loop_thread: Optional[int] = None
+        self._beat = time.monotonic()
+        self._open_stall: Optional[dict] = None
+
+    def configure(self, interval: float, threshold: float):
+        self.interval = max(interval, 0.001)
+        self.threshold = max(threshold, 0.001)
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        """Inicia no event loop atual (chamar de dentro do loop)"""
+        if self.running:
+            return
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._tick())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+
+    async def _tick(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self._beat = time.monotonic()
+            self.record(max(loop.time() - expected, 0.0) * 1000)
+
+    def record(self, lag_ms: float):
+        index = next((i for i, bound in enumerate(LAG_BUCKETS_MS) if lag_ms <= bound), len(LAG_BUCKETS_MS))
+        self.buckets[index] += 1
+        self.recent.append(lag_ms)
+        self.samples += 1
+        self.lag_sum_ms += lag_ms
+        self.max_lag_ms = max(self.max_lag_ms, lag_ms)
+        stall = self._open_stall
+        if stall is not None:
+            # The loop is back: the watchdog's capture gets the full duration
+            self._open_stall = None
+            stall["lag_ms"] = round(lag_ms, 1)
+            logger.warning(f"🐢 Event loop blocked for {lag_ms:.0f}ms in {stall['where']}")
+
+    def _watch(self):
+        """Thread watchdog: pilha da thread do loop quando ela passa do limite sem tique"""
+        while not self._stop.wait(min(self.threshold / 2, self.interval)):
+            overdue = time.monotonic() - self._beat - self.interval
+            if overdue < self.threshold or self._open_stall is not None:
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            stack = traceback.format_stack(frame)
+            last = traceback.extract_stack(frame)[-1]
+            stall = {
+                "at": datetime.now().isoformat(),
+                "where": f"{last.filename}:{last.lineno} {last.name}",
+                "detected_after_ms": round(overdue * 1000, 1),
+                "lag_ms": None,  # filled in when the loop ticks again
+                "stack": stack,
+            }
+            self._open_stall = stall
+            self.stalls.append(stall)
+            self.stall_count += 1
+            logger.warning(f"🐢 Event loop blocked for {overdue * 1000:.0f}ms+, running:\n{''.join(stack[-8:])}")
+
+    def metrics(self) -> dict:
+        lags = sorted(self.recent)
+
+        def pct(p: float) -> Optional[float]:
+            return round(lags[min(int(len(lags) * p), len(lags) - 1)], 2) if lags else None
+
+        cumulative = 0
+        histogram = {}
+        for bound, count in zip([*LAG_BUCKETS_MS, "+Inf"], self.buckets):
+            cumulative += count
+            histogram[f"le_{bound}ms" if bound != "+Inf" else "le_inf"] = cumulative
+        return {
+            "running": self.running,
+            "interval_ms": self.interval * 1000,
+            "threshold_ms": self.threshold * 1000,
+            "samples": self.samples,
+            "lag_ms": {
+                "p50": pct(0.5),
+                "p99": pct(0.99),
+                "max_window": round(lags[-1], 2) if lags else None,
+                "max": round(self.max_lag_ms, 2),
+                "mean": round(self.lag_sum_ms / self.samples, 3) if self.samples else None,
+            },
+            "histogram": histogram,
+            "stalls": self.stall_count,
+            "last_stall": {k: v for k, v in self.stalls[-1].items() if k != "stack"} if self.stalls else None,
+        }
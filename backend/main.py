@@ -1,38 +1,56 @@
-from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from dotenv import load_dotenv
-from typing import Optional, Dict, Set
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from pydantic import BaseModel, Field, ValidationError
+from typing import Literal, Optional, Dict, List, Set, Union
 import os
-import eth_account
 import logging
+import math
+import time
 from datetime import datetime
-from hyperliquid.exchange import Exchange
-from hyperliquid.info import Info
-from hyperliquid.utils import constants
-import requests
 import asyncio
 import json
-import websockets
-from threading import Thread
-import traceback
+from threading import Lock
+from settings import Settings, runtime
+from market_data import MarketDataCache, MarketDataUnavailable, find_asset, parse_book
+from upstream import DEFAULT_INFO_WEIGHT, Priority, UpstreamScheduler, WeightedRateLimiter
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from feed import PriceFeed
+from broadcaster import PriceBroadcaster
+from price_store import PriceStore, etag_matches
+from account_state import AccountState, AccountUnavailable
+from risk import PreTradeRisk, RiskRejected
+from pricing import market_order_price, round_price
+from execution import ExecutionScheduler
+from ledger import FillsLedger
+from profiling import RequestProfiler, StackSampler, task_dump
+from loop_monitor import LoopLagMonitor
+from triggers import Trigger, TriggerEngine
+from indicators import IndicatorEngine
+from asset_contexts import AssetContextTable
+from candles import INTERVAL_MS, CandleHistory
+from scenarios import MAX_SCENARIOS, ScenarioError, maintenance_rate, margin_scenarios, merge_positions, shock_matrix
+import numpy as np
+import orjson
+
+# Logs live next to this file, whatever the working directory is
+LOG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs")
+os.makedirs(LOG_DIR, exist_ok=True)
+# State that survives restarts (price triggers)
+TRIGGERS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "triggers.json")
+CANDLE_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "candles")
 
 # Configurar logging
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
     handlers=[
-        logging.FileHandler('backend/logs/app.log', encoding='utf-8'),
+        logging.FileHandler(os.path.join(LOG_DIR, 'app.log'), encoding='utf-8'),
         logging.StreamHandler()
     ]
 )
 logger = logging.getLogger(__name__)
 
-# Criar pasta de logs se não existir
-os.makedirs('backend/logs', exist_ok=True)
-
-load_dotenv()
-
 app = FastAPI()
 
 # CORS configuration
@@ -48,61 +66,176 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
 
-# Load environment variables (strip whitespace)
-ACCOUNT_ADDRESS = os.getenv("ACCOUNT_ADDRESS", "").strip().strip('"\'')
-SECRET_KEY = os.getenv("SECRET_KEY", "").strip().strip('"\'')
-BASE_URL = constants.TESTNET_API_URL
+# On-demand diagnostics: per-route cProfile sessions and a process-wide stack sampler
+request_profiler = RequestProfiler()
+stack_sampler = StackSampler()
+app.add_middleware(request_profiler.middleware)
+# Measures how long synchronous code stalls the event loop and captures the blocking stack
+loop_monitor = LoopLagMonitor(runtime.loop_monitor_interval_ms / 1000, runtime.loop_lag_threshold_ms / 1000)
+
+# Upstream endpoints - point these at replay_server.py to run without the network
+BASE_URL = runtime.api_url
+WS_URL = runtime.ws_url
 
-# Initialize info client (can work without credentials for market data)
+# Clients are created lazily by the startup warmup (the SDK hits the network on construction)
 info_client = None
-try:
-    info_client = Info(base_url=BASE_URL, skip_ws=True)
-    logger.info("=" * 80)
-    logger.info("✅ Info client initialized successfully")
-    logger.info(f"   Base URL: {BASE_URL}")
-    logger.info("=" * 80)
-    print(f"Info client initialized successfully")
-except Exception as e:
-    logger.error("=" * 80)
-    logger.error("❌ Failed to initialize info client!")
-    logger.error(f"   Error: {e}")
-    logger.error("=" * 80)
-    print(f"Warning: Could not initialize info client: {e}")
-    import traceback
-    traceback.print_exc()
+info_client_lock = Lock()
 
 # Initialize wallet and exchange client (requires credentials)
 wallet = None
 exchange = None
 
+# Startup warmup progress, reported by /readyz
+warmup_state = {
+    "started_at": None,
+    "finished_at": None,
+    "info_client": False,
+    "meta": False,
+    "prices": False,
+    "exchange": False,
+    "errors": {},
+}
+warmup_task = None
+rest_poller_task = None
+# Event loop the app runs on (settings listeners may fire from worker threads)
+main_loop: Optional[asyncio.AbstractEventLoop] = None
+
 # WebSocket connections management
 active_websocket_connections: Set[WebSocket] = set()
+# Push fan-out shared by /ws/price and the SSE stream
+broadcaster = PriceBroadcaster()
 websocket_price_data: Dict[str, float] = {}  # Store latest prices per symbol
-websocket_running = False
-websocket_task = None
+# Cumulative traded size per symbol seen on the trades feed (participation-rate executions)
+traded_volume: Dict[str, float] = {}
 
-# Centralized price cache - stores all price data (REST + WebSocket)
-price_cache: Dict[str, Dict] = {
+# Centralized price cache - stores all price data (REST + WebSocket), versioned per write
+price_cache = PriceStore({
     "BTC": {"mid_price": None, "bid_price": None, "ask_price": None, "spread": None, "last_update": None, "source": None},
     "ETH": {"mid_price": None, "bid_price": None, "ask_price": None, "spread": None, "last_update": None, "source": None},
     "SOL": {"mid_price": None, "bid_price": None, "ask_price": None, "spread": None, "last_update": None, "source": None}
-}
+})
+# Upper bound for ?wait= on the long-poll variants of /api/cache/prices
+MAX_LONG_POLL_SECONDS = 60.0
+
+def make_breaker(name: str) -> CircuitBreaker:
+    return CircuitBreaker(name, failure_ratio=runtime.breaker_failure_ratio,
+                          slow_call_seconds=runtime.breaker_slow_call_seconds,
+                          open_seconds=runtime.breaker_open_seconds)
+
+
+# Every upstream REST call is scheduled against the weight budget (orders first)
+# and fails fast while its endpoint class' circuit is open
+upstream = UpstreamScheduler(
+    WeightedRateLimiter(runtime.upstream_weight_per_minute, runtime.upstream_order_reserve),
+    {"info": make_breaker("info"), "exchange": make_breaker("exchange")},
+)
+# Gates reconnect attempts of the WebSocket feed (see price_feed below)
+feed_breaker = make_breaker("ws")
+# Info()/Exchange() fetch spot_meta + meta on construction
+CLIENT_INIT_WEIGHT = 2 * DEFAULT_INFO_WEIGHT
+
+# Market data reads go through this layer: coalesced upstream fetches, stale-while-revalidate
+market_cache = MarketDataCache(price_cache, lambda: get_info_client(), upstream,
+                               on_update=lambda symbol, entry: publish_price(symbol))
+# Funding / mark / OI / 24h volume of the whole universe: bulk loads + activeAssetCtx stream
+asset_contexts = AssetContextTable(upstream, lambda: get_info_client())
+# Candle history for charts: on-disk cache, only missing ranges go upstream
+candle_history = CandleHistory(upstream, lambda: get_info_client(), CANDLE_CACHE_DIR)
+
+
+def publish_price(symbol: str, trade_time: Optional[int] = None):
+    """Publica o estado atual do cache do símbolo para os clientes push"""
+    entry = price_cache.get(symbol)
+    if not entry or not entry.get("mid_price"):
+        return
+    ledger.mark(symbol, entry["mid_price"])
+    trigger_engine.on_price(symbol, entry["mid_price"])
+    broadcaster.publish("price_update", {
+        "type": "price_update",
+        "symbol": symbol,
+        "price": entry["mid_price"],
+        "trade_time": trade_time,
+        "cache_data": entry,
+    }, symbol)
+
+
+# Account state (positions, margin, open orders) kept in memory from REST + user WebSocket channels
+account_broadcaster = PriceBroadcaster(history=100)
+
+
+def publish_account(reason: str, state: AccountState):
+    """Publica o snapshot da conta para os clientes do stream de conta"""
+    account_broadcaster.publish("account_update", {"type": "account_update", "reason": reason, **state.snapshot()})
+
+
+account_state = AccountState(upstream, lambda: get_info_client(Priority.ACCOUNT), on_change=publish_account)
+
+# Fills ledger with per-symbol PnL, fed by userFills/userFundings and revalued on each price tick
+pnl_broadcaster = PriceBroadcaster(history=500)
+
+
+def publish_pnl(event: str, symbol: str, payload: dict):
+    """Publica fills, funding e revalorizações para os clientes do stream de PnL"""
+    pnl_broadcaster.publish("pnl_update", {"type": "pnl_update", "event": event, **payload}, symbol)
+
+
+ledger = FillsLedger(
+    log_dir=LOG_DIR,
+    entry_hint=lambda coin: (account_state.positions.get(coin) or {}).get("entry_price"),
+    on_change=publish_pnl,
+)
+
+# In-process pre-trade checks against the in-memory account, metadata and L2 book
+risk_engine = PreTradeRisk(runtime.current)
+
+
+def status_payload() -> dict:
+    return {"type": "status", "websocket_running": price_feed.running, "websocket_prices": websocket_price_data}
+
+
+def create_info_client():
+    """Create the shared Info client (blocking: imports the SDK and fetches metadata)"""
+    global info_client
+    with info_client_lock:
+        if info_client is not None:
+            return info_client
+        from hyperliquid.info import Info
+        try:
+            info_client = upstream.instrument(Info(base_url=BASE_URL, skip_ws=True,
+                                                   timeout=runtime.upstream_timeout_seconds))
+            logger.info("=" * 80)
+            logger.info("✅ Info client initialized successfully")
+            logger.info(f"   Base URL: {BASE_URL}")
+            logger.info("=" * 80)
+        except Exception as e:
+            logger.error("=" * 80)
+            logger.error("❌ Failed to initialize info client!")
+            logger.error(f"   Error: {e}")
+            logger.error("=" * 80)
+            raise
+        return info_client
+
+
+async def get_info_client(priority: Priority = Priority.MARKET_DATA):
+    """Return the Info client, creating it off the event loop if warmup hasn't yet"""
+    if info_client is not None:
+        return info_client
+    try:
+        return await upstream.run(create_info_client, weight=CLIENT_INIT_WEIGHT, priority=priority)
+    except Exception:
+        return None
+
 
 def initialize_exchange():
     """Initialize or reinitialize exchange client - useful for hot reload"""
-    global wallet, exchange, ACCOUNT_ADDRESS, SECRET_KEY
-    # Reload env vars in case they changed
-    load_dotenv(override=True)
-    ACCOUNT_ADDRESS = os.getenv("ACCOUNT_ADDRESS", "").strip()
-    SECRET_KEY = os.getenv("SECRET_KEY", "").strip()
-    
-    # Remove espaços extras e quebras de linha
-    if ACCOUNT_ADDRESS:
-        ACCOUNT_ADDRESS = ACCOUNT_ADDRESS.strip('"\'')
-    if SECRET_KEY:
-        SECRET_KEY = SECRET_KEY.strip('"\'')
+    global wallet, exchange
+    # Reload credentials in case the .env changed (explicit action, not the hot path)
+    settings = runtime.reload_credentials()
+    ACCOUNT_ADDRESS = settings.account_address
+    SECRET_KEY = settings.secret_key
     
     logger.info("=" * 60)
     logger.info("Tentando inicializar Exchange client...")
@@ -121,12 +254,16 @@ def initialize_exchange():
             return False
             
         try:
+            import eth_account
+            from hyperliquid.exchange import Exchange
+
             logger.info("Criando wallet a partir da SECRET_KEY...")
             wallet = eth_account.Account.from_key(SECRET_KEY)
             logger.info(f"Wallet criado com sucesso. Endereco: {wallet.address}")
             
             logger.info(f"Inicializando Exchange client com BASE_URL: {BASE_URL}")
-            exchange = Exchange(wallet, BASE_URL, account_address=ACCOUNT_ADDRESS)
+            exchange = upstream.instrument(Exchange(wallet, BASE_URL, account_address=ACCOUNT_ADDRESS,
+                                                    timeout=runtime.upstream_timeout_seconds))
             logger.info("=" * 60)
             logger.info(f"✅ Exchange client inicializado com SUCESSO!")
             logger.info(f"   Endereco: {ACCOUNT_ADDRESS}")
@@ -148,8 +285,43 @@ def initialize_exchange():
         logger.error("=" * 60)
         return False
 
-# Initial initialization
-initialize_exchange()
+
+async def warmup():
+    """Aquece clientes e caches em background: Info/metadata, mids e Exchange em paralelo"""
+    warmup_state["started_at"] = datetime.now().isoformat()
+    start = time.perf_counter()
+
+    async def warm_info_and_prices():
+        delay = 1.0
+        while info_client is None:
+            try:
+                await upstream.run(create_info_client, weight=CLIENT_INIT_WEIGHT, priority=Priority.MARKET_DATA)
+            except Exception as e:
+                warmup_state["errors"]["info_client"] = str(e)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30.0)
+        warmup_state["info_client"] = True
+        # Info() already fetched meta on construction
+        warmup_state["meta"] = True
+        warmup_state["errors"].pop("info_client", None)
+        await fetch_and_cache_rest_prices()
+        warmup_state["prices"] = all(entry.get("mid_price") for entry in price_cache.values())
+        try:
+            await asset_contexts.refresh()
+        except MarketDataUnavailable:
+            pass  # loaded on the first /api/assets request instead
+
+    async def warm_exchange():
+        if exchange is None:
+            warmup_state["exchange"] = await upstream.run(initialize_exchange, weight=CLIENT_INIT_WEIGHT,
+                                                          priority=Priority.ACCOUNT)
+        else:
+            warmup_state["exchange"] = True
+
+    await asyncio.gather(warm_info_and_prices(), warm_exchange(), return_exceptions=True)
+    warmup_state["finished_at"] = datetime.now().isoformat()
+    logger.info(f"🔥 Warmup finished in {time.perf_counter() - start:.2f}s "
+                f"(info={warmup_state['info_client']}, prices={warmup_state['prices']}, exchange={warmup_state['exchange']})")
 
 
 class OrderRequestModel(BaseModel):
@@ -162,6 +334,73 @@ class OrderRequestModel(BaseModel):
     stoploss: Optional[float] = None
     leverage: Optional[float] = None
     quantity_usd: Optional[float] = None  # Quantidade em USD
+    execution: Optional["ExecutionParamsModel"] = None  # split into child orders instead of one IOC
+
+
+class OrderModifyModel(BaseModel):
+    price: Optional[float] = Field(None, gt=0)  # new limit price (default: keep)
+    size: Optional[float] = Field(None, gt=0)  # new size (default: keep the remaining size)
+    quantity_usd: Optional[float] = Field(None, gt=0)  # new size in USD at the new price
+
+
+class TriggerOrderModel(BaseModel):
+    side: str  # "buy" or "sell"
+    size: Optional[float] = Field(None, gt=0)
+    quantity_usd: Optional[float] = Field(None, gt=0)
+    order_type: Literal["market", "limit"] = "market"
+    limit_price: Optional[float] = Field(None, gt=0)
+    reduce_only: bool = False
+
+
+class TriggerRequestModel(BaseModel):
+    symbol: str
+    price: float = Field(gt=0)
+    direction: Optional[Literal["above", "below"]] = None  # default: the side opposite to the current price
+    action: Literal["alert", "order"] = "alert"
+    order: Optional[TriggerOrderModel] = None
+    note: Optional[str] = None
+
+
+class ExecutionParamsModel(BaseModel):
+    strategy: str  # "twap", "iceberg" or "pov"
+    duration_seconds: float = Field(60.0, gt=0)  # twap
+    slices: int = Field(10, ge=1, le=10_000)  # twap
+    display_size: Optional[float] = Field(None, gt=0)  # iceberg: size visible on the book
+    limit_price: Optional[float] = Field(None, gt=0)  # iceberg
+    poll_seconds: float = Field(1.0, gt=0)  # iceberg
+    participation_rate: float = Field(0.1, gt=0, le=1)  # pov: fraction of market volume
+    interval_seconds: float = Field(2.0, gt=0)  # pov
+    max_duration_seconds: float = Field(3600.0, gt=0)  # pov
+    reduce_only: bool = False
+
+
+class ExecutionRequestModel(ExecutionParamsModel):
+    symbol: str
+    side: str  # "buy" or "sell"
+    size: Optional[float] = None
+    quantity_usd: Optional[float] = None
+
+
+OrderRequestModel.model_rebuild()
+
+
+class ScenarioPositionModel(BaseModel):
+    coin: str
+    size: float  # signed: > 0 long, < 0 short
+    entry_price: Optional[float] = None
+    mark_price: Optional[float] = None  # default: cached mid, then the account's mark
+    leverage: Optional[float] = None  # only used to size equity when there is no account
+
+
+class ScenarioRequestModel(BaseModel):
+    # Relative moves (-0.1 = -10%): one list for every asset, or one list per asset
+    shocks: Optional[Union[List[float], Dict[str, List[float]]]] = None
+    # Default grid when no shocks are given: linspace(-range_pct, +range_pct, steps)
+    range_pct: float = Field(0.2, gt=0, lt=1)
+    steps: int = Field(41, ge=1, le=MAX_SCENARIOS)
+    positions: Optional[List[ScenarioPositionModel]] = None  # replaces the cached account positions
+    add_positions: List[ScenarioPositionModel] = []  # e.g. the order being typed in the form
+    account_value: Optional[float] = None
 
 
 @app.get("/")
@@ -169,13 +408,48 @@ def read_root():
     return {"message": "Hyperliquid Trade Test API"}
 
 
+@app.get("/healthz")
+def healthz():
+    """Liveness: o processo está de pé (não depende da rede)"""
+    return {"status": "ok"}
+
+
+@app.get("/readyz")
+def readyz():
+    """Readiness: 200 só depois que Info client e cache de preços estiverem quentes"""
+    ready = warmup_state["info_client"] and warmup_state["prices"]
+    body = {"ready": ready, **warmup_state}
+    return JSONResponse(content=body, status_code=200 if ready else 503)
+
+
+@app.get("/api/metrics")
+def get_metrics():
+    """Retorna métricas internas: orçamento de peso upstream e cache de market data"""
+    return {
+        "upstream": upstream.metrics(),
+        "feed": price_feed.metrics(),
+        "stream": broadcaster.metrics(),
+        "market_data": market_cache.metrics(),
+        "account": {**account_state.metrics(), "feed": account_feed.metrics(),
+                    "stream": account_broadcaster.metrics()},
+        "risk": risk_engine.metrics(),
+        "executions": execution_scheduler.metrics(),
+        "ledger": {**ledger.metrics(), "stream": pnl_broadcaster.metrics()},
+        "profiling": {"requests": request_profiler.metrics(), "sampler_running": stack_sampler.running},
+        "loop": loop_monitor.metrics(),
+        "triggers": trigger_engine.metrics(),
+        "indicators": indicator_engine.metrics(),
+        "asset_contexts": asset_contexts.metrics(),
+        "candles": candle_history.metrics(),
+        "timestamp": datetime.now().isoformat(),
+    }
+
+
 @app.get("/api/status")
 async def get_status():
     """Retorna o status da aplicação e credenciais"""
-    # Reload env to get latest values
-    load_dotenv(override=True)
-    current_account = os.getenv("ACCOUNT_ADDRESS", "").strip().strip('"\'')
-    current_secret = os.getenv("SECRET_KEY", "").strip().strip('"\'')
+    current_account = runtime.account_address
+    current_secret = runtime.secret_key
     
     status = {
         "backend_running": True,
@@ -220,53 +494,43 @@ async def get_status():
 @app.get("/api/config")
 async def get_config():
     """Retorna a configuração atual (REST ou WebSocket)"""
-    rest_enabled = os.getenv("REST_ENABLED", "true").lower() == "true"
-    websocket_enabled = os.getenv("WEBSOCKET_ENABLED", "false").lower() == "true"
-    price_source = os.getenv("PRICE_SOURCE", "rest")
-    
+    settings = runtime.current
     return {
-        "price_source": price_source,
-        "rest_enabled": rest_enabled,
-        "websocket_enabled": websocket_enabled,
-        "websocket_running": websocket_running,
+        "price_source": settings.price_source,
+        "rest_enabled": settings.rest_enabled,
+        "websocket_enabled": settings.websocket_enabled,
+        "websocket_running": price_feed.running,
         "websocket_prices": websocket_price_data
     }
 
 
 @app.on_event("startup")
 async def startup_event():
-    """Inicia o WebSocket automaticamente se estiver habilitado"""
-    websocket_enabled = os.getenv("WEBSOCKET_ENABLED", "false").lower() == "true"
-    if websocket_enabled and not websocket_running:
+    """Dispara o warmup em background e inicia o WebSocket se estiver habilitado"""
+    global warmup_task, rest_poller_task, main_loop
+    main_loop = asyncio.get_running_loop()
+    loop_monitor.start()
+    restored = trigger_engine.load()
+    if restored:
+        logger.info(f"🎯 Restored {restored} active price trigger(s) from {TRIGGERS_FILE}")
+    # Never block startup on the network: /readyz reports when caches are hot
+    warmup_task = asyncio.create_task(warmup())
+    rest_poller_task = asyncio.create_task(rest_price_poller())
+    if runtime.websocket_enabled and not price_feed.running:
         logger.info("🚀 Iniciando WebSocket automaticamente no startup...")
         start_websocket_background()
-        # Also fetch initial prices from REST to populate cache
-        await fetch_and_cache_rest_prices()
+    restart_account_feed()
 
 
 async def fetch_and_cache_rest_prices():
     """Busca preços do REST e atualiza o cache"""
-    global price_cache
     symbols = ["BTC", "ETH", "SOL"]
-    
-    for symbol in symbols:
-        try:
-            market_data = await get_market_data(symbol)
-            if market_data and market_data.get("mid_price"):
-                # Cache is already updated in get_market_data, but ensure it's set
-                price_cache[symbol] = {
-                    "mid_price": market_data.get("mid_price"),
-                    "bid_price": market_data.get("bid_price"),
-                    "ask_price": market_data.get("ask_price"),
-                    "spread": market_data.get("spread"),
-                    "last_update": datetime.now().isoformat(),
-                    "source": "rest"
-                }
-                logger.info(f"✅ Cache populado para {symbol}: {market_data.get('mid_price')}")
-        except Exception as e:
-            logger.error(f"Erro ao buscar preço REST para {symbol}: {e}")
-            import traceback
-            logger.error(traceback.format_exc())
+    results = await asyncio.gather(*(market_cache.refresh(symbol) for symbol in symbols), return_exceptions=True)
+    for symbol, result in zip(symbols, results):
+        if isinstance(result, Exception):
+            logger.error(f"Erro ao buscar preço REST para {symbol}: {result}")
+        else:
+            logger.info(f"✅ Cache populado para {symbol}: {result.get('mid_price')}")
 
 
 @app.post("/api/config")
@@ -284,20 +548,12 @@ async def update_config(config: dict):
     else:
         primary_source = "rest"  # Default to REST if both disabled
     
-    # Save to environment variable
-    os.environ["PRICE_SOURCE"] = primary_source
-    os.environ["REST_ENABLED"] = str(rest_enabled)
-    os.environ["WEBSOCKET_ENABLED"] = str(websocket_enabled)
-    
-    # Manage WebSocket connection
-    if websocket_enabled and not websocket_running:
-        # Start WebSocket connection if enabled but not running
-        start_websocket_background()
-        # Fetch initial REST prices to populate cache
-        await fetch_and_cache_rest_prices()
-    elif not websocket_enabled and websocket_running:
-        # Stop WebSocket if disabled
-        stop_websocket_background()
+    # Subscribers (e.g. the WebSocket feed, which resyncs REST prices on connect) react to the change
+    runtime.update(
+        price_source=primary_source,
+        rest_enabled=bool(rest_enabled),
+        websocket_enabled=bool(websocket_enabled),
+    )
     
     return {
         "success": True,
@@ -308,184 +564,284 @@ async def update_config(config: dict):
     }
 
 
-async def websocket_price_updater():
-    """WebSocket client that connects to Hyperliquid and updates prices"""
-    global websocket_running, websocket_price_data, active_websocket_connections, price_cache
-    
-    uri = "wss://api.hyperliquid-testnet.xyz/ws"
-    symbols_to_subscribe = ["BTC", "ETH", "SOL"]
-    reconnect_delay = 5  # Start with 5 seconds
-    max_reconnect_delay = 60  # Max 60 seconds between reconnection attempts
-    
-    while websocket_running:
-        try:
-            # Check if WebSocket is still enabled before attempting connection
-            websocket_enabled = os.getenv("WEBSOCKET_ENABLED", "false").lower() == "true"
-            if not websocket_enabled:
-                logger.info("WebSocket disabled, stopping connection attempts")
-                websocket_running = False
-                break
-                
-            logger.info(f"🔄 Connecting to Hyperliquid WebSocket... (attempt after {reconnect_delay}s delay)")
-            async with websockets.connect(uri, ping_interval=None) as ws:
-                logger.info("✅ WebSocket connected to Hyperliquid")
-                reconnect_delay = 5  # Reset delay on successful connection
-                
-                # Subscribe to trades for all symbols
-                for symbol in symbols_to_subscribe:
-                    subscription_msg = {
-                        "method": "subscribe",
-                        "subscription": {
-                            "type": "trades",
-                            "coin": symbol
-                        }
-                    }
-                    await ws.send(json.dumps(subscription_msg))
-                    logger.info(f"Subscribed to trades for {symbol}")
-                    await asyncio.sleep(0.1)
-                
-                # Main message loop
-                while websocket_running:
-                    # Check if still enabled
-                    websocket_enabled = os.getenv("WEBSOCKET_ENABLED", "false").lower() == "true"
-                    if not websocket_enabled:
-                        logger.info("WebSocket disabled during connection, stopping...")
-                        break
-                    try:
-                        msg = await asyncio.wait_for(ws.recv(), timeout=30.0)
-                        
-                        if isinstance(msg, bytes):
-                            try:
-                                msg = msg.decode('utf-8')
-                            except:
-                                continue
-                        
-                        if msg.strip() in ['-1', '1', 'ping', 'pong']:
-                            continue
-                        
-                        try:
-                            data = json.loads(msg)
-                        except json.JSONDecodeError:
-                            continue
-                        
-                        if isinstance(data, dict):
-                            if "error" in data:
-                                continue
-                            
-                            if "channel" in data and data["channel"] == "trades":
-                                if "data" in data and isinstance(data["data"], list) and len(data["data"]) > 0:
-                                    for trade in data["data"]:
-                                        if isinstance(trade, dict):
-                                            price = float(trade.get("px", 0))
-                                            symbol = trade.get("coin", "").upper()
-                                            
-                                            if price > 0 and symbol:
-                                                old_price = websocket_price_data.get(symbol, 0)
-                                                websocket_price_data[symbol] = price
-                                                
-                                                # Update centralized cache
-                                                if symbol in price_cache:
-                                                    existing = price_cache[symbol]
-                                                    
-                                                    # ALWAYS keep existing bid/ask/spread from REST (real values)
-                                                    # WebSocket only updates mid_price, not bid/ask
-                                                    price_cache[symbol] = {
-                                                        "mid_price": price,  # Update mid_price from WebSocket
-                                                        "bid_price": existing.get("bid_price"),  # Keep REST bid_price
-                                                        "ask_price": existing.get("ask_price"),  # Keep REST ask_price
-                                                        "spread": existing.get("spread"),  # Keep REST spread
-                                                        "last_update": datetime.now().isoformat(),
-                                                        "source": "websocket"  # But mark as websocket for mid_price
-                                                    }
-                                                
-                                                logger.info(f"📊 {symbol} price updated via WebSocket: {price} (old: {old_price})")
-                                                
-                                                # Always send price_update when we have active connections
-                                                if active_websocket_connections:
-                                                    message = {
-                                                        "type": "price_update",
-                                                        "symbol": symbol,
-                                                        "price": price,
-                                                        "cache_data": price_cache.get(symbol)
-                                                    }
-                                                    disconnected = set()
-                                                    sent_count = 0
-                                                    for connection in active_websocket_connections:
-                                                        try:
-                                                            await connection.send_json(message)
-                                                            sent_count += 1
-                                                        except Exception as e:
-                                                            logger.error(f"Error sending to WebSocket client: {e}")
-                                                            disconnected.add(connection)
-                                                    active_websocket_connections -= disconnected
-                                                    if sent_count > 0:
-                                                        logger.info(f"✅ Sent price_update to {sent_count} client(s) for {symbol}: {price}")
-                                                else:
-                                                    logger.warning(f"⚠️ No active WebSocket connections to send price_update for {symbol}")
-                    except asyncio.TimeoutError:
-                        # Send ping to keep connection alive
-                        try:
-                            await ws.send(json.dumps({"method": "ping"}))
-                        except:
-                            # If ping fails, connection is likely broken, break to reconnect
-                            logger.warning("WebSocket ping failed, connection may be broken. Reconnecting...")
-                            break
-                    except websockets.exceptions.ConnectionClosed:
-                        logger.warning("WebSocket connection closed by server. Reconnecting...")
-                        break
-                    except Exception as e:
-                        logger.error(f"Error processing WebSocket message: {e}")
-                        # If it's a connection error, break to reconnect
-                        if "connection" in str(e).lower() or "closed" in str(e).lower() or "broken" in str(e).lower():
-                            logger.warning("WebSocket connection error detected. Reconnecting...")
-                            break
-                        await asyncio.sleep(1)
-                        
-        except websockets.exceptions.ConnectionClosed:
-            logger.warning("WebSocket connection closed. Will reconnect...")
-        except websockets.exceptions.InvalidURI:
-            logger.error("Invalid WebSocket URI. Cannot reconnect.")
-            break
-        except Exception as e:
-            logger.error(f"WebSocket connection error: {e}")
-            import traceback
-            logger.error(traceback.format_exc())
+FEED_SYMBOLS = ["BTC", "ETH", "SOL"]
+
+# Rolling indicators updated per trade; pushed to /ws/price at most once per interval per symbol
+indicator_engine = IndicatorEngine(FEED_SYMBOLS)
+INDICATOR_PUSH_INTERVAL = 1.0
+indicator_pushed_at: Dict[str, float] = {}
+
+
+def publish_indicators(symbols: Set[str]):
+    """Publica os indicadores dos símbolos que tiveram trades (com throttle por símbolo)"""
+    now = time.monotonic()
+    due = [s for s in symbols if now - indicator_pushed_at.get(s, 0.0) >= INDICATOR_PUSH_INTERVAL]
+    for values in indicator_engine.snapshot(due):
+        indicator_pushed_at[values["symbol"]] = now
+        broadcaster.publish("indicator_update", {"type": "indicator_update", **values}, values["symbol"])
+
+
+async def handle_feed_message(data: dict):
+    """Aplica trades do feed ao cache centralizado e publica para os clientes push"""
+    if asset_contexts.apply_message(data) is not None:
+        return
+    if data.get("channel") == "l2Book" and isinstance(data.get("data"), dict):
+        # Live depth for market-order pricing and the risk checks
+        book = data["data"]
+        bids, asks = parse_book(book)
+        if book.get("coin"):
+            market_cache.update_book(book["coin"].upper(), bids, asks)
+        return
+    if data.get("channel") != "trades" or not isinstance(data.get("data"), list):
+        return
+    traded: Set[str] = set()
+    for trade in data["data"]:
+        if not isinstance(trade, dict):
+            continue
+        price = float(trade.get("px", 0))
+        symbol = trade.get("coin", "").upper()
+        if price <= 0 or not symbol:
+            continue
+        old_price = websocket_price_data.get(symbol, 0)
+        websocket_price_data[symbol] = price
+        size = float(trade.get("sz", 0) or 0)
+        traded_volume[symbol] = traded_volume.get(symbol, 0.0) + size
+        side = trade.get("side")
+        indicator_engine.on_trade(symbol, price, size, True if side == "B" else False if side == "A" else None,
+                                  trade.get("time") or time.time() * 1000)
+        traded.add(symbol)
         
-        # Only reconnect if still enabled and running
-        websocket_enabled = os.getenv("WEBSOCKET_ENABLED", "false").lower() == "true"
-        if websocket_running and websocket_enabled:
-            logger.info(f"🔄 Attempting to reconnect WebSocket in {reconnect_delay} seconds...")
-            await asyncio.sleep(reconnect_delay)
-            # Exponential backoff: increase delay up to max, but reset on successful connection
-            reconnect_delay = min(reconnect_delay * 1.5, max_reconnect_delay)
-        else:
-            logger.info("WebSocket stopped or disabled. Not reconnecting.")
-            break
+        # Update centralized cache
+        if symbol in price_cache:
+            existing = price_cache[symbol]
+            
+            # ALWAYS keep existing bid/ask/spread from REST (real values)
+            # WebSocket only updates mid_price, not bid/ask
+            price_cache[symbol] = {
+                "mid_price": price,  # Update mid_price from WebSocket
+                "bid_price": existing.get("bid_price"),  # Keep REST bid_price
+                "ask_price": existing.get("ask_price"),  # Keep REST ask_price
+                "spread": existing.get("spread"),  # Keep REST spread
+                "last_update": datetime.now().isoformat(),
+                "source": "websocket"  # But mark as websocket for mid_price
+            }
+        
+        logger.info(f"📊 {symbol} price updated via WebSocket: {price} (old: {old_price})")
+        
+        # Fan-out happens in each client's own sender task (/ws/price, SSE)
+        publish_price(symbol, trade.get("time"))
+    publish_indicators(traded)
+
+
+@app.get("/api/indicators")
+async def get_indicators(symbols: Optional[str] = None):
+    """Retorna EMA, VWAP, volatilidade realizada, RSI e desequilíbrio de fluxo calculados sobre os trades"""
+    wanted = parse_symbols(symbols)
+    return Response(orjson.dumps({"success": True, "windows_s": indicator_engine.windows,
+                                  "indicators": indicator_engine.snapshot(wanted)}),
+                    media_type="application/json")
+
+
+@app.get("/api/indicators/{symbol}")
+async def get_symbol_indicators(symbol: str):
+    """Retorna os indicadores de um símbolo"""
+    values = indicator_engine.snapshot([symbol.upper()])
+    if not values:
+        raise HTTPException(status_code=404, detail=f"No trades seen for {symbol.upper()} yet")
+    return Response(orjson.dumps({"success": True, "windows_s": indicator_engine.windows, **values[0]}),
+                    media_type="application/json")
+
+
+def asset_contexts_body(body: bytes) -> Response:
+    # Encoded once per table version; only the age of the last bulk load is appended per request
+    age = asset_contexts.age or 0.0
+    return Response(content=body[:-1] + b',"bulk_age_seconds":' + f"{age:.3f}".encode() + b"}",
+                    media_type="application/json")
+
+
+@app.get("/api/assets")
+async def get_asset_contexts(sort: str = "open_interest_usd", order: Literal["asc", "desc"] = "desc",
+                             limit: Optional[int] = Query(None, ge=1), symbols: Optional[str] = None,
+                             min_open_interest_usd: Optional[float] = None, min_volume_usd: Optional[float] = None,
+                             min_funding: Optional[float] = None, max_funding: Optional[float] = None):
+    """Retorna funding, mark/oracle, open interest e volume 24h do universo, filtrados e ordenados.
+
+    Ex.: ?sort=funding&limit=10 (maior funding), ?sort=funding&order=asc, ?sort=open_interest_usd.
+    """
+    try:
+        await asset_contexts.ensure_loaded()
+    except MarketDataUnavailable as e:
+        raise HTTPException(status_code=503, detail={"error": str(e)})
+    try:
+        body = asset_contexts.query(sort=sort, descending=order == "desc", limit=limit,
+                                    symbols=parse_symbols(symbols), min_open_interest_usd=min_open_interest_usd,
+                                    min_volume_usd=min_volume_usd, min_funding=min_funding, max_funding=max_funding)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return asset_contexts_body(body)
+
+
+@app.get("/api/assets/{symbol}")
+async def get_asset_context(symbol: str):
+    """Retorna o contexto (funding, mark/oracle, open interest, volume 24h) de um ativo"""
+    try:
+        await asset_contexts.ensure_loaded()
+    except MarketDataUnavailable as e:
+        raise HTTPException(status_code=503, detail={"error": str(e)})
+    row = asset_contexts.get(symbol.upper())
+    if row is None:
+        raise HTTPException(status_code=404, detail=f"Asset {symbol.upper()} not found")
+    return asset_contexts_body(orjson.dumps({"success": True, **row}))
+
+
+# Upper bound of candles per /api/history response
+MAX_HISTORY_CANDLES = 20000
+
+
+@app.get("/api/history/{symbol}")
+async def get_history(symbol: str, interval: str = "1h", start: Optional[int] = None, end: Optional[int] = None,
+                      limit: int = Query(500, ge=1, le=MAX_HISTORY_CANDLES)):
+    """Retorna candles históricos (start/end em ms; sem start, os últimos `limit` candles até end).
+
+    Servidos do cache em disco; só as sub-faixas ausentes são buscadas upstream.
+    """
+    symbol_upper = symbol.upper()
+    if interval not in INTERVAL_MS:
+        raise HTTPException(status_code=400, detail=f"interval must be one of {', '.join(INTERVAL_MS)}")
+    step = INTERVAL_MS[interval]
+    end = end if end is not None else int(time.time() * 1000) + 1
+    start = start if start is not None else end - limit * step
+    if (end - start) // step > MAX_HISTORY_CANDLES:
+        raise HTTPException(status_code=400, detail=f"Range too large (max {MAX_HISTORY_CANDLES} candles)")
+    try:
+        meta = await market_cache.get_meta()
+    except MarketDataUnavailable as e:
+        raise HTTPException(status_code=503, detail={"symbol": symbol_upper, "error": str(e)})
+    if find_asset(meta, symbol_upper)[0] is None:
+        raise HTTPException(status_code=404, detail=f"Symbol {symbol_upper} not found in universe")
+    try:
+        history = await candle_history.get(symbol_upper, interval, start, end)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"❌ ERRO ao obter histórico de {symbol_upper} {interval}: {type(e).__name__}: {e}")
+        raise HTTPException(status_code=503, detail={"symbol": symbol_upper, "error": str(e)})
+    return Response(orjson.dumps({"success": True, **history}), media_type="application/json")
+
+
+async def resync_feed_prices():
+    """Snapshot REST após (re)conexão do feed, para não esperar o próximo trade"""
+    results = await asyncio.gather(*(market_cache.refresh(symbol) for symbol in FEED_SYMBOLS), return_exceptions=True)
+    failed = [symbol for symbol, result in zip(FEED_SYMBOLS, results) if isinstance(result, Exception)]
+    if failed:
+        raise MarketDataUnavailable(f"REST resync failed for {', '.join(failed)}")
+
+
+# Supervised upstream feed: heartbeat, typed failure handling, resubscribe + REST resync
+price_feed = PriceFeed(
+    WS_URL,
+    [{"type": channel, "coin": symbol} for symbol in FEED_SYMBOLS
+     for channel in ("trades", "l2Book", "activeAssetCtx")],
+    on_message=handle_feed_message,
+    on_resync=lambda: resync_feed_prices(),
+    breaker=feed_breaker,
+    heartbeat_interval=runtime.feed_heartbeat_seconds,
+    heartbeat_timeout=runtime.feed_heartbeat_timeout_seconds,
+)
 
 
 def start_websocket_background():
-    """Start WebSocket in background thread"""
-    global websocket_running, websocket_task
-    
-    if websocket_running:
-        return
-    
-    websocket_running = True
-    
-    def run_websocket():
-        asyncio.run(websocket_price_updater())
-    
-    websocket_task = Thread(target=run_websocket, daemon=True)
-    websocket_task.start()
-    logger.info("🚀 WebSocket background task started")
+    """Start the WebSocket feed on the main event loop"""
+    price_feed.start()
 
 
 def stop_websocket_background():
-    """Stop WebSocket background task"""
-    global websocket_running
-    
-    websocket_running = False
-    logger.info("🛑 WebSocket background task stopped")
+    """Stop the WebSocket feed"""
+    price_feed.stop()
+
+
+@runtime.subscribe
+def on_settings_changed(changed: dict, settings):
+    """Liga/desliga o feed WebSocket quando a configuração muda"""
+    if "websocket_enabled" not in changed:
+        return
+    if settings.websocket_enabled and not price_feed.running:
+        start_websocket_background()
+    elif not settings.websocket_enabled and price_feed.running:
+        stop_websocket_background()
+    broadcaster.publish("status", status_payload())
+
+
+async def handle_account_message(data: dict):
+    """Aplica os canais de usuário ao livro de fills e ao estado da conta"""
+    # Ledger first: a position opened before the first fill takes its entry from the account state
+    ledger.apply_message(data)
+    account_state.apply_message(data)
+
+
+# User channels of the configured account; always on while there is an account address
+account_feed = PriceFeed(
+    WS_URL,
+    [],
+    on_message=handle_account_message,
+    on_resync=lambda: account_state.seed(),
+    breaker=make_breaker("ws_account"),
+    heartbeat_interval=runtime.feed_heartbeat_seconds,
+    heartbeat_timeout=runtime.feed_heartbeat_timeout_seconds,
+    name="account",
+)
+
+
+def restart_account_feed():
+    """(Re)inscreve os canais de usuário da conta atual; sem endereço válido o feed fica parado"""
+    user = runtime.account_address
+    valid = bool(user) and user.startswith("0x") and len(user) == 42
+    previous = account_state.user
+    account_state.set_user(user if valid else None)
+    if account_state.user != previous:
+        ledger.reset()
+    if account_feed.running:
+        account_feed.stop()
+    if not valid:
+        return
+    account_feed.subscriptions = [{"type": channel, "user": account_state.user}
+                                  for channel in ("webData2", "orderUpdates", "userFills", "userFundings")]
+    account_feed.start()
+
+
+@runtime.subscribe
+def on_account_address_changed(changed: dict, settings):
+    """Troca de conta (reload do .env): reinicia o feed de conta no event loop principal"""
+    if "account_address" in changed and main_loop is not None:
+        main_loop.call_soon_threadsafe(restart_account_feed)
+
+
+@runtime.subscribe
+def on_loop_monitor_changed(changed: dict, settings):
+    """Novo intervalo/limite do monitor de atraso vale a partir do próximo tique"""
+    if "loop_monitor_interval_ms" in changed or "loop_lag_threshold_ms" in changed:
+        loop_monitor.configure(settings.loop_monitor_interval_ms / 1000, settings.loop_lag_threshold_ms / 1000)
+
+
+@runtime.subscribe
+def on_risk_limits_changed(changed: dict, settings):
+    """Novos limites de risco valem para a próxima ordem"""
+    if any(field.startswith("risk_") for field in changed):
+        risk_engine.configure(settings)
+
+
+@runtime.subscribe
+def on_upstream_limits_changed(changed: dict, settings):
+    """Aplica novos limites de peso, thresholds do circuit breaker e heartbeat do feed sem reiniciar"""
+    if "upstream_weight_per_minute" in changed or "upstream_order_reserve" in changed:
+        upstream.limiter.configure(settings.upstream_weight_per_minute, settings.upstream_order_reserve)
+    if any(field.startswith("breaker_") for field in changed):
+        for breaker in [*upstream.breakers.values(), feed_breaker, account_feed.breaker]:
+            breaker.configure(settings.breaker_failure_ratio, settings.breaker_slow_call_seconds,
+                              settings.breaker_open_seconds)
+    if "feed_heartbeat_seconds" in changed or "feed_heartbeat_timeout_seconds" in changed:
+        for feed in (price_feed, account_feed):
+            feed.configure(settings.feed_heartbeat_seconds, settings.feed_heartbeat_timeout_seconds)
 
 
 @app.websocket("/ws/price")
@@ -494,43 +850,656 @@ async def websocket_price_endpoint(websocket: WebSocket):
     await websocket.accept()
     active_websocket_connections.add(websocket)
     logger.info(f"WebSocket client connected. Total connections: {len(active_websocket_connections)}")
-    
-    try:
+    subscriber, _ = broadcaster.subscribe()
+
+    async def sender():
         # Don't send initial prices - only send real-time price_update messages
-        # Keep connection alive and wait for disconnection
         while True:
-            try:
-                # Wait for messages (or timeout to check connection)
-                data = await asyncio.wait_for(websocket.receive_text(), timeout=1.0)
-                # Client can send ping/pong messages if needed
-            except asyncio.TimeoutError:
-                # Connection is still alive, continue waiting
-                continue
-            except:
-                # Connection closed or error
-                break
+            event = await subscriber.queue.get()
+            await websocket.send_text(event.json)
+
+    send_task = asyncio.create_task(sender())
+    try:
+        # Keep connection alive and wait for disconnection (client may send pings)
+        while True:
+            await websocket.receive_text()
     except WebSocketDisconnect:
         pass
     except Exception as e:
         logger.error(f"Error in WebSocket endpoint: {e}")
     finally:
+        send_task.cancel()
+        broadcaster.unsubscribe(subscriber)
         active_websocket_connections.discard(websocket)
         logger.info(f"WebSocket client disconnected. Total connections: {len(active_websocket_connections)}")
 
 
+def parse_symbols(symbols: Optional[str]) -> Optional[Set[str]]:
+    """'btc,eth' -> {'BTC', 'ETH'}; vazio ou 'all' -> None (todos)"""
+    if not symbols or symbols.strip().lower() == "all":
+        return None
+    return {s.strip().upper() for s in symbols.split(",") if s.strip()}
+
+
+@app.get("/api/stream/prices")
+async def stream_prices(symbols: Optional[str] = None, last_event_id: Optional[str] = Header(None)):
+    """Stream SSE de preços (mesmos eventos do /ws/price); retoma com Last-Event-ID"""
+    wanted = parse_symbols(symbols)
+    try:
+        resume_from = int(last_event_id) if last_event_id else None
+    except ValueError:
+        resume_from = None
+    subscriber, resumed = broadcaster.subscribe(wanted, resume_from)
+
+    async def events():
+        try:
+            yield "retry: 2000\n\n"
+            if not resumed:
+                # New client (or too far behind): current state first, tagged with the head id
+                head = broadcaster.last_id
+                yield f"id: {head}\nevent: status\ndata: {json.dumps(status_payload())}\n\n"
+                for symbol, entry in price_cache.items():
+                    if entry.get("mid_price") and (wanted is None or symbol in wanted):
+                        payload = {"type": "price_update", "symbol": symbol, "price": entry["mid_price"],
+                                   "trade_time": None, "cache_data": entry}
+                        yield f"id: {head}\nevent: price_update\ndata: {json.dumps(payload)}\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscriber.queue.get(), timeout=15.0)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"  # keeps proxies from closing an idle stream
+                    continue
+                yield event.sse()
+        finally:
+            broadcaster.unsubscribe(subscriber)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/api/risk")
+async def get_risk():
+    """Retorna os limites de risco pré-trade atuais e as métricas da checagem"""
+    return {"limits": risk_engine.limits(), "metrics": risk_engine.metrics()}
+
+
+@app.post("/api/risk")
+async def update_risk(limits: dict):
+    """Atualiza limites de risco pré-trade (ex.: {"max_order_notional_usd": 50000}; 0 desliga a regra)"""
+    changes = {f"risk_{name}": value for name, value in limits.items()}
+    unknown = [name for name in changes if name not in Settings.model_fields]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown risk limits: {', '.join(n[len('risk_'):] for n in unknown)}")
+    try:
+        runtime.update(**changes)
+    except ValidationError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid risk limits: {e}")
+    return {"success": True, "limits": risk_engine.limits()}
+
+
+@app.get("/api/account")
+async def get_account(if_none_match: Optional[str] = Header(None)):
+    """Retorna posições, margem, saldo sacável e ordens abertas da conta (servido da memória)"""
+    if not account_state.user:
+        return JSONResponse(status_code=503, content={"success": False, "error": "ACCOUNT_ADDRESS not configured"})
+    if not account_state.seeded:
+        try:
+            await account_state.seed()
+        except AccountUnavailable as e:
+            return JSONResponse(status_code=503, content={"success": False, "error": str(e)})
+    elif account_state.needs_rest(account_feed.connected):
+        # Feed down and snapshot old: answer now, refresh in background
+        account_state.revalidate()
+    etag = account_state.etag()
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return JSONResponse(
+        content={"success": True, "feed_connected": account_feed.connected, **account_state.snapshot()},
+        headers={"ETag": etag, "Cache-Control": "no-cache"},
+    )
+
+
+@app.get("/api/stream/account")
+async def stream_account():
+    """Stream SSE do estado da conta: snapshot inicial e um evento account_update a cada mudança"""
+    subscriber, _ = account_broadcaster.subscribe()
+
+    async def events():
+        try:
+            yield "retry: 2000\n\n"
+            snapshot = {"type": "account_update", "reason": "snapshot", **account_state.snapshot()}
+            yield f"id: {account_broadcaster.last_id}\nevent: account_update\ndata: {json.dumps(snapshot)}\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscriber.queue.get(), timeout=15.0)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield event.sse()
+        finally:
+            account_broadcaster.unsubscribe(subscriber)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/api/pnl")
+async def get_pnl(symbol: Optional[str] = None):
+    """Retorna PnL realizado, não realizado, taxas e funding por ativo e o total da conta"""
+    symbol = symbol.upper() if symbol else None
+    if symbol and symbol not in ledger.symbols:
+        raise HTTPException(status_code=404, detail=f"No fills for {symbol}")
+    return Response(orjson.dumps({"success": True, "user": account_state.user, **ledger.snapshot(symbol)}),
+                    media_type="application/json")
+
+
+@app.get("/api/fills")
+async def get_fills(symbol: Optional[str] = None, limit: int = Query(100, ge=1, le=1000)):
+    """Retorna as últimas execuções do livro (mais recentes primeiro), com o PnL realizado de cada uma"""
+    return {"success": True, "fills": ledger.fills(symbol.upper() if symbol else None, limit)}
+
+
+@app.get("/api/stream/pnl")
+async def stream_pnl(symbols: Optional[str] = None):
+    """Stream SSE de PnL: snapshot inicial e eventos pnl_update (fill, funding, mark)"""
+    wanted = parse_symbols(symbols)
+    subscriber, _ = pnl_broadcaster.subscribe(wanted)
+
+    async def events():
+        try:
+            yield "retry: 2000\n\n"
+            snapshot = {"type": "pnl_update", "event": "snapshot", **ledger.snapshot()}
+            if wanted is not None:
+                snapshot["symbols"] = [s for s in snapshot["symbols"] if s["symbol"] in wanted]
+            yield f"id: {pnl_broadcaster.last_id}\nevent: pnl_update\ndata: {orjson.dumps(snapshot).decode()}\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscriber.queue.get(), timeout=15.0)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield event.sse()
+        finally:
+            pnl_broadcaster.unsubscribe(subscriber)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.post("/api/account/scenarios")
+async def account_scenarios(request: ScenarioRequestModel):
+    """Retorna margin ratio, preços de liquidação e PnL de todos os cenários de choque (um passe NumPy)"""
+    if request.positions is not None:
+        base = [p.model_dump() for p in request.positions]
+    else:
+        if account_state.user and not account_state.seeded:
+            try:
+                await account_state.seed()
+            except AccountUnavailable as e:
+                logger.warning(f"Scenarios without account state: {e}")
+        base = [{
+            "coin": p["coin"],
+            "size": p["size"],
+            "entry_price": p["entry_price"],
+            "mark_price": abs(p["position_value"] / p["size"]) if p.get("position_value") and p["size"] else None,
+            "leverage": p.get("leverage"),
+            "max_leverage": p.get("max_leverage"),
+        } for p in account_state.positions.values()]
+    positions = merge_positions(base, [p.model_dump() for p in request.add_positions])
+    if not positions:
+        return JSONResponse(status_code=422, content={"success": False, "error": "No positions to simulate"})
+    try:
+        meta = await market_cache.get_meta(Priority.ACCOUNT)
+    except MarketDataUnavailable:
+        meta = None
+
+    coins, marks, mmr = [], [], []
+    for p in positions:
+        coin = p["coin"].upper()
+        cached = price_cache.get(coin) or {}
+        mark = cached.get("mid_price") or p.get("mark_price") or p.get("entry_price")
+        if not mark:
+            return JSONResponse(status_code=422, content={"success": False, "error": f"No mark price for {coin}"})
+        _, asset = find_asset(meta, coin) if meta else (None, None)
+        coins.append(coin)
+        marks.append(mark)
+        mmr.append(maintenance_rate((asset or {}).get("maxLeverage") or p.get("max_leverage")))
+    sizes = np.array([p["size"] for p in positions], dtype=float)
+    marks = np.array(marks, dtype=float)
+    entries = np.array([p.get("entry_price") or m for p, m in zip(positions, marks)], dtype=float)
+    mmr = np.array(mmr, dtype=float)
+
+    account_value = request.account_value
+    if account_value is None and account_state.seeded and request.positions is None:
+        account_value = account_state.cross_margin_summary.get("account_value")
+    if account_value is None:
+        # No account: equity is the initial margin posted for the simulated positions
+        account_value = float(sum(abs(s) * m / (p.get("leverage") or 1.0)
+                                  for s, m, p in zip(sizes, marks, positions)))
+
+    shocks = request.shocks
+    if isinstance(shocks, dict):
+        shocks = {coin.upper(): values for coin, values in shocks.items()}
+    try:
+        matrix = shock_matrix(coins, shocks, request.range_pct, request.steps)
+    except ScenarioError as e:
+        return JSONResponse(status_code=422, content={"success": False, "error": str(e)})
+
+    start = time.perf_counter()
+    current = margin_scenarios(sizes, entries, marks, mmr, account_value, np.zeros((1, len(coins))))
+    result = margin_scenarios(sizes, entries, marks, mmr, account_value, matrix)
+    compute_ms = (time.perf_counter() - start) * 1000
+
+    body = {
+        "success": True,
+        "coins": coins,
+        "account_value": account_value,
+        "current": {
+            "margin_ratio": current["margin_ratio"][0],
+            "maintenance_margin": current["maintenance_margin"][0],
+            "positions": [{
+                "coin": coin,
+                "size": sizes[j],
+                "entry_price": entries[j],
+                "mark_price": marks[j],
+                "maintenance_rate": mmr[j],
+                "maintenance_margin": abs(sizes[j]) * marks[j] * mmr[j],
+                "liquidation_price": current["liquidation_prices"][0, j],
+            } for j, coin in enumerate(coins)],
+        },
+        "scenarios": {"count": matrix.shape[0], "shocks": matrix, **result},
+        "compute_ms": round(compute_ms, 3),
+    }
+    # NaN/inf (no liquidation price, non-positive equity) serialize as null
+    return Response(content=orjson.dumps(body, option=orjson.OPT_SERIALIZE_NUMPY), media_type="application/json")
+
+
+async def current_book(symbol: str) -> dict:
+    """Livro L2 para precificar ordens: o cache se recente, senão um refresh REST coalescido"""
+    book = market_cache.book(symbol, max_age=market_cache.fresh_ttl)
+    if book is None:
+        await market_cache.refresh(symbol, Priority.ORDER)
+        book = market_cache.book(symbol) or {"bids": [], "asks": []}
+    return book
+
+
+def parse_order_result(result: dict) -> dict:
+    """Resposta de /exchange order -> {"status": filled|resting|error, "filled", "avg_price", "oid"}"""
+    if not isinstance(result, dict) or result.get("status") != "ok":
+        return {"status": "error", "error": str((result or {}).get("response", result)), "filled": 0.0}
+    statuses = result.get("response", {}).get("data", {}).get("statuses", [])
+    status = statuses[0] if statuses else {}
+    if "filled" in status:
+        filled = status["filled"]
+        return {"status": "filled", "oid": filled.get("oid"), "filled": float(filled["totalSz"]),
+                "avg_price": float(filled["avgPx"])}
+    if "resting" in status:
+        return {"status": "resting", "oid": status["resting"]["oid"], "filled": 0.0}
+    return {"status": "error", "error": status.get("error", str(status)), "filled": 0.0}
+
+
+# Hyperliquid rejects orders below this notional
+MIN_ORDER_NOTIONAL_USD = 10.0
+
+
+def min_child_size(symbol: str) -> float:
+    """Menor fatia aceita pela exchange: notional mínimo no preço atual, nos szDecimals do ativo"""
+    mid = (price_cache.get(symbol) or {}).get("mid_price")
+    if not mid:
+        return 0.0
+    _, asset = find_asset(market_cache.meta, symbol) if market_cache.meta else (None, None)
+    sz_decimals = (asset or {}).get("szDecimals", 5)
+    return math.ceil(MIN_ORDER_NOTIONAL_USD / mid * 10 ** sz_decimals) / 10 ** sz_decimals
+
+
+async def submit_child_order(symbol: str, is_buy: bool, size: float, limit_price: Optional[float],
+                             reduce_only: bool) -> dict:
+    """Ordem filha do agendador: IOC precificada pelo livro (ou GTC em limit_price), com risco pré-trade"""
+    if exchange is None:
+        raise RuntimeError("Exchange client not initialized")
+    _, asset = find_asset(await market_cache.get_meta(Priority.ORDER), symbol)
+    if asset is None:
+        raise ValueError(f"Symbol {symbol} not found in universe")
+    sz_decimals = asset.get("szDecimals", 5)
+    size = float(f"{round(size, sz_decimals):.8f}")
+    if size <= 0:
+        return {"status": "skipped", "filled": 0.0}
+    mid = (price_cache.get(symbol) or {}).get("mid_price")
+    book = await current_book(symbol)
+    if limit_price is None:
+        price = market_order_price(book["bids"], book["asks"], is_buy, size, runtime.market_slippage_tolerance,
+                                   sz_decimals, mid=mid)["limit_price"]
+        order_type = {"limit": {"tif": "Ioc"}}
+    else:
+        price = round_price(limit_price, sz_decimals)
+        order_type = {"limit": {"tif": "Gtc"}}
+    risk_engine.check(symbol, is_buy, size, price, mid=mid, leverage=None, asset=asset,
+                      account=account_state, book=book)
+    result = await upstream.exchange(exchange, "order", symbol, is_buy, size, price, order_type, reduce_only)
+    return {**parse_order_result(result), "price": price}
+
+
+async def child_fill_price(info_client, oid: int, filled: float) -> Optional[float]:
+    """Preço médio real de uma filha: livro de fills (userFills) ou, se ainda não chegou tudo, user_fills"""
+    seen, avg_price = ledger.order_fills(oid)
+    if avg_price is not None and seen >= filled - 1e-9:
+        return avg_price
+    fills = await upstream.info(info_client, "user_fills", account_state.user or runtime.account_address,
+                                priority=Priority.ACCOUNT)
+    matched = [(float(f["sz"]), float(f["px"])) for f in fills or [] if f.get("oid") == oid]
+    size = sum(sz for sz, _ in matched)
+    return sum(sz * px for sz, px in matched) / size if size else avg_price
+
+
+async def child_order_status(symbol: str, oid: int) -> dict:
+    """Estado de uma filha em repouso: da memória enquanto o feed de conta está vivo, senão orderStatus"""
+    order = account_state.open_orders.get(oid)
+    if order is not None and account_feed.connected:
+        filled = (order["orig_size"] or 0.0) - (order["size"] or 0.0)
+        return {"status": "open", "filled": filled, "avg_price": ledger.order_fills(oid)[1] if filled else None}
+    info_client = await get_info_client(Priority.ACCOUNT)
+    if info_client is None:
+        raise RuntimeError("Info client not initialized")
+    response = await upstream.info(info_client, "query_order_by_oid", account_state.user or runtime.account_address,
+                                   oid, priority=Priority.ACCOUNT)
+    entry = (response or {}).get("order") or {}
+    details = entry.get("order") or {}
+    filled = float(details.get("origSz") or 0) - float(details.get("sz") or 0)
+    avg_price = await child_fill_price(info_client, oid, filled) if filled > 0 else None
+    return {"status": entry.get("status", (response or {}).get("status", "unknown")), "filled": filled,
+            "avg_price": avg_price}
+
+
+async def cancel_child_order(symbol: str, oid: int):
+    await upstream.exchange(exchange, "cancel", symbol, oid)
+
+
+# Parent orders (TWAP / iceberg / POV) split into child orders; progress goes out on the account stream
+execution_scheduler = ExecutionScheduler(
+    submit_child_order, child_order_status, cancel_child_order,
+    market_volume=lambda symbol: traded_volume.get(symbol, 0.0),
+    volume_available=lambda: price_feed.running,
+    min_size=min_child_size,
+    on_update=lambda parent: account_broadcaster.publish(
+        "execution_update", {"type": "execution_update", **parent.progress()}),
+)
+
+
+async def start_execution(symbol: str, is_buy: bool, size: float, params: ExecutionParamsModel):
+    """Valida os parâmetros da estratégia e cria a ordem-mãe"""
+    if exchange is None and not await upstream.run(initialize_exchange, weight=CLIENT_INIT_WEIGHT,
+                                                   priority=Priority.ORDER):
+        raise HTTPException(status_code=500, detail="Exchange client not initialized")
+    try:
+        _, asset = find_asset(await market_cache.get_meta(Priority.ORDER), symbol)
+        size = float(f"{round(size, (asset or {}).get('szDecimals', 5)):.8f}")
+        if asset is not None and not min_child_size(symbol):
+            # Children are sized against the venue minimum, which needs a price for the symbol
+            await market_cache.get(symbol, priority=Priority.ORDER)
+        strategy_params = params.model_dump(include=set(ExecutionParamsModel.model_fields) - {"strategy"},
+                                            exclude_none=True)
+        parent = execution_scheduler.start(symbol, is_buy, size, params.strategy, strategy_params)
+    except MarketDataUnavailable as e:
+        raise HTTPException(status_code=503, detail=f"Could not load asset metadata: {e}")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    logger.info(f"🧩 Execution {parent.id} started: {params.strategy} {'buy' if is_buy else 'sell'} {size} {symbol}")
+    return parent
+
+
+@app.post("/api/executions")
+async def create_execution(request: ExecutionRequestModel):
+    """Cria uma ordem-mãe (twap, iceberg ou pov) executada em fatias; retorna o progresso inicial"""
+    symbol = request.symbol.upper()
+    size = request.size or 0.0
+    if request.quantity_usd:
+        price = request.limit_price or (price_cache.get(symbol) or {}).get("mid_price")
+        if not price:
+            try:
+                price = (await market_cache.get(symbol, priority=Priority.ORDER))["mid_price"]
+            except MarketDataUnavailable as e:
+                raise HTTPException(status_code=503, detail=f"No price to size quantity_usd: {e}")
+        size = request.quantity_usd / price
+    parent = await start_execution(symbol, request.side.lower() == "buy", size, request)
+    return {"success": True, "execution": parent.progress()}
+
+
+@app.get("/api/executions")
+async def list_executions(status: Optional[str] = None):
+    """Retorna as ordens-mãe (ativas e as últimas terminadas), opcionalmente filtradas por status"""
+    return {"executions": [p.progress() for p in execution_scheduler.list(status)],
+            "metrics": execution_scheduler.metrics()}
+
+
+@app.get("/api/executions/{execution_id}")
+async def get_execution(execution_id: str):
+    """Retorna o progresso de uma ordem-mãe"""
+    parent = execution_scheduler.get(execution_id)
+    if parent is None:
+        raise HTTPException(status_code=404, detail=f"Execution {execution_id} not found")
+    return {"success": True, "execution": parent.progress()}
+
+
+@app.delete("/api/executions/{execution_id}")
+async def cancel_execution(execution_id: str):
+    """Cancela uma ordem-mãe (e a fatia em repouso, se houver)"""
+    parent = await execution_scheduler.cancel(execution_id)
+    if parent is None:
+        raise HTTPException(status_code=404, detail=f"Execution {execution_id} not found")
+    return {"success": True, "execution": parent.progress()}
+
+
+async def submit_trigger_order(trigger: Trigger) -> dict:
+    """Ordem condicional de um gatilho disparado: a mercado (IOC pelo livro) ou limite GTC"""
+    order = trigger.order
+    limit_price = order.get("limit_price") if order.get("order_type") == "limit" else None
+    size = order.get("size") or order["quantity_usd"] / (limit_price or trigger.fired_price)
+    return await submit_child_order(trigger.symbol, order["side"] == "buy", size, limit_price,
+                                    order.get("reduce_only", False))
+
+
+# Price alerts and conditional orders, evaluated on every cached price tick (see publish_price)
+trigger_engine = TriggerEngine(
+    TRIGGERS_FILE,
+    submit_order=submit_trigger_order,
+    on_fire=lambda trigger: broadcaster.publish(
+        "trigger_fired", {"type": "trigger_fired", **trigger.as_dict()}, trigger.symbol),
+)
+
+
+@app.post("/api/triggers")
+async def create_trigger(request: TriggerRequestModel):
+    """Cria um alerta ou ordem condicional disparado quando o preço cruza `price`"""
+    symbol = request.symbol.upper()
+    direction = request.direction
+    if direction is None:
+        # "Crosses X": the side of X opposite to the current price
+        current = (price_cache.get(symbol) or {}).get("mid_price")
+        if not current:
+            raise HTTPException(status_code=400, detail=f"No current {symbol} price: give direction explicitly")
+        direction = "above" if request.price > current else "below"
+    order = request.order.model_dump() if request.order else None
+    if order:
+        if order["side"] not in ("buy", "sell"):
+            raise HTTPException(status_code=400, detail="Order side must be buy or sell")
+        if not order["size"] and not order["quantity_usd"]:
+            raise HTTPException(status_code=400, detail="Order needs size or quantity_usd")
+        if order["order_type"] == "limit" and not order["limit_price"]:
+            raise HTTPException(status_code=400, detail="Limit orders need limit_price")
+    try:
+        trigger = trigger_engine.add(symbol, request.price, direction, request.action, order, request.note)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"success": True, "trigger": trigger.as_dict()}
+
+
+@app.get("/api/triggers")
+async def list_triggers(symbol: Optional[str] = None, status: Optional[str] = None,
+                        limit: int = Query(1000, ge=1, le=100_000)):
+    """Retorna gatilhos ativos e os últimos disparados, com filtros por símbolo e status"""
+    triggers = trigger_engine.list(symbol.upper() if symbol else None, status, limit)
+    return Response(orjson.dumps({"triggers": [t.as_dict() for t in triggers], "metrics": trigger_engine.metrics()}),
+                    media_type="application/json")
+
+
+@app.get("/api/triggers/{trigger_id}")
+async def get_trigger(trigger_id: str):
+    """Retorna um gatilho (ativo ou disparado recentemente)"""
+    trigger = trigger_engine.get(trigger_id)
+    if trigger is None:
+        raise HTTPException(status_code=404, detail=f"Trigger {trigger_id} not found")
+    return {"success": True, "trigger": trigger.as_dict()}
+
+
+@app.delete("/api/triggers/{trigger_id}")
+async def cancel_trigger(trigger_id: str):
+    """Cancela um gatilho ativo"""
+    trigger = trigger_engine.cancel(trigger_id)
+    if trigger is None:
+        raise HTTPException(status_code=404, detail=f"Active trigger {trigger_id} not found")
+    return {"success": True, "trigger": trigger.as_dict()}
+
+
+async def rest_price_poller():
+    """Com clientes push e sem feed WebSocket, atualiza via REST uma vez para todos (não por cliente)"""
+    while True:
+        await asyncio.sleep(runtime.rest_poll_seconds)
+        if not broadcaster.subscriber_count or price_feed.running or not runtime.rest_enabled:
+            continue
+        symbols = [s for s in broadcaster.wanted_symbols(FEED_SYMBOLS) if s in price_cache]
+        await asyncio.gather(*(market_cache.refresh(symbol) for symbol in symbols), return_exceptions=True)
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Endpoints de diagnóstico: exigem X-Admin-Token quando ADMIN_TOKEN está configurado"""
+    if runtime.admin_token and x_admin_token != runtime.admin_token:
+        raise HTTPException(status_code=403, detail="Invalid or missing X-Admin-Token")
+
+
+class ProfileRequestModel(BaseModel):
+    route: str  # path template, e.g. "/api/order" or "/api/market/{symbol}"
+    count: int = Field(1, ge=1, le=100)
+    method: Optional[str] = None
+    sort: str = "cumulative"  # cumulative, tottime or ncalls
+    limit: int = Field(40, ge=1, le=500)  # functions per profile
+
+
+class SamplerRequestModel(BaseModel):
+    interval_ms: float = Field(10.0, ge=1, le=1000)
+    max_seconds: float = Field(300.0, gt=0, le=3600)
+
+
+@app.post("/api/debug/profile", dependencies=[Depends(require_admin)])
+async def arm_request_profile(request: ProfileRequestModel):
+    """Perfila (cProfile) as próximas `count` requisições que casarem com a rota"""
+    try:
+        session = request_profiler.arm(request.route, request.count, request.method, request.sort, request.limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    logger.info(f"🔬 Profiling next {request.count} request(s) to {request.route} ({session.id})")
+    return {"success": True, "session": session.summary(include_stats=False)}
+
+
+@app.get("/api/debug/profile", dependencies=[Depends(require_admin)])
+async def list_request_profiles():
+    """Retorna as sessões de profiling (sem as estatísticas)"""
+    return {"sessions": [s.summary(include_stats=False) for s in request_profiler.sessions.values()],
+            "metrics": request_profiler.metrics()}
+
+
+@app.get("/api/debug/profile/{session_id}", dependencies=[Depends(require_admin)])
+async def get_request_profile(session_id: str, format: str = "json"):
+    """Retorna os perfis capturados (format=text: saída do pstats em texto puro)"""
+    session = request_profiler.sessions.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail=f"Profile session {session_id} not found")
+    if format == "text":
+        return PlainTextResponse("\n".join(
+            f"### {p['method']} {p['path']} -> {p['status']} in {p['elapsed_ms']}ms\n{p['stats']}"
+            for p in session.profiles
+        ))
+    return {"success": True, "session": session.summary()}
+
+
+@app.delete("/api/debug/profile/{session_id}", dependencies=[Depends(require_admin)])
+async def cancel_request_profile(session_id: str):
+    """Descarta uma sessão de profiling (capturada ou não)"""
+    if request_profiler.cancel(session_id) is None:
+        raise HTTPException(status_code=404, detail=f"Profile session {session_id} not found")
+    return {"success": True}
+
+
+@app.post("/api/debug/sampler/start", dependencies=[Depends(require_admin)])
+async def start_sampler(request: SamplerRequestModel):
+    """Liga o profiler por amostragem em todas as threads (para sozinho após max_seconds)"""
+    try:
+        stack_sampler.start(request.interval_ms, request.max_seconds)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"success": True, "sampler": stack_sampler.status()}
+
+
+@app.post("/api/debug/sampler/stop", dependencies=[Depends(require_admin)])
+async def stop_sampler():
+    """Para o profiler por amostragem; as pilhas ficam disponíveis até o próximo start"""
+    await asyncio.to_thread(stack_sampler.stop)
+    return {"success": True, "sampler": stack_sampler.status()}
+
+
+@app.get("/api/debug/sampler", dependencies=[Depends(require_admin)])
+async def sampler_status(top: int = Query(10, ge=0, le=100)):
+    """Retorna o estado do profiler por amostragem e as pilhas mais frequentes"""
+    return stack_sampler.status(top)
+
+
+@app.get("/api/debug/sampler/folded", dependencies=[Depends(require_admin)])
+async def sampler_folded():
+    """Pilhas dobradas para flame graph (flamegraph.pl, speedscope, inferno)"""
+    return PlainTextResponse(stack_sampler.folded(), headers={
+        "Content-Disposition": f'attachment; filename="stacks-{datetime.now().strftime("%Y%m%d-%H%M%S")}.folded"',
+    })
+
+
+@app.get("/api/debug/tasks", dependencies=[Depends(require_admin)])
+async def dump_tasks(limit: int = Query(20, ge=1, le=200)):
+    """Retorna as tasks asyncio vivas e onde cada uma está parada"""
+    tasks = task_dump(limit)
+    return {"count": len(tasks), "tasks": tasks}
+
+
+@app.get("/api/debug/loop", dependencies=[Depends(require_admin)])
+async def debug_loop(stacks: bool = True):
+    """Retorna o histograma de atraso do event loop e os últimos travamentos com a pilha capturada"""
+    stalls = list(loop_monitor.stalls)[::-1]
+    if not stacks:
+        stalls = [{k: v for k, v in stall.items() if k != "stack"} for stall in stalls]
+    return {**loop_monitor.metrics(), "recent_stalls": stalls}
+
+
 @app.get("/api/debug/market")
 async def debug_market():
     """Endpoint de debug para verificar status do info_client"""
+    info_client = await get_info_client()
     debug_info = {
         "info_client_initialized": info_client is not None,
         "base_url": BASE_URL,
+        "ws_url": WS_URL,
         "test_results": {}
     }
     
     if info_client:
         try:
             # Test meta()
-            meta = info_client.meta()
+            meta = await upstream.info(info_client, "meta")
             debug_info["test_results"]["meta"] = {
                 "success": True,
                 "type": str(type(meta)),
@@ -545,7 +1514,7 @@ async def debug_market():
         
         try:
             # Test all_mids()
-            mids = info_client.all_mids()
+            mids = await upstream.info(info_client, "all_mids")
             first_5 = None
             if mids:
                 if isinstance(mids, dict):
@@ -568,7 +1537,7 @@ async def debug_market():
         
         try:
             # Test l2_snapshot for BTC
-            l2 = info_client.l2_snapshot("BTC")
+            l2 = await upstream.info(info_client, "l2_snapshot", "BTC")
             debug_info["test_results"]["l2_snapshot"] = {
                 "success": True,
                 "type": str(type(l2)),
@@ -589,7 +1558,7 @@ async def debug_market():
 async def get_logs(limit: int = 50):
     """Retorna os últimos logs de ordens"""
     try:
-        log_dir = "backend/logs"
+        log_dir = LOG_DIR
         today = datetime.now().strftime('%Y-%m-%d')
         log_file = os.path.join(log_dir, f"orders_{today}.txt")
         
@@ -620,27 +1589,44 @@ async def get_logs(limit: int = 50):
         }
 
 
+async def conditional_wait(if_none_match: Optional[str], wait: float, symbol: Optional[str] = None) -> Optional[Response]:
+    """304 se o cliente já tem a versão atual; com wait > 0, segura até a versão avançar"""
+    etag = price_cache.etag(symbol)
+    if etag_matches(if_none_match, etag) and wait > 0:
+        await price_cache.wait_for_change(price_cache.version(symbol), symbol, min(wait, MAX_LONG_POLL_SECONDS))
+        etag = price_cache.etag(symbol)
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return None
+
+
 @app.get("/api/cache/prices")
-async def get_cached_prices():
-    """Retorna todos os preços do cache centralizado"""
-    return {
-        "success": True,
-        "cache": price_cache,
-        "timestamp": datetime.now().isoformat()
-    }
+async def get_cached_prices(wait: float = 0, if_none_match: Optional[str] = Header(None)):
+    """Retorna todos os preços do cache centralizado (ETag/304; ?wait=N faz long-poll até mudar)"""
+    not_modified = await conditional_wait(if_none_match, wait)
+    if not_modified is not None:
+        return not_modified
+    # Pre-serialized bytes, regenerated only after the board changes
+    return Response(
+        content=price_cache.board_body(),
+        media_type="application/json",
+        headers={"ETag": price_cache.etag(), "Cache-Control": "no-cache"}
+    )
 
 
 @app.get("/api/cache/prices/{symbol}")
-async def get_cached_price(symbol: str):
-    """Retorna preço do cache para um símbolo específico"""
+async def get_cached_price(symbol: str, wait: float = 0, if_none_match: Optional[str] = Header(None)):
+    """Retorna preço do cache para um símbolo específico (ETag/304; ?wait=N faz long-poll até mudar)"""
     symbol_upper = symbol.upper()
     if symbol_upper in price_cache:
-        return {
-            "success": True,
-            "symbol": symbol_upper,
-            "data": price_cache[symbol_upper],
-            "timestamp": datetime.now().isoformat()
-        }
+        not_modified = await conditional_wait(if_none_match, wait, symbol_upper)
+        if not_modified is not None:
+            return not_modified
+        return Response(
+            content=price_cache.symbol_body(symbol_upper),
+            media_type="application/json",
+            headers={"ETag": price_cache.etag(symbol_upper), "Cache-Control": "no-cache"}
+        )
     return {
         "success": False,
         "error": f"Symbol {symbol_upper} not found in cache",
@@ -648,282 +1634,50 @@ async def get_cached_price(symbol: str):
     }
 
 
+@app.get("/api/market")
+async def get_market_snapshot(symbols: Optional[str] = None):
+    """Retorna mid, topo do livro, spread e idade de vários símbolos (symbols=BTC,ETH ou all) numa resposta.
+
+    Os frescos saem do store local; os demais custam um único all_mids upstream para todos.
+    """
+    wanted = parse_symbols(symbols)
+    try:
+        snapshot = await market_cache.get_many(sorted(wanted) if wanted is not None else None)
+    except MarketDataUnavailable as e:
+        headers = None
+        if isinstance(e.__cause__, CircuitOpenError):
+            headers = {"Retry-After": str(max(1, round(e.__cause__.retry_after)))}
+        raise HTTPException(status_code=503, detail={"error": str(e), "stale": None}, headers=headers)
+    return Response(orjson.dumps({"success": True, "timestamp": datetime.now().isoformat(), **snapshot}),
+                    media_type="application/json")
+
+
 @app.get("/api/market/{symbol}")
 async def get_market_data(symbol: str):
-    """Retorna dados de mercado para o símbolo especificado - usa cache quando disponível"""
-    global info_client, price_cache  # Declare global at the start of the function
+    """Retorna dados de mercado para o símbolo - cache com stale-while-revalidate e fetches coalescidos"""
     symbol_upper = symbol.upper()
-    
-    # Check cache first - if cache is recent (less than 5 seconds old), use it
-    if symbol_upper in price_cache:
-        cached = price_cache[symbol_upper]
-        if cached.get("last_update") and cached.get("mid_price"):
-            try:
-                last_update = datetime.fromisoformat(cached["last_update"])
-                age_seconds = (datetime.now() - last_update).total_seconds()
-                if age_seconds < 5:  # Cache is fresh (less than 5 seconds old)
-                    logger.info(f"✅ Using cached price for {symbol_upper}: {cached.get('mid_price')} (age: {age_seconds:.2f}s)")
-                    return {
-                        "symbol": symbol_upper,
-                        "mid_price": cached.get("mid_price"),
-                        "bid_price": cached.get("bid_price"),
-                        "ask_price": cached.get("ask_price"),
-                        "spread": cached.get("spread"),
-                        "spread_percent": (cached.get("spread") / cached.get("mid_price")) * 100 if cached.get("spread") and cached.get("mid_price") else None,
-                        "source": cached.get("source", "cache"),
-                        "cached": True,
-                        "last_update": cached.get("last_update")
-                    }
-            except Exception as e:
-                logger.warning(f"Error checking cache age: {e}, fetching fresh data")
-    
-    # Try to get real market data from Hyperliquid API
-    if not info_client:
-        logger.error("=" * 80)
-        logger.error("❌ Info client not initialized!")
-        logger.error("=" * 80)
-        mock_prices = {
-            "BTC": 109950.5,
-            "ETH": 3500.0,
-            "SOL": 150.0,
-        }
-        return {
-            "symbol": symbol,
-            "asset_index": 0,
-            "mid_price": mock_prices.get(symbol_upper, 1000.0),
-            "bid_price": None,
-            "ask_price": None,
-            "spread": None,
-            "spread_percent": None,
-            "warning": "Info client not initialized - using mock data",
-            "error": "Info client is None"
-        }
-    
-    # Try to reinitialize if needed
-    if info_client is None:
-        try:
-            logger.warning("Attempting to reinitialize info_client...")
-            info_client = Info(base_url=BASE_URL, skip_ws=True)
-            logger.info("✅ Info client reinitialized successfully")
-        except Exception as e:
-            logger.error(f"Failed to reinitialize info_client: {e}")
-    
+    # Fresh hit: pre-encoded bytes, no dict building or JSON encoding per request
+    body = market_cache.encoded_hit(symbol_upper)
+    if body is not None:
+        return Response(content=body, media_type="application/json")
     try:
-        logger.info(f"Getting market data for {symbol_upper}...")
-        logger.info(f"Info client initialized: {info_client is not None}")
-        
-        # Get metadata to find asset index
-        logger.info("Calling info_client.meta()...")
-        meta = info_client.meta()
-        logger.info(f"Meta response type: {type(meta)}")
-        logger.info(f"Meta keys: {list(meta.keys()) if isinstance(meta, dict) else 'Not a dict'}")
-        
-        if not meta or "universe" not in meta:
-            logger.error(f"Meta response: {meta}")
-            raise Exception("Could not get metadata or 'universe' not found")
-        
-        # Find asset index for the symbol
-        asset_index = None
-        for i, asset in enumerate(meta.get("universe", [])):
-            if asset.get("name") == symbol_upper:
-                asset_index = i
-                break
-        
-        if asset_index is None:
-            raise Exception(f"Symbol {symbol_upper} not found in universe")
-        
-        # Get mid prices from all_mids()
-        logger.info(f"Calling info_client.all_mids()...")
-        logger.info(f"Looking for asset_index: {asset_index}")
-        market_data = info_client.all_mids()
-        logger.info(f"Market data type: {type(market_data)}")
-        logger.info(f"Market data length: {len(market_data) if market_data else 0}")
-        
-        # Handle both dict and list responses
-        if isinstance(market_data, dict):
-            # If it's a dict, try to get by symbol name first, then by asset_index
-            if symbol_upper in market_data:
-                mid_price = float(market_data[symbol_upper])
-                logger.info(f"Mid price for {symbol_upper} from dict: {mid_price}")
-            else:
-                # Try to convert to list if keys are numeric
-                market_list = list(market_data.values()) if market_data else []
-                if asset_index < len(market_list):
-                    mid_price = float(market_list[asset_index])
-                    logger.info(f"Mid price for {symbol_upper} at index {asset_index} from dict values: {mid_price}")
-                else:
-                    raise Exception(f"Asset index {asset_index} out of range (market data length: {len(market_list)})")
-        elif isinstance(market_data, list):
-            # If it's a list, access by index
-            if asset_index >= len(market_data):
-                raise Exception(f"Asset index {asset_index} out of range (market data length: {len(market_data)})")
-            mid_price = float(market_data[asset_index])
-            logger.info(f"Mid price for {symbol_upper} at index {asset_index}: {mid_price}")
-        else:
-            raise Exception(f"Unexpected market_data type: {type(market_data)}")
-        
-        if not market_data:
-            raise Exception("all_mids() returned None or empty")
-        
-        if not mid_price or mid_price <= 0:
-            raise Exception(f"Invalid mid price: {mid_price}")
-        
-        # Get bid/ask from l2_snapshot
-        bid_price = None
-        ask_price = None
-        spread = None
-        spread_percent = None
-        
-        try:
-            l2_data = info_client.l2_snapshot(symbol_upper)
-            logger.info(f"L2 snapshot data for {symbol_upper}: {l2_data}")
-            
-            if l2_data:
-                # l2_snapshot typically returns: {"levels": [[price, size], ...]}
-                # Or might be: {"bids": [[price, size], ...], "asks": [[price, size], ...]}
-                # Or might be: [[price, size], ...] directly
-                
-                # Try different possible structures
-                if isinstance(l2_data, dict):
-                    # Check for "levels" key
-                    if "levels" in l2_data:
-                        levels = l2_data["levels"]
-                    # Check for "bids" and "asks" keys
-                    elif "bids" in l2_data and "asks" in l2_data:
-                        bids = l2_data["bids"]
-                        asks = l2_data["asks"]
-                        if bids and len(bids) > 0 and isinstance(bids[0], (list, tuple)) and len(bids[0]) >= 1:
-                            bid_price = float(bids[0][0])
-                        if asks and len(asks) > 0 and isinstance(asks[0], (list, tuple)) and len(asks[0]) >= 1:
-                            ask_price = float(asks[0][0])
-                    # Check for "data" key that might contain levels
-                    elif "data" in l2_data and isinstance(l2_data["data"], dict):
-                        if "levels" in l2_data["data"]:
-                            levels = l2_data["data"]["levels"]
-                        elif "bids" in l2_data["data"] and "asks" in l2_data["data"]:
-                            bids = l2_data["data"]["bids"]
-                            asks = l2_data["data"]["asks"]
-                            if bids and len(bids) > 0 and isinstance(bids[0], (list, tuple)) and len(bids[0]) >= 1:
-                                bid_price = float(bids[0][0])
-                            if asks and len(asks) > 0 and isinstance(asks[0], (list, tuple)) and len(asks[0]) >= 1:
-                                ask_price = float(asks[0][0])
-                    else:
-                        # Try to find any list-like structure
-                        for key, value in l2_data.items():
-                            if isinstance(value, list) and len(value) > 0:
-                                levels = value
-                                break
-                    
-                    # If we have levels but not bid/ask yet, parse them
-                    if 'levels' in locals() and levels and bid_price is None and ask_price is None:
-                        if isinstance(levels, list) and len(levels) > 0:
-                            # Try to parse levels - they might be [price, size] pairs
-                            for level in levels:
-                                if isinstance(level, (list, tuple)) and len(level) >= 1:
-                                    price = float(level[0])
-                                    # Find best bid (highest price below mid) and best ask (lowest price above mid)
-                                    if price < mid_price:
-                                        if bid_price is None or price > bid_price:
-                                            bid_price = price
-                                    elif price > mid_price:
-                                        if ask_price is None or price < ask_price:
-                                            ask_price = price
-                
-                elif isinstance(l2_data, list):
-                    # l2_data is directly a list of levels
-                    levels = l2_data
-                    for level in levels:
-                        if isinstance(level, (list, tuple)) and len(level) >= 1:
-                            price = float(level[0])
-                            if price < mid_price:
-                                if bid_price is None or price > bid_price:
-                                    bid_price = price
-                            elif price > mid_price:
-                                if ask_price is None or price < ask_price:
-                                    ask_price = price
-                
-                # Calculate spread
-                if bid_price and ask_price:
-                    spread = ask_price - bid_price
-                    spread_percent = (spread / mid_price) * 100 if mid_price > 0 else 0
-                    logger.info(f"Bid/Ask from l2_snapshot: bid={bid_price}, ask={ask_price}, spread={spread}")
-                elif bid_price or ask_price:
-                    logger.warning(f"Only partial bid/ask data: bid={bid_price}, ask={ask_price}")
-                    
-        except Exception as e:
-            logger.warning(f"Could not get bid/ask from l2_snapshot: {e}")
-            import traceback
-            logger.warning(traceback.format_exc())
-        
-        # Fallback: estimate bid/ask from mid price (±0.1%) if not available
-        if not bid_price or not ask_price:
-            if mid_price:
-                if not bid_price:
-                    bid_price = mid_price * 0.999
-                if not ask_price:
-                    ask_price = mid_price * 1.001
-                spread = ask_price - bid_price
-                spread_percent = (spread / mid_price) * 100 if mid_price > 0 else 0
-                logger.info(f"Using estimated bid/ask from mid: bid={bid_price}, ask={ask_price}")
-        
-        logger.info(f"Market data for {symbol_upper}: mid={mid_price}, bid={bid_price}, ask={ask_price}, spread={spread}")
-        
-        # Update cache with fresh REST data
-        price_cache[symbol_upper] = {
-            "mid_price": mid_price,
-            "bid_price": bid_price,
-            "ask_price": ask_price,
-            "spread": spread,
-            "last_update": datetime.now().isoformat(),
-            "source": "rest"
-        }
-        
-        return {
-            "symbol": symbol_upper,
-            "asset_index": asset_index,
-            "mid_price": mid_price,
-            "bid_price": bid_price,
-            "ask_price": ask_price,
-            "spread": spread,
-            "spread_percent": spread_percent,
-            "calculated_mid": (bid_price + ask_price) / 2 if (bid_price and ask_price) else mid_price,
-            "source": "rest",
-            "cached": False
-        }
-        
-    except Exception as e:
-        logger.error("=" * 80)
-        logger.error(f"❌ ERRO ao obter dados de mercado para {symbol_upper}:")
-        logger.error(f"   Tipo: {type(e).__name__}")
-        logger.error(f"   Mensagem: {str(e)}")
-        logger.error("=" * 80)
-        import traceback
-        logger.error(traceback.format_exc())
-        
-        # Fallback to mock data on error
-        mock_prices = {
-            "BTC": 109950.5,
-            "ETH": 3500.0,
-            "SOL": 150.0,
-        }
-        return {
-            "symbol": symbol_upper,
-            "asset_index": 0,
-            "mid_price": mock_prices.get(symbol_upper, 1000.0),
-            "bid_price": None,
-            "ask_price": None,
-            "spread": None,
-            "spread_percent": None,
-            "error": str(e),
-            "warning": f"Error getting real-time data: {e} - using mock data"
-        }
-    
+        return await market_cache.get(symbol_upper)
+    except MarketDataUnavailable as e:
+        # No good value to serve: say so instead of returning made-up prices
+        headers = None
+        if isinstance(e.__cause__, CircuitOpenError):
+            headers = {"Retry-After": str(max(1, round(e.__cause__.retry_after)))}
+        raise HTTPException(
+            status_code=503,
+            detail={"symbol": symbol_upper, "error": str(e), "stale": None},
+            headers=headers
+        )
 
 
 def log_order_request(order_data: dict, result: dict = None, error: str = None):
     """Log order request to file"""
     try:
-        log_dir = "backend/logs"
+        log_dir = LOG_DIR
         os.makedirs(log_dir, exist_ok=True)
         log_file = os.path.join(log_dir, f"orders_{datetime.now().strftime('%Y-%m-%d')}.txt")
         
@@ -973,7 +1727,7 @@ async def create_order(order: OrderRequestModel):
         # Try to initialize exchange if not already done
         if not exchange:
             logger.warning("Exchange client nao inicializado. Tentando inicializar...")
-            if not initialize_exchange():
+            if not await upstream.run(initialize_exchange, weight=CLIENT_INIT_WEIGHT, priority=Priority.ORDER):
                 error_msg = "Exchange client not initialized. Please check your .env file and ensure ACCOUNT_ADDRESS and SECRET_KEY are set correctly (not the example values)."
                 logger.error(f"ERRO: {error_msg}")
                 log_order_request(order_data, error=error_msg)
@@ -982,7 +1736,7 @@ async def create_order(order: OrderRequestModel):
                     detail=error_msg
                 )
         
-        if not ACCOUNT_ADDRESS or not SECRET_KEY:
+        if not runtime.account_address or not runtime.secret_key:
             raise HTTPException(
                 status_code=500,
                 detail="ACCOUNT_ADDRESS and SECRET_KEY must be set in .env file"
@@ -1000,20 +1754,12 @@ async def create_order(order: OrderRequestModel):
                 price_for_calc = order.price
                 logger.info(f"Using limit price for size calculation: {price_for_calc}")
             else:
-                # Get current market price
+                # Get current market price (cached mid is good enough for sizing)
                 try:
-                    market_data = info_client.all_mids() if info_client else None
-                    meta = info_client.meta() if info_client else None
-                    if meta and market_data:
-                        asset_index = None
-                        for i, asset in enumerate(meta.get("universe", [])):
-                            if asset["name"] == order.symbol:
-                                asset_index = i
-                                break
-                        if asset_index is not None and asset_index < len(market_data):
-                            price_for_calc = market_data[asset_index]
-                            if price_for_calc and price_for_calc > 0:
-                                logger.info(f"Using market price for size calculation: {price_for_calc}")
+                    snapshot = await market_cache.get(order.symbol.upper(), priority=Priority.ORDER)
+                    price_for_calc = snapshot.get("mid_price")
+                    if price_for_calc and price_for_calc > 0:
+                        logger.info(f"Using market price for size calculation: {price_for_calc}")
                 except Exception as e:
                     logger.warning(f"Could not get market price for size calculation: {e}")
             
@@ -1023,11 +1769,11 @@ async def create_order(order: OrderRequestModel):
         
         # Round size to appropriate precision based on asset szDecimals
         # This is CRITICAL to avoid float_to_wire rounding errors
-        if size > 0 and info_client:
+        if size > 0:
             try:
-                meta = info_client.meta() if info_client else None
+                meta = await market_cache.get_meta(Priority.ORDER)
                 if meta:
-                    asset_info = next((a for a in meta.get("universe", []) if a["name"] == order.symbol.upper()), None)
+                    _, asset_info = find_asset(meta, order.symbol.upper())
                     if asset_info and "szDecimals" in asset_info:
                         sz_decimals = asset_info["szDecimals"]
                         logger.info(f"Asset {order.symbol.upper()} uses szDecimals: {sz_decimals}")
@@ -1051,13 +1797,25 @@ async def create_order(order: OrderRequestModel):
                 size = float(size_str)
                 logger.warning(f"Using fallback rounding to 5 decimals: {size}")
         
-        # Set leverage if provided
-        if order.leverage and order.leverage > 0:
-            try:
-                # Update leverage for the symbol
-                exchange.update_leverage(order.leverage, order.symbol, False)
-            except Exception as e:
-                print(f"Warning: Could not set leverage: {e}")
+        # Large orders can be worked as a parent order instead of one IOC
+        if order.execution is not None:
+            params = order.execution
+            if params.limit_price is None and order.order_type.lower() == "limit" and order.price:
+                params = params.model_copy(update={"limit_price": order.price})
+            parent = await start_execution(order.symbol.upper(), is_buy, size, params)
+            response_data = {"success": True, "execution": parent.progress()}
+            log_order_request(order_data, result=response_data)
+            return response_data
+        
+        # Price precision follows the asset's szDecimals (max 6 - szDecimals decimals, 5 significant figures)
+        symbol_upper = order.symbol.upper()
+        try:
+            _, asset_px = find_asset(await market_cache.get_meta(Priority.ORDER), symbol_upper)
+        except MarketDataUnavailable:
+            asset_px = None
+        # Unknown asset: the BTC default allows fewer decimals, which is always a valid price
+        price_sz_decimals = (asset_px or {}).get("szDecimals", 5)
+        pricing = None
         
         # Build order type - validate order_type explicitly
         order_type_str = order.order_type.lower().strip()
@@ -1072,39 +1830,31 @@ async def create_order(order: OrderRequestModel):
             # This ensures we get the most current price for immediate execution
             try:
                 logger.info("🔄 Fetching FRESH market price for market order (ensuring real-time price)...")
-                market_data_result = await get_market_data(order.symbol)
+                # Never price a market order off a stale value: wait for a (coalesced) refresh
+                market_data_result = await market_cache.get(order.symbol.upper(), allow_stale=False,
+                                                            priority=Priority.ORDER)
                 
                 if not market_data_result:
                     raise Exception("Could not fetch market data")
                 
                 # Get reference price (mid_price) for validation
                 reference_price = market_data_result.get("mid_price")
-                ask_price = market_data_result.get("ask_price")
-                bid_price = market_data_result.get("bid_price")
                 
                 if not reference_price or reference_price <= 0:
                     raise Exception("Invalid reference price from market data")
                 
-                if order.side.lower() == "buy":
-                    # For BUY orders: use ask_price + small margin to be very aggressive
-                    if ask_price and ask_price > 0:
-                        # Use ask_price + 0.1% to ensure we can buy immediately
-                        price = float(ask_price) * 1.001
-                        logger.info(f"Market BUY using ask_price + 0.1%: {price} (ask: {ask_price}, mid: {reference_price})")
-                    else:
-                        # Fallback: use mid_price + 0.2% to be aggressive
-                        price = float(reference_price) * 1.002
-                        logger.info(f"Market BUY using mid_price + 0.2%: {price} (mid: {reference_price})")
-                else:  # sell
-                    # For SELL orders: use bid_price - small margin to be very aggressive
-                    if bid_price and bid_price > 0:
-                        # Use bid_price - 0.1% to ensure we can sell immediately
-                        price = float(bid_price) * 0.999
-                        logger.info(f"Market SELL using bid_price - 0.1%: {price} (bid: {bid_price}, mid: {reference_price})")
-                    else:
-                        # Fallback: use mid_price - 0.2% to be aggressive
-                        price = float(reference_price) * 0.998
-                        logger.info(f"Market SELL using mid_price - 0.2%: {price} (mid: {reference_price})")
+                # Walk the cached L2 depth for the requested size (refreshed first if it's old)
+                book = await current_book(symbol_upper)
+                pricing = market_order_price(
+                    book["bids"], book["asks"], is_buy, size, runtime.market_slippage_tolerance,
+                    price_sz_decimals, mid=reference_price,
+                )
+                price = pricing["limit_price"]
+                if pricing["depth_exhausted"]:
+                    logger.warning(f"⚠️ Visible depth ({pricing['filled']} over {pricing['book_levels']} levels) "
+                                   f"is smaller than the order size {size}; IOC may fill partially")
+                logger.info(f"Market {order.side.upper()} priced from depth: vwap={pricing['vwap']}, "
+                            f"worst={pricing['worst_price']}, limit={price} (tolerance {pricing['tolerance']:.3%})")
                 
                 # Validate price is within Hyperliquid's acceptable range (20% to 180% of reference)
                 min_valid_price = reference_price * 0.2
@@ -1112,15 +1862,12 @@ async def create_order(order: OrderRequestModel):
                 
                 if price < min_valid_price:
                     logger.warning(f"Price {price} below minimum {min_valid_price}, adjusting...")
-                    price = min_valid_price
+                    price = round_price(min_valid_price, price_sz_decimals, "up")
                 elif price > max_valid_price:
                     logger.warning(f"Price {price} above maximum {max_valid_price}, adjusting...")
-                    price = max_valid_price
+                    price = round_price(max_valid_price, price_sz_decimals, "down")
                 
-                # For market orders, round to integer (no decimals) - Hyperliquid requirement
-                # Market orders should be sent as whole numbers (e.g., 100795 instead of 100795.11)
-                price = round(price)
-                logger.info(f"✅ Market order final price (rounded to integer): {price} (side: {order.side}, reference: {reference_price:.2f}, range: {min_valid_price:.2f}-{max_valid_price:.2f})")
+                logger.info(f"✅ Market order final price: {price} (side: {order.side}, reference: {reference_price}, range: {min_valid_price:.6g}-{max_valid_price:.6g})")
                     
             except Exception as e:
                 logger.error(f"Error getting market price for market order: {e}")
@@ -1135,9 +1882,7 @@ async def create_order(order: OrderRequestModel):
             order_type = {"limit": {"tif": "Gtc"}}  # Good Till Cancel - order stays in book until executed or cancelled
             logger.info("📅 Creating LIMIT order - will be SCHEDULED in order book (not executed immediately)")
             
-            # For limit orders, validate and round price to tick size
-            # Hyperliquid BTC tick size is 0.01 (2 decimal places)
-            # Round to 2 decimal places to match valid tick size
+            # For limit orders, validate and round price to the asset's tick / significant figures
             price = float(order.price) if order.price and order.price > 0 else None
             
             if not price:
@@ -1146,59 +1891,36 @@ async def create_order(order: OrderRequestModel):
                     detail="Price must be specified for limit orders. Limit orders are scheduled in the order book and require a price."
                 )
             
-            # Round to 2 decimal places (tick size 0.01)
-            price = round(price, 2)
-            logger.info(f"Limit order price (rounded to 2 decimals): {price}")
+            price = round_price(price, price_sz_decimals)
+            logger.info(f"Limit order price (rounded to a valid tick): {price}")
             
             # Validate price is within 80% of reference price (20% to 180% of mid price)
             # Hyperliquid requires: price cannot be more than 80% away from reference
             try:
-                # Get current market price for validation
-                market_data = info_client.all_mids() if info_client else None
-                meta = info_client.meta() if info_client else None
-                if meta and market_data:
-                    asset_index = None
-                    for i, asset in enumerate(meta.get("universe", [])):
-                        if asset["name"] == order.symbol:
-                            asset_index = i
-                            break
-                    if asset_index is not None:
-                        # Get reference price
-                        if isinstance(market_data, dict):
-                            reference_price = market_data.get(order.symbol.upper()) or market_data.get(order.symbol)
-                            if reference_price is None:
-                                market_list = list(market_data.values())
-                                if asset_index < len(market_list):
-                                    reference_price = market_list[asset_index]
-                                else:
-                                    reference_price = None
-                            else:
-                                reference_price = float(reference_price)
-                        elif isinstance(market_data, list) and asset_index < len(market_data):
-                            reference_price = float(market_data[asset_index])
-                        else:
-                            reference_price = None
-                        
-                        if reference_price and reference_price > 0:
-                            min_price = reference_price * 0.2  # 20% of reference
-                            max_price = reference_price * 1.8  # 180% of reference
-                            
-                            if price < min_price or price > max_price:
-                                error_msg = (
-                                    f"Order price cannot be more than 80% away from the reference price. "
-                                    f"Reference price: {reference_price:.2f}, "
-                                    f"Valid range: {min_price:.2f} - {max_price:.2f}, "
-                                    f"Your price: {price:.2f}"
-                                )
-                                logger.error(f"❌ {error_msg}")
-                                log_order_request(order_data, error=error_msg)
-                                raise HTTPException(
-                                    status_code=400,
-                                    detail=error_msg
-                                )
-                            logger.info(f"✅ Price validation OK: {price:.2f} is within range ({min_price:.2f} - {max_price:.2f})")
-                        else:
-                            logger.warning(f"Could not get reference price for validation, proceeding anyway...")
+                # Get current market price for validation (cached mid; the band is ±80%)
+                snapshot = await market_cache.get(order.symbol.upper(), priority=Priority.ORDER)
+                reference_price = snapshot.get("mid_price") if snapshot else None
+                
+                if reference_price and reference_price > 0:
+                    min_price = reference_price * 0.2  # 20% of reference
+                    max_price = reference_price * 1.8  # 180% of reference
+                    
+                    if price < min_price or price > max_price:
+                        error_msg = (
+                            f"Order price cannot be more than 80% away from the reference price. "
+                            f"Reference price: {reference_price:.2f}, "
+                            f"Valid range: {min_price:.2f} - {max_price:.2f}, "
+                            f"Your price: {price:.2f}"
+                        )
+                        logger.error(f"❌ {error_msg}")
+                        log_order_request(order_data, error=error_msg)
+                        raise HTTPException(
+                            status_code=400,
+                            detail=error_msg
+                        )
+                    logger.info(f"✅ Price validation OK: {price:.2f} is within range ({min_price:.2f} - {max_price:.2f})")
+                else:
+                    logger.warning(f"Could not get reference price for validation, proceeding anyway...")
             except HTTPException:
                 raise
             except Exception as e:
@@ -1211,12 +1933,11 @@ async def create_order(order: OrderRequestModel):
             # Get szDecimals for final rounding
             sz_decimals_final = 5  # Default for BTC
             try:
-                if info_client:
-                    meta_final = info_client.meta() if info_client else None
-                    if meta_final:
-                        asset_info_final = next((a for a in meta_final.get("universe", []) if a["name"] == order.symbol.upper()), None)
-                        if asset_info_final and "szDecimals" in asset_info_final:
-                            sz_decimals_final = asset_info_final["szDecimals"]
+                meta_final = await market_cache.get_meta(Priority.ORDER)
+                if meta_final:
+                    _, asset_info_final = find_asset(meta_final, order.symbol.upper())
+                    if asset_info_final and "szDecimals" in asset_info_final:
+                        sz_decimals_final = asset_info_final["szDecimals"]
             except:
                 pass
             
@@ -1246,6 +1967,39 @@ async def create_order(order: OrderRequestModel):
                 detail=error_msg
             )
         
+        # Pre-trade risk: in-memory rules only, evaluated before anything is signed
+        try:
+            meta_risk = await market_cache.get_meta(Priority.ORDER)
+        except MarketDataUnavailable:
+            meta_risk = None
+        _, asset_risk = find_asset(meta_risk, symbol_upper) if meta_risk else (None, None)
+        try:
+            risk_result = risk_engine.check(
+                symbol_upper, is_buy, size, price,
+                mid=(price_cache.get(symbol_upper) or {}).get("mid_price"),
+                leverage=order.leverage,
+                asset=asset_risk,
+                account=account_state,
+                book=market_cache.book(symbol_upper, max_age=60.0),
+            )
+        except RiskRejected as e:
+            error_msg = f"Pre-trade risk check failed: {e}"
+            logger.error(f"🛑 {error_msg}")
+            log_order_request(order_data, error=error_msg)
+            raise HTTPException(
+                status_code=400,
+                detail=error_msg
+            )
+        logger.info(f"✅ Pre-trade risk OK: {risk_result}")
+        
+        # Set leverage if provided
+        if order.leverage and order.leverage > 0:
+            try:
+                # Update leverage for the symbol
+                await upstream.exchange(exchange, "update_leverage", order.leverage, order.symbol, False)
+            except Exception as e:
+                print(f"Warning: Could not set leverage: {e}")
+        
         # Log final order details before sending
         if order.order_type.lower() == "market":
             logger.info(f"🚀 Enviando ORDEM MARKET (execução imediata)...")
@@ -1283,7 +2037,9 @@ async def create_order(order: OrderRequestModel):
                 )
             logger.info(f"✅ Limit order structure validated: {order_type} - will be SCHEDULED in order book")
         
-        result = exchange.order(
+        result = await upstream.exchange(
+            exchange,
+            "order",
             order.symbol,
             is_buy,
             size,
@@ -1311,7 +2067,9 @@ async def create_order(order: OrderRequestModel):
                 "leverage": order.leverage,
                 "takeprofit": order.takeprofit,
                 "stoploss": order.stoploss
-            }
+            },
+            "pricing": pricing,
+            "risk": risk_result
         }
         
         # Log to file
@@ -1326,6 +2084,16 @@ async def create_order(order: OrderRequestModel):
         logger.error("=" * 80)
         log_order_request(order_data, error=error_msg)
         raise
+    except CircuitOpenError as e:
+        # Exchange endpoint is known to be down: answer now instead of waiting out a timeout
+        error_msg = f"Exchange unavailable: {e}"
+        logger.error(f"❌ {error_msg}")
+        log_order_request(order_data, error=error_msg)
+        raise HTTPException(
+            status_code=503,
+            detail=error_msg,
+            headers={"Retry-After": str(max(1, round(e.retry_after)))}
+        )
     except Exception as e:
         error_msg = f"Error creating order: {str(e)}"
         logger.error("=" * 80)
@@ -1341,3 +2109,114 @@ async def create_order(order: OrderRequestModel):
             detail=error_msg
         )
 
+
+def exchange_statuses(result: dict, action: str) -> list:
+    """Status por item de uma ação em lote; erro da ação inteira vira 502"""
+    if not isinstance(result, dict) or result.get("status") != "ok":
+        raise HTTPException(status_code=502, detail=f"{action} rejected by exchange: {(result or {}).get('response', result)}")
+    return result.get("response", {}).get("data", {}).get("statuses", [])
+
+
+async def fresh_open_orders():
+    """Garante o índice de ordens abertas: semeia se preciso, REST se o feed de conta está parado"""
+    if not account_state.user:
+        raise HTTPException(status_code=503, detail="ACCOUNT_ADDRESS not configured")
+    if exchange is None and not await upstream.run(initialize_exchange, weight=CLIENT_INIT_WEIGHT,
+                                                   priority=Priority.ORDER):
+        raise HTTPException(status_code=500, detail="Exchange client not initialized")
+    if account_state.needs_rest(account_feed.connected):
+        try:
+            await account_state.seed(Priority.ORDER)
+        except AccountUnavailable as e:
+            raise HTTPException(status_code=503, detail=f"Open orders unavailable: {e}")
+
+
+def parse_order_id(order_id: str) -> Union[int, str]:
+    return int(order_id) if order_id.isdigit() else order_id
+
+
+@app.delete("/api/orders")
+async def cancel_orders(oid: List[int] = Query(default=[]), cloid: List[str] = Query(default=[]),
+                        symbol: Optional[str] = None, all: bool = False):
+    """Cancela ordens abertas por oid, cloid, símbolo ou todas, numa única ação de cancelamento em lote"""
+    if not (oid or cloid or symbol or all):
+        raise HTTPException(status_code=400, detail="Give oid, cloid, symbol or all=true")
+    try:
+        await fresh_open_orders()
+        orders, missing = account_state.select_orders(oid, cloid, symbol.upper() if symbol else None, all)
+        if missing and account_feed.connected:
+            # Placed a moment ago and the orderUpdates push hasn't landed yet: check the exchange once
+            await account_state.seed(Priority.ORDER)
+            orders, missing = account_state.select_orders(oid, cloid, symbol.upper() if symbol else None, all)
+        canceled, failed = [], []
+        if orders:
+            requests = [{"coin": o["coin"], "oid": o["oid"]} for o in orders]
+            result = await upstream.exchange(exchange, "bulk_cancel", requests, batch_length=len(requests))
+            for order, status in zip(orders, exchange_statuses(result, "Cancel")):
+                if status == "success":
+                    canceled.append(order["oid"])
+                else:
+                    failed.append({"oid": order["oid"], "coin": order["coin"],
+                                   "error": status.get("error", str(status)) if isinstance(status, dict) else str(status)})
+            account_state.drop_orders(canceled)
+        logger.info(f"🗑️ Canceled {len(canceled)}/{len(orders)} orders ({len(missing)} not open)")
+        return {"success": not failed and not missing, "requested": len(orders), "canceled": canceled,
+                "failed": failed, "not_found": missing}
+    except AccountUnavailable as e:
+        raise HTTPException(status_code=503, detail=f"Open orders unavailable: {e}")
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=f"Exchange unavailable: {e}",
+                            headers={"Retry-After": str(max(1, round(e.retry_after)))})
+
+
+@app.patch("/api/orders/{order_id}")
+async def modify_order(order_id: str, change: OrderModifyModel):
+    """Altera preço e/ou tamanho de uma ordem limite aberta (oid ou cloid) numa ação de modificação"""
+    if change.price is None and change.size is None and change.quantity_usd is None:
+        raise HTTPException(status_code=400, detail="Give price, size or quantity_usd")
+    await fresh_open_orders()
+    order = account_state.find_order(parse_order_id(order_id))
+    if order is None:
+        raise HTTPException(status_code=404, detail=f"Order {order_id} is not open")
+    if order.get("trigger_price"):
+        raise HTTPException(status_code=400, detail="Only resting limit orders can be modified")
+    symbol = order["coin"]
+    is_buy = order["side"] == "buy"
+    try:
+        _, asset = find_asset(await market_cache.get_meta(Priority.ORDER), symbol)
+    except MarketDataUnavailable:
+        asset = None
+    sz_decimals = (asset or {}).get("szDecimals", 5)
+    price = round_price(change.price or order["limit_price"], sz_decimals)
+    size = change.size or (change.quantity_usd / price if change.quantity_usd else order["size"])
+    size = float(f"{round(size, sz_decimals):.8f}")
+    if size <= 0:
+        raise HTTPException(status_code=400, detail=f"Size rounds to zero at {sz_decimals} decimals")
+    try:
+        risk_result = risk_engine.check(
+            symbol, is_buy, size, price, mid=(price_cache.get(symbol) or {}).get("mid_price"), leverage=None,
+            asset=asset, account=account_state, book=market_cache.book(symbol), new_order=False,
+            replaces=order["size"] or 0.0,
+        )
+    except RiskRejected as e:
+        raise HTTPException(status_code=400, detail=f"Pre-trade risk check failed: {e}")
+    from hyperliquid.utils.types import Cloid
+    new_order = {
+        "coin": symbol, "is_buy": is_buy, "sz": size, "limit_px": price,
+        "order_type": {"limit": {"tif": "Gtc"}}, "reduce_only": order["reduce_only"],
+        "cloid": Cloid.from_str(order["cloid"]) if order.get("cloid") else None,
+    }
+    try:
+        result = await upstream.exchange(exchange, "bulk_modify_orders_new", [{"oid": order["oid"], "order": new_order}])
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=f"Exchange unavailable: {e}",
+                            headers={"Retry-After": str(max(1, round(e.retry_after)))})
+    statuses = exchange_statuses(result, "Modify")
+    status = statuses[0] if statuses else {}
+    if isinstance(status, dict) and "error" in status:
+        raise HTTPException(status_code=400, detail=f"Modify rejected: {status['error']}")
+    # A modify replaces the order: the exchange reports the new oid (or a fill if it now crosses)
+    account_state.drop_orders([order["oid"]])
+    logger.info(f"✏️ Modified {symbol} order {order['oid']}: {size} @ {price}")
+    return {"success": True, "oid": order["oid"], "symbol": symbol, "price": price, "size": size,
+            "status": status, "risk": risk_result}
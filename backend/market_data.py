@@ -0,0 +1,474 @@
+"""
+Cache de market data com coalescência de requisições e stale-while-revalidate.
+
+- Misses concorrentes para o mesmo símbolo viram um único fetch upstream (single-flight).
+- Com o valor vencido, responde na hora com o último valor bom (marcado como stale)
+  e revalida em background.
+- Sem nenhum valor bom, falha com MarketDataUnavailable em vez de inventar preços.
+- Snapshot de vários símbolos (get_many): um único all_mids cobre todos os que
+  faltam no store, com o topo do livro local quando houver.
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Set, Tuple
+
+from price_store import PriceStore
+from upstream import INFO_WEIGHTS, Priority, UpstreamScheduler
+
+logger = logging.getLogger(__name__)
+
+
+class MarketDataUnavailable(Exception):
+    """Upstream falhou e não há valor em cache para servir"""
+
+
+class SingleFlight:
+    """Coalesce chamadas concorrentes com a mesma chave em uma única execução"""
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        future = self._inflight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            return await asyncio.shield(future)
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await fn()
+        except BaseException as e:
+            future.set_exception(e)
+            # Nobody else may be waiting; avoid "exception was never retrieved"
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            self._inflight.pop(key, None)
+
+    def in_flight(self, key: Hashable) -> bool:
+        return key in self._inflight
+
+
+def find_asset(meta: dict, symbol: str) -> Tuple[Optional[int], Optional[dict]]:
+    """Índice e info do ativo no universe da metadata"""
+    for i, asset in enumerate(meta.get("universe", [])):
+        if asset.get("name") == symbol:
+            return i, asset
+    return None, None
+
+
+def extract_mid(all_mids: Any, symbol: str, asset_index: int) -> float:
+    """Mid price de all_mids() (dict por nome, ou lista por índice)"""
+    if isinstance(all_mids, dict):
+        if symbol in all_mids:
+            return float(all_mids[symbol])
+        values = list(all_mids.values())
+    elif isinstance(all_mids, list):
+        values = all_mids
+    else:
+        raise ValueError(f"Unexpected all_mids type: {type(all_mids)}")
+    if asset_index >= len(values):
+        raise ValueError(f"Asset index {asset_index} out of range (market data length: {len(values)})")
+    return float(values[asset_index])
+
+
+def _level(level: Any) -> Optional[Tuple[float, float]]:
+    if isinstance(level, dict) and "px" in level:
+        return float(level["px"]), float(level.get("sz", 0))
+    if isinstance(level, (list, tuple)) and len(level) >= 2:
+        return float(level[0]), float(level[1])
+    return None
+
+
+def parse_book(l2_data: Any) -> Tuple[List[Tuple[float, float]], List[Tuple[float, float]]]:
+    """Níveis (preço, tamanho) de bids e asks de um l2_snapshot, melhor preço primeiro.
+
+    Formato da API: {"levels": [[bids...], [asks...]]} com níveis {"px", "sz", "n"};
+    também aceita {"bids": [...], "asks": [...]} com pares [preço, tamanho].
+    """
+    if isinstance(l2_data, dict) and isinstance(l2_data.get("data"), dict):
+        l2_data = l2_data["data"]
+    if not isinstance(l2_data, dict):
+        return [], []
+    if "levels" in l2_data and len(l2_data["levels"]) == 2:
+        bids, asks = l2_data["levels"]
+    else:
+        bids, asks = l2_data.get("bids") or [], l2_data.get("asks") or []
+    return ([lv for lv in map(_level, bids) if lv is not None],
+            [lv for lv in map(_level, asks) if lv is not None])
+
+
+def parse_top_of_book(l2_data: Any) -> Tuple[Optional[float], Optional[float]]:
+    """Melhor bid/ask de um l2_snapshot"""
+    bids, asks = parse_book(l2_data)
+    return (bids[0][0] if bids else None, asks[0][0] if asks else None)
+
+
+# all_mids + l2_snapshot
+SNAPSHOT_WEIGHT = INFO_WEIGHTS["all_mids"] + INFO_WEIGHTS["l2_snapshot"]
+
+
+def fetch_market_snapshot(info_client, symbol: str, meta: dict) -> dict:
+    """Busca mid (all_mids) e topo do livro (l2_snapshot) - bloqueante, rodar fora do event loop"""
+    asset_index, _ = find_asset(meta, symbol)
+    if asset_index is None:
+        raise ValueError(f"Symbol {symbol} not found in universe")
+
+    mid_price = extract_mid(info_client.all_mids(), symbol, asset_index)
+    if not mid_price or mid_price <= 0:
+        raise ValueError(f"Invalid mid price: {mid_price}")
+
+    bid_price = ask_price = None
+    bids, asks = [], []
+    try:
+        bids, asks = parse_book(info_client.l2_snapshot(symbol))
+        bid_price = bids[0][0] if bids else None
+        ask_price = asks[0][0] if asks else None
+    except Exception as e:
+        logger.warning(f"Could not get bid/ask from l2_snapshot for {symbol}: {e}")
+
+    source = "rest"
+    if not bid_price or not ask_price:
+        # Fallback: estimate bid/ask from mid price (±0.1%), labeled as such
+        bid_price = bid_price or mid_price * 0.999
+        ask_price = ask_price or mid_price * 1.001
+        source = "rest_estimated_book"
+        logger.info(f"Using estimated bid/ask from mid for {symbol}: bid={bid_price}, ask={ask_price}")
+
+    spread = ask_price - bid_price
+    return {
+        "symbol": symbol,
+        "asset_index": asset_index,
+        "mid_price": mid_price,
+        "bid_price": bid_price,
+        "ask_price": ask_price,
+        "spread": spread,
+        "spread_percent": (spread / mid_price) * 100,
+        "calculated_mid": (bid_price + ask_price) / 2,
+        "source": source,
+        "book": {"bids": bids, "asks": asks} if bids or asks else None,
+    }
+
+
+# Store entry sources whose bid/ask were written together with the mid
+SNAPSHOT_SOURCES = ("rest", "rest_estimated_book")
+
+
+class MarketDataCache:
+    """Camada de cache sobre o price_cache compartilhado (REST + WebSocket)"""
+
+    def __init__(self, store: PriceStore, get_info_client: Callable[[], Awaitable[Any]],
+                 upstream: UpstreamScheduler, fresh_ttl: float = 5.0, meta_ttl: float = 300.0,
+                 on_update: Optional[Callable[[str, dict], None]] = None):
+        self.store = store
+        self.on_update = on_update  # called with (symbol, entry) after every successful refresh
+        self.get_info_client = get_info_client
+        self.upstream = upstream
+        self.fresh_ttl = fresh_ttl
+        self.meta_ttl = meta_ttl
+        self.flight = SingleFlight()
+        self.last_error: Dict[str, str] = {}
+        self._meta: Optional[dict] = None
+        self._meta_fetched_at = 0.0
+        self._background: Set[asyncio.Task] = set()
+        # Last L2 levels per symbol (kept out of the price store: pushed clients only need the top)
+        self.books: Dict[str, dict] = {}
+        # Last all_mids (every asset) for symbols the price store doesn't track
+        self.mids: Dict[str, float] = {}
+        self._mids_fetched_at = 0.0
+        self.stats = {"hits": 0, "stale_served": 0, "upstream_fetches": 0, "upstream_errors": 0,
+                      "batch_requests": 0, "batch_fetches": 0}
+
+    @property
+    def meta(self) -> Optional[dict]:
+        """Última metadata obtida (sem ir ao upstream)"""
+        return self._meta
+
+    async def get_meta(self, priority: Priority = Priority.MARKET_DATA) -> dict:
+        """Metadata muda raramente: cache longo, fetch coalescido"""
+        if self._meta is not None and time.monotonic() - self._meta_fetched_at < self.meta_ttl:
+            return self._meta
+
+        async def fetch():
+            info_client = await self.get_info_client()
+            if info_client is None:
+                raise MarketDataUnavailable("Info client not initialized")
+            meta = await self.upstream.info(info_client, "meta", priority=priority)
+            if not meta or "universe" not in meta:
+                raise MarketDataUnavailable("Could not get metadata or 'universe' not found")
+            self._meta = meta
+            self._meta_fetched_at = time.monotonic()
+            return meta
+
+        try:
+            return await self.flight.do("__meta__", fetch)
+        except MarketDataUnavailable:
+            if self._meta is not None:
+                return self._meta
+            raise
+        except Exception as e:
+            if self._meta is not None:
+                return self._meta
+            raise MarketDataUnavailable(f"Could not get metadata: {e}") from e
+
+    async def refresh(self, symbol: str, priority: Priority = Priority.MARKET_DATA) -> dict:
+        """Fetch upstream (coalescido por símbolo) e atualiza o store"""
+        return await self.flight.do(symbol, lambda: self._fetch(symbol, priority))
+
+    async def _fetch(self, symbol: str, priority: Priority) -> dict:
+        self.stats["upstream_fetches"] += 1
+        try:
+            info_client = await self.get_info_client()
+            if info_client is None:
+                raise MarketDataUnavailable("Info client not initialized")
+            meta = await self.get_meta(priority)
+            snapshot = await self.upstream.run(fetch_market_snapshot, info_client, symbol, meta,
+                                               weight=SNAPSHOT_WEIGHT, priority=priority)
+        except Exception as e:
+            self.stats["upstream_errors"] += 1
+            self.last_error[symbol] = str(e)
+            logger.error(f"❌ ERRO ao obter dados de mercado para {symbol}: {type(e).__name__}: {e}")
+            if isinstance(e, MarketDataUnavailable):
+                raise
+            raise MarketDataUnavailable(str(e)) from e
+
+        self.last_error.pop(symbol, None)
+        book = snapshot.pop("book", None)
+        if book is not None:
+            self.update_book(symbol, book["bids"], book["asks"])
+        self.store[symbol] = {
+            "mid_price": snapshot["mid_price"],
+            "bid_price": snapshot["bid_price"],
+            "ask_price": snapshot["ask_price"],
+            "spread": snapshot["spread"],
+            "last_update": datetime.now().isoformat(),
+            "source": snapshot["source"],
+        }
+        logger.info(f"Market data for {symbol}: mid={snapshot['mid_price']}, "
+                    f"bid={snapshot['bid_price']}, ask={snapshot['ask_price']}")
+        if self.on_update is not None:
+            self.on_update(symbol, self.store[symbol])
+        return snapshot
+
+    def update_book(self, symbol: str, bids: List[Tuple[float, float]], asks: List[Tuple[float, float]]):
+        self.books[symbol] = {"bids": bids, "asks": asks, "updated_at": time.monotonic()}
+
+    def book(self, symbol: str, max_age: Optional[float] = None) -> Optional[dict]:
+        """Último livro L2 conhecido (None se não há ou é mais velho que max_age)"""
+        book = self.books.get(symbol)
+        if book is None or (max_age is not None and time.monotonic() - book["updated_at"] > max_age):
+            return None
+        return book
+
+    def _revalidate(self, symbol: str):
+        if self.flight.in_flight(symbol):
+            return
+
+        async def run():
+            try:
+                await self.refresh(symbol)
+            except MarketDataUnavailable:
+                pass  # already recorded in last_error; keep serving the stale value
+
+        task = asyncio.create_task(run())
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    def _cached_response(self, symbol: str, entry: dict, age: float, stale: bool) -> dict:
+        mid = entry.get("mid_price")
+        spread = entry.get("spread")
+        response = {
+            "symbol": symbol,
+            "mid_price": mid,
+            "bid_price": entry.get("bid_price"),
+            "ask_price": entry.get("ask_price"),
+            "spread": spread,
+            "spread_percent": (spread / mid) * 100 if spread and mid else None,
+            "source": entry.get("source", "cache"),
+            "cached": True,
+            "stale": stale,
+            "age_seconds": round(age, 3),
+            "last_update": entry.get("last_update"),
+        }
+        if stale:
+            response["revalidating"] = True
+            response["upstream_circuit"] = self.upstream.breakers["info"].state
+            if symbol in self.last_error:
+                response["last_error"] = self.last_error[symbol]
+        return response
+
+    def encoded_hit(self, symbol: str) -> Optional[bytes]:
+        """Resposta fresca pronta para enviar (bytes JSON), ou None se não há hit fresco.
+
+        O corpo sem a idade é serializado uma vez por versão do símbolo no store;
+        por request só a idade é anexada.
+        """
+        age = self.store.age(symbol)
+        if age is None or age >= self.fresh_ttl:
+            return None
+        self.stats["hits"] += 1
+        body = self.store.encoded(("market", symbol), symbol, lambda: {
+            key: value for key, value in
+            self._cached_response(symbol, self.store[symbol], 0.0, stale=False).items()
+            if key != "age_seconds"
+        })
+        return body[:-1] + b',"age_seconds":' + f"{age:.3f}".encode() + b"}"
+
+    async def get(self, symbol: str, allow_stale: bool = True,
+                  priority: Priority = Priority.MARKET_DATA) -> dict:
+        """Dados de mercado do símbolo.
+
+        Fresco -> cache; vencido -> último valor bom + revalidação em background
+        (ou espera o fetch se allow_stale=False); sem valor -> fetch coalescido.
+        """
+        entry = self.store.get(symbol)
+        age = self.store.age(symbol)
+        if age is not None and age < self.fresh_ttl:
+            self.stats["hits"] += 1
+            return self._cached_response(symbol, entry, age, stale=False)
+        if age is not None and allow_stale:
+            self.stats["stale_served"] += 1
+            self._revalidate(symbol)
+            return self._cached_response(symbol, entry, age, stale=True)
+        snapshot = await self.refresh(symbol, priority)
+        return {**snapshot, "cached": False, "stale": False, "age_seconds": 0.0}
+
+    # --- multi-symbol snapshot ---
+
+    def _mid_age(self, symbol: str) -> Optional[float]:
+        age = self.store.age(symbol)
+        if age is None and symbol in self.mids:
+            age = time.monotonic() - self._mids_fetched_at
+        return age
+
+    async def _fetch_all_mids(self, meta: Optional[dict], priority: Priority):
+        self.stats["upstream_fetches"] += 1
+        self.stats["batch_fetches"] += 1
+        try:
+            info_client = await self.get_info_client()
+            if info_client is None:
+                raise MarketDataUnavailable("Info client not initialized")
+            all_mids = await self.upstream.info(info_client, "all_mids", priority=priority)
+            if isinstance(all_mids, list):
+                if meta is None:
+                    raise MarketDataUnavailable("all_mids returned a list and metadata is unavailable")
+                all_mids = {asset["name"]: mid for asset, mid in zip(meta["universe"], all_mids)}
+            mids = {name: float(mid) for name, mid in all_mids.items() if float(mid) > 0}
+        except Exception as e:
+            self.stats["upstream_errors"] += 1
+            self.last_error["__all_mids__"] = str(e)
+            logger.error(f"❌ ERRO ao obter all_mids: {type(e).__name__}: {e}")
+            if isinstance(e, MarketDataUnavailable):
+                raise
+            raise MarketDataUnavailable(str(e)) from e
+
+        self.last_error.pop("__all_mids__", None)
+        self.mids = mids
+        self._mids_fetched_at = time.monotonic()
+        now = datetime.now().isoformat()
+        for symbol in list(self.store):
+            mid = mids.get(symbol)
+            age = self.store.age(symbol)
+            if mid is None or (age is not None and age < self.fresh_ttl):
+                continue  # the feed (or a REST snapshot) already has something fresher
+            existing = self.store[symbol]
+            bid_price, ask_price = existing.get("bid_price"), existing.get("ask_price")
+            book = self.book(symbol, self.fresh_ttl)
+            if book is not None and book["bids"] and book["asks"]:
+                bid_price, ask_price = book["bids"][0][0], book["asks"][0][0]
+            # Same rule as the trades feed: the mid moves, bid/ask stay the last real ones
+            self.store[symbol] = {
+                "mid_price": mid,
+                "bid_price": bid_price,
+                "ask_price": ask_price,
+                "spread": ask_price - bid_price if bid_price and ask_price else existing.get("spread"),
+                "last_update": now,
+                "source": "rest_all_mids",
+            }
+            if self.on_update is not None:
+                self.on_update(symbol, self.store[symbol])
+
+    def _snapshot_row(self, symbol: str) -> dict:
+        """Mid e topo do livro de um símbolo; bid/ask só de uma fonte tão fresca quanto o mid"""
+        entry = self.store.get(symbol) or {}
+        mid = entry.get("mid_price")
+        source = entry.get("source")
+        if not mid and symbol in self.mids:
+            mid, source = self.mids[symbol], "rest_all_mids"
+        age = self._mid_age(symbol) if mid else None
+        bid_price = ask_price = book_age = None
+        book = self.books.get(symbol)
+        if book is not None and book["bids"] and book["asks"]:
+            book_age = time.monotonic() - book["updated_at"]
+            if book_age < self.fresh_ttl:
+                bid_price, ask_price = book["bids"][0][0], book["asks"][0][0]
+        if bid_price is None and source in SNAPSHOT_SOURCES and entry.get("bid_price") and entry.get("ask_price"):
+            # Written by the same REST snapshot as the mid
+            bid_price, ask_price, book_age = entry["bid_price"], entry["ask_price"], age
+        spread = ask_price - bid_price if bid_price and ask_price else None
+        return {
+            "symbol": symbol,
+            "mid_price": mid,
+            "bid_price": bid_price,
+            "ask_price": ask_price,
+            "spread": spread,
+            "spread_percent": (spread / mid) * 100 if spread and mid else None,
+            "source": source,
+            "age_seconds": round(age, 3) if age is not None else None,
+            "book_age_seconds": round(book_age, 3) if book_age is not None else None,
+            "stale": age is None or age >= self.fresh_ttl,
+            # No top of book as fresh as the mid: bid/ask left out rather than mixed with an older one
+            "book_stale": bid_price is None,
+        }
+
+    async def get_many(self, symbols: Optional[List[str]] = None,
+                       priority: Priority = Priority.MARKET_DATA) -> dict:
+        """Snapshot de vários símbolos (None = todo o universo) com no máximo um all_mids upstream.
+
+        Símbolos frescos no store saem dele; havendo algum vencido ou ausente, um
+        único all_mids (coalescido) atualiza todos. Se o upstream falhar, responde
+        com o que houver, marcado como stale.
+        """
+        self.stats["batch_requests"] += 1
+        universe: Optional[Set[str]] = None
+        try:
+            universe = {asset["name"] for asset in (await self.get_meta(priority))["universe"]}
+        except MarketDataUnavailable:
+            if symbols is None and not self.mids:
+                raise
+        meta = self._meta
+        if symbols is None:
+            symbols = [asset["name"] for asset in meta["universe"]] if meta is not None else sorted(self.mids)
+        # Symbols outside the universe can't be fixed by fetching again
+        missing = []
+        for symbol in symbols:
+            age = self._mid_age(symbol)
+            if (universe is None or symbol in universe) and (age is None or age >= self.fresh_ttl):
+                missing.append(symbol)
+        error = None
+        if missing:
+            try:
+                await self.flight.do("__all_mids__", lambda: self._fetch_all_mids(meta, priority))
+            except MarketDataUnavailable as e:
+                error = str(e)
+        rows = [self._snapshot_row(symbol) for symbol in symbols]
+        if error is not None and not any(row["mid_price"] for row in rows):
+            raise MarketDataUnavailable(error)
+        if not missing:
+            self.stats["hits"] += 1
+        return {
+            "symbols": rows,
+            "unknown": [row["symbol"] for row in rows if not row["mid_price"]],
+            "fetched": bool(missing) and error is None,
+            "error": error,
+            "upstream_circuit": self.upstream.breakers["info"].state,
+        }
+
+    def metrics(self) -> dict:
+        return {**self.stats, "coalesced": self.flight.coalesced, "last_errors": dict(self.last_error)}
@@ -0,0 +1,103 @@
+"""
+price_cache versionado.
+
+Toda escrita (`store[symbol] = entry`, vinda do REST ou do feed WebSocket)
+incrementa a versão do board e grava essa versão como versão do símbolo. As
+versões viram ETags para GET condicional (304) e permitem long-poll: o
+cliente espera até a versão que ele tem ficar velha.
+
+As respostas quentes ficam pré-serializadas (orjson) por símbolo e para o
+board inteiro, e só são regeneradas na primeira leitura depois de uma mudança.
+"""
+import asyncio
+import time
+from datetime import datetime
+from typing import Callable, Dict, Hashable, Optional, Tuple
+
+import orjson
+
+
+class PriceStore(dict):
+    """dict símbolo -> entrada de preço, com versões monotônicas por símbolo e do board"""
+
+    def __init__(self, initial: Dict[str, dict]):
+        super().__init__(initial)
+        self.board_version = 0
+        self.versions: Dict[str, int] = {symbol: 0 for symbol in initial}
+        self.board_updated_at = datetime.now().isoformat()
+        self._written_at: Dict[str, float] = {}
+        self._changed = asyncio.Event()
+        self._encoded: Dict[Hashable, Tuple[int, bytes]] = {}
+
+    def __setitem__(self, symbol: str, entry: dict):
+        super().__setitem__(symbol, entry)
+        self.board_version += 1
+        self.versions[symbol] = self.board_version
+        self._written_at[symbol] = time.monotonic()
+        self.board_updated_at = entry.get("last_update") or datetime.now().isoformat()
+        # Wake every long-poll waiter; the next ones wait on a fresh event
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def version(self, symbol: Optional[str] = None) -> int:
+        return self.board_version if symbol is None else self.versions.get(symbol, 0)
+
+    def etag(self, symbol: Optional[str] = None) -> str:
+        return f'"{symbol or "board"}-{self.version(symbol)}"'
+
+    def age(self, symbol: str) -> Optional[float]:
+        """Segundos desde a última escrita com preço (None se nunca teve preço)"""
+        entry = self.get(symbol)
+        if not entry or not entry.get("mid_price") or symbol not in self._written_at:
+            return None
+        return time.monotonic() - self._written_at[symbol]
+
+    def encoded(self, key: Hashable, symbol: Optional[str], build: Callable[[], dict]) -> bytes:
+        """Bytes JSON de build(), reaproveitados enquanto a versão (do símbolo ou do board) não muda"""
+        version = self.version(symbol)
+        cached = self._encoded.get(key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        body = orjson.dumps(build())
+        self._encoded[key] = (version, body)
+        return body
+
+    def board_body(self) -> bytes:
+        return self.encoded("board", None, lambda: {
+            "success": True,
+            "cache": dict(self),
+            "version": self.board_version,
+            "timestamp": self.board_updated_at,
+        })
+
+    def symbol_body(self, symbol: str) -> bytes:
+        return self.encoded(("symbol", symbol), symbol, lambda: {
+            "success": True,
+            "symbol": symbol,
+            "data": self[symbol],
+            "version": self.versions.get(symbol, 0),
+            "timestamp": self[symbol].get("last_update"),
+        })
+
+    async def wait_for_change(self, since: int, symbol: Optional[str] = None, timeout: float = 30.0) -> bool:
+        """Espera a versão passar de `since` (True) ou o timeout vencer (False)"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while self.version(symbol) <= since:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return False
+            try:
+                await asyncio.wait_for(self._changed.wait(), remaining)
+            except asyncio.TimeoutError:
+                return False
+        return True
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match (lista, weak W/ ou *) bate com o ETag atual?"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
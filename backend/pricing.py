@@ -0,0 +1,102 @@
+"""
+Preço de ordens a mercado a partir da profundidade do livro L2.
+
+Ordens "market" na Hyperliquid são limit IOC: o preço limite precisa cobrir o
+pior nível que o tamanho pedido vai consumir. Em vez de topo do livro + 0,1%,
+percorremos os níveis em cache para estimar VWAP e pior preço de execução e
+somamos uma tolerância configurável.
+
+Regras de preço da Hyperliquid (perps): no máximo 5 algarismos significativos
+e no máximo (6 - szDecimals) casas decimais; preços inteiros são sempre válidos.
+"""
+import math
+from typing import List, Optional, Sequence, Tuple
+
+MAX_PRICE_DECIMALS = 6  # perps (spot: 8)
+SIG_FIGS = 5
+
+Level = Tuple[float, float]  # (price, size)
+
+
+def tick_size(px: float, sz_decimals: int) -> float:
+    """Menor incremento de preço válido em torno de `px`"""
+    if px <= 0:
+        return 1.0
+    by_sig_figs = min(10.0 ** (math.floor(math.log10(px)) - (SIG_FIGS - 1)), 1.0)
+    return max(by_sig_figs, 10.0 ** -max(MAX_PRICE_DECIMALS - sz_decimals, 0))
+
+
+def round_price(px: float, sz_decimals: int, direction: str = "nearest") -> float:
+    """Arredonda para um preço aceito pela exchange.
+
+    direction: "up" (limite de compra: nunca abaixo da estimativa), "down" (venda) ou "nearest".
+    """
+    tick = tick_size(px, sz_decimals)
+    steps = px / tick
+    # Absorb float noise so an already-valid price is not pushed a whole tick
+    if abs(steps - round(steps)) < 1e-9:
+        steps = round(steps)
+    if direction == "up":
+        steps = math.ceil(steps)
+    elif direction == "down":
+        steps = math.floor(steps)
+    else:
+        steps = round(steps)
+    decimals = max(0, -math.floor(math.log10(tick)))
+    rounded = round(steps * tick, decimals)
+    # Rounding up across a power of ten (9.99995 -> 10.0) may leave a 6th significant figure
+    if tick_size(rounded, sz_decimals) != tick:
+        return round_price(rounded, sz_decimals, direction)
+    return rounded
+
+
+def estimate_fill(levels: Sequence[Level], size: float) -> dict:
+    """VWAP e pior preço para consumir `size` dos níveis (melhor preço primeiro)"""
+    remaining = size
+    cost = 0.0
+    worst = None
+    used = 0
+    for px, sz in levels:
+        if remaining <= 0:
+            break
+        take = min(sz, remaining)
+        cost += take * px
+        remaining -= take
+        worst = px
+        used += 1
+    filled = size - max(remaining, 0.0)
+    return {
+        "vwap": cost / filled if filled > 0 else None,
+        "worst_price": worst,
+        "filled": filled,
+        "levels_used": used,
+        "depth_exhausted": remaining > 1e-12,
+    }
+
+
+def market_order_price(bids: List[Level], asks: List[Level], is_buy: bool, size: float,
+                       tolerance: float, sz_decimals: int, mid: Optional[float] = None) -> dict:
+    """Preço limite IOC para uma ordem a mercado de `size`.
+
+    Limite = pior nível estimado * (1 ± tolerância), arredondado para o lado que
+    não reduz a chance de execução. Sem livro, usa o mid como pior preço.
+    """
+    levels = asks if is_buy else bids
+    estimate = estimate_fill(levels, size) if levels else {
+        "vwap": None, "worst_price": None, "filled": 0.0, "levels_used": 0, "depth_exhausted": True,
+    }
+    reference = estimate["worst_price"] or mid
+    if not reference:
+        raise ValueError("No book levels or mid price to price the market order")
+    raw = reference * (1 + tolerance) if is_buy else reference * (1 - tolerance)
+    price = round_price(raw, sz_decimals, "up" if is_buy else "down")
+    best = levels[0][0] if levels else None
+    vwap = estimate["vwap"]
+    return {
+        **estimate,
+        "best_price": best,
+        "limit_price": price,
+        "tolerance": tolerance,
+        "estimated_slippage": abs(vwap / best - 1) if vwap and best else None,
+        "book_levels": len(levels),
+    }
@@ -0,0 +1,286 @@
+"""
+Diagnóstico de latência sob demanda, sem reiniciar o processo.
+
+- RequestProfiler: perfila (cProfile) as próximas N requisições de uma rota.
+  O trecho no event loop e as chamadas ao SDK feitas em threads de trabalho
+  (assinatura, HTTP) entram no mesmo perfil. Uma requisição por vez: enquanto
+  uma está sendo perfilada, as outras passam sem perfil (no event loop o perfil
+  também pega o que rodou intercalado com ela).
+- StackSampler: amostra as pilhas de todas as threads (sys._current_frames) em
+  intervalo fixo e acumula pilhas "dobradas" (formato do flamegraph.pl/speedscope).
+  Custo proporcional à taxa de amostragem, não ao volume de requisições.
+- task_dump: pilhas das tasks asyncio vivas.
+"""
+import asyncio
+import contextvars
+import cProfile
+import io
+import itertools
+import logging
+import pstats
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from starlette.routing import compile_path
+
+logger = logging.getLogger(__name__)
+
+SORT_KEYS = ("cumulative", "tottime", "ncalls")
+
+# Profile of the request being served in this context (copied into to_thread workers)
+_active: contextvars.ContextVar[Optional["ProfileSession"]] = contextvars.ContextVar("request_profile", default=None)
+
+
+def thread_profiled(fn: Callable) -> Callable:
+    """Envolve uma função que vai rodar numa thread de trabalho para entrar no perfil da requisição"""
+    session = _active.get()
+    if session is None:
+        return fn
+
+    def run(*args, **kwargs):
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            profile.disable()
+            session.add_thread_profile(profile)
+
+    return run
+
+
+class ProfileSession:
+    def __init__(self, session_id: str, route: str, method: Optional[str], count: int, sort: str, limit: int):
+        self.id = session_id
+        self.route = route
+        self.method = method.upper() if method else None
+        self.regex: re.Pattern = compile_path(route)[0]
+        self.count = count
+        self.sort = sort
+        self.limit = limit
+        self.profiles: List[dict] = []
+        self.created_at = datetime.now().isoformat()
+        self._thread_profiles: List[cProfile.Profile] = []
+        self._lock = threading.Lock()
+
+    @property
+    def done(self) -> bool:
+        return len(self.profiles) >= self.count
+
+    def matches(self, method: str, path: str) -> bool:
+        return not self.done and (self.method is None or self.method == method) and bool(self.regex.match(path))
+
+    def add_thread_profile(self, profile: cProfile.Profile):
+        with self._lock:
+            self._thread_profiles.append(profile)
+
+    def finish(self, loop_profile: cProfile.Profile, method: str, path: str, status: Optional[int], elapsed: float):
+        stats = pstats.Stats(loop_profile, stream=io.StringIO())
+        with self._lock:
+            threads, self._thread_profiles = self._thread_profiles, []
+        for profile in threads:
+            stats.add(profile)
+        out = io.StringIO()
+        stats.stream = out
+        stats.sort_stats(self.sort).print_stats(self.limit)
+        self.profiles.append({
+            "method": method,
+            "path": path,
+            "status": status,
+            "elapsed_ms": round(elapsed * 1000, 2),
+            "worker_thread_calls": len(threads),
+            "at": datetime.now().isoformat(),
+            "stats": out.getvalue(),
+        })
+
+    def summary(self, include_stats: bool = True) -> dict:
+        return {
+            "id": self.id,
+            "route": self.route,
+            "method": self.method,
+            "requested": self.count,
+            "captured": len(self.profiles),
+            "done": self.done,
+            "sort": self.sort,
+            "created_at": self.created_at,
+            "profiles": self.profiles if include_stats else [
+                {k: v for k, v in p.items() if k != "stats"} for p in self.profiles
+            ],
+        }
+
+
+class RequestProfiler:
+    def __init__(self, history: int = 20):
+        self.sessions: Dict[str, ProfileSession] = {}
+        self._history = history
+        self._ids = itertools.count(1)
+        self._busy = False  # one cProfile per thread at a time
+        self.stats = {"profiled": 0, "skipped_busy": 0}
+
+    def arm(self, route: str, count: int = 1, method: Optional[str] = None, sort: str = "cumulative",
+            limit: int = 40) -> ProfileSession:
+        if sort not in SORT_KEYS:
+            raise ValueError(f"sort must be one of {', '.join(SORT_KEYS)}")
+        session = ProfileSession(f"prof-{next(self._ids)}", route, method, count, sort, limit)
+        self.sessions[session.id] = session
+        while len(self.sessions) > self._history:
+            self.sessions.pop(next(iter(self.sessions)))
+        return session
+
+    def cancel(self, session_id: str) -> Optional[ProfileSession]:
+        return self.sessions.pop(session_id, None)
+
+    def match(self, method: str, path: str) -> Optional[ProfileSession]:
+        for session in self.sessions.values():
+            if session.matches(method, path):
+                return session
+        return None
+
+    def middleware(self, app):
+        """Middleware ASGI: custo de um loop sobre as sessões armadas quando há alguma, zero quando não"""
+        profiler = self
+
+        async def asgi(scope, receive, send):
+            session = None
+            if scope["type"] == "http" and profiler.sessions:
+                session = profiler.match(scope["method"], scope["path"])
+            if session is None:
+                return await app(scope, receive, send)
+            if profiler._busy:
+                profiler.stats["skipped_busy"] += 1
+                return await app(scope, receive, send)
+            status = None
+
+            async def send_wrapper(message):
+                nonlocal status
+                if message["type"] == "http.response.start":
+                    status = message["status"]
+                await send(message)
+
+            profiler._busy = True
+            token = _active.set(session)
+            profile = cProfile.Profile()
+            start = time.perf_counter()
+            profile.enable()
+            try:
+                await app(scope, receive, send_wrapper)
+            finally:
+                profile.disable()
+                _active.reset(token)
+                profiler._busy = False
+                session.finish(profile, scope["method"], scope["path"], status, time.perf_counter() - start)
+                profiler.stats["profiled"] += 1
+                logger.info(f"🔬 Profiled {scope['method']} {scope['path']} ({session.id}, "
+                            f"{len(session.profiles)}/{session.count})")
+
+        return asgi
+
+    def metrics(self) -> dict:
+        return {**self.stats, "armed": sum(1 for s in self.sessions.values() if not s.done)}
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    module = frame.f_globals.get("__name__", "?")
+    return f"{module}:{code.co_name}"
+
+
+class StackSampler:
+    """Profiler por amostragem de todas as threads, numa thread daemon própria"""
+
+    def __init__(self, max_depth: int = 64):
+        self.max_depth = max_depth
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.interval = 0.01
+        self.started_at: Optional[float] = None
+        self.stopped_at: Optional[float] = None
+        self.deadline: Optional[float] = None
+        self.sample_cost_s = 0.0
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval_ms: float = 10.0, max_seconds: float = 300.0):
+        """Zera as pilhas e começa a amostrar; para sozinho depois de max_seconds"""
+        if self.running:
+            raise RuntimeError("Sampler already running")
+        self.stacks = Counter()
+        self.samples = 0
+        self.sample_cost_s = 0.0
+        self.interval = interval_ms / 1000
+        self.started_at = time.monotonic()
+        self.stopped_at = None
+        self.deadline = self.started_at + max_seconds
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+        logger.info(f"🔥 Stack sampler started ({interval_ms:g}ms, up to {max_seconds:g}s)")
+
+    def stop(self):
+        if not self.running:
+            return
+        self._stop.set()
+        self._thread.join()
+        logger.info(f"🔥 Stack sampler stopped after {self.samples} samples")
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            if time.monotonic() >= self.deadline:
+                break
+            start = time.perf_counter()
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                labels = []
+                while frame is not None and len(labels) < self.max_depth:
+                    labels.append(_frame_label(frame))
+                    frame = frame.f_back
+                labels.append(names.get(ident, f"thread-{ident}"))
+                self.stacks[";".join(reversed(labels))] += 1
+            self.samples += 1
+            self.sample_cost_s += time.perf_counter() - start
+        self.stopped_at = time.monotonic()
+
+    def folded(self) -> str:
+        """Uma linha por pilha: "thread;mod:func;mod:func N" (flamegraph.pl, speedscope, inferno)"""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def status(self, top: int = 10) -> dict:
+        end = self.stopped_at if self.stopped_at is not None and not self.running else time.monotonic()
+        elapsed = end - self.started_at if self.started_at is not None else 0.0
+        return {
+            "running": self.running,
+            "interval_ms": self.interval * 1000,
+            "samples": self.samples,
+            "elapsed_s": round(elapsed, 3),
+            "unique_stacks": len(self.stacks),
+            # Share of wall time the sampler thread spent walking stacks (holding the GIL)
+            "overhead": round(self.sample_cost_s / elapsed, 5) if elapsed else None,
+            "top_stacks": [{"stack": s, "samples": c} for s, c in self.stacks.most_common(top)],
+        }
+
+
+def task_dump(limit: int = 20) -> List[dict]:
+    """Pilhas das tasks asyncio do loop atual (onde cada uma está parada)"""
+    tasks = []
+    for task in asyncio.all_tasks():
+        coro = task.get_coro()
+        frames = task.get_stack(limit=limit)
+        tasks.append({
+            "name": task.get_name(),
+            "coro": getattr(coro, "__qualname__", repr(coro)),
+            "done": task.done(),
+            "stack": [f"{f.f_code.co_filename}:{f.f_lineno} {f.f_code.co_name}" for f in frames],
+        })
+    return sorted(tasks, key=lambda t: t["coro"])
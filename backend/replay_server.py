@@ -0,0 +1,820 @@
+#!/usr/bin/env python3
+"""
+Servidor de replay - substituto local da API da Hyperliquid.
+
+Fala o mesmo protocolo de /info, /exchange e /ws a partir de ticks gravados
+(ou sintéticos), com velocidade ajustável até "o mais rápido possível".
+Aponte o backend para ele com HYPERLIQUID_API_URL=http://localhost:3001 no .env.
+
+Uso:
+    python replay_server.py --file ticks.jsonl --speed 10 --loop
+    python replay_server.py --synthetic --speed 0
+    python replay_server.py record --out ticks.jsonl --duration 300
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import random
+import time
+from typing import AsyncIterator, Callable, Dict, List, Optional, Set, Tuple
+
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger("replay_server")
+
+DEFAULT_PORT = 3001
+TESTNET_API_URL = "https://api.hyperliquid-testnet.xyz"
+TESTNET_WS_URL = "wss://api.hyperliquid-testnet.xyz/ws"
+
+# Account channels; the simulated account answers for any user address
+USER_CHANNELS = ("webData2", "orderUpdates", "userFills", "userFundings")
+
+# Universe used when no recording is given (prices are just starting points)
+SYNTHETIC_UNIVERSE = [
+    {"name": "BTC", "szDecimals": 5, "maxLeverage": 40, "px": 109950.5},
+    {"name": "ETH", "szDecimals": 4, "maxLeverage": 25, "px": 3500.0},
+    {"name": "SOL", "szDecimals": 2, "maxLeverage": 20, "px": 150.0},
+    {"name": "DOGE", "szDecimals": 0, "maxLeverage": 10, "px": 0.16},
+    {"name": "AVAX", "szDecimals": 2, "maxLeverage": 10, "px": 25.0},
+    {"name": "ARB", "szDecimals": 1, "maxLeverage": 10, "px": 0.45},
+]
+
+
+def round_px(px: float, sz_decimals: int) -> float:
+    """Arredonda preço para 5 algarismos significativos e (6 - szDecimals) casas, como a Hyperliquid"""
+    return round(float(f"{px:.5g}"), max(6 - sz_decimals, 0))
+
+
+def tick_size(px: float, sz_decimals: int) -> float:
+    """Menor incremento de preço válido para um preço/ativo"""
+    by_sig_figs = 10 ** (math.floor(math.log10(px)) - 4) if px > 0 else 1.0
+    return max(by_sig_figs, 10 ** -max(6 - sz_decimals, 0))
+
+
+def fmt(x: float) -> str:
+    """Formata número como a API (string sem zeros à direita)"""
+    return f"{x:.8f}".rstrip("0").rstrip(".") or "0"
+
+
+def subscription_key(subscription: dict) -> Optional[str]:
+    """Identificador de assinatura (mesma convenção do websocket_manager do SDK)"""
+    sub_type = subscription.get("type")
+    if sub_type == "allMids":
+        return "allMids"
+    if sub_type in ("trades", "l2Book", "bbo", "activeAssetCtx"):
+        return f"{sub_type}:{str(subscription.get('coin', '')).lower()}"
+    if sub_type in USER_CHANNELS:
+        return sub_type
+    return None
+
+
+def message_key(msg: dict) -> Optional[str]:
+    """Identificador de assinatura de uma mensagem de canal"""
+    channel = msg.get("channel")
+    data = msg.get("data")
+    if channel == "allMids":
+        return "allMids"
+    if channel == "trades" and isinstance(data, list) and data:
+        return f"trades:{data[0].get('coin', '').lower()}"
+    if channel in ("l2Book", "bbo", "activeAssetCtx") and isinstance(data, dict):
+        return f"{channel}:{data.get('coin', '').lower()}"
+    if channel in USER_CHANNELS:
+        return channel
+    return None
+
+
+CANDLE_INTERVALS_MS = {"1m": 60_000, "5m": 300_000, "15m": 900_000, "1h": 3_600_000, "4h": 14_400_000,
+                       "1d": 86_400_000}
+
+
+def synthetic_book(coin: str, mid: float, sz_decimals: int, depth: int, time_ms: int) -> dict:
+    """Livro l2Book sintético: níveis a cada tick ao redor do mid, tamanho crescendo com a distância"""
+    tick = tick_size(mid, sz_decimals)
+    base_size = max(round(1000.0 / mid, sz_decimals), 10 ** -sz_decimals)
+    bids = []
+    asks = []
+    for i in range(depth):
+        size = fmt(round(base_size * (1 + i * 0.5), sz_decimals))
+        bids.append({"px": fmt(round_px(mid - tick * (i + 1), sz_decimals)), "sz": size, "n": 1 + i % 4})
+        asks.append({"px": fmt(round_px(mid + tick * (i + 1), sz_decimals)), "sz": size, "n": 1 + i % 4})
+    return {"coin": coin, "time": time_ms, "levels": [bids, asks]}
+
+
+class MarketState:
+    """Estado de mercado reconstruído a partir dos ticks reproduzidos"""
+
+    def __init__(self, universe: List[dict], mids: Optional[Dict[str, float]] = None):
+        self.universe = [{k: v for k, v in asset.items() if k != "px"} for asset in universe]
+        self.sz_decimals = {asset["name"]: asset.get("szDecimals", 2) for asset in universe}
+        self.mids: Dict[str, float] = {asset["name"]: float(asset["px"]) for asset in universe if asset.get("px")}
+        self.mids.update(mids or {})
+        self.books: Dict[str, dict] = {}
+
+    def coin_for_asset(self, asset: int) -> Optional[str]:
+        if 0 <= asset < len(self.universe):
+            return self.universe[asset]["name"]
+        return None
+
+    def apply(self, msg: dict):
+        channel = msg.get("channel")
+        data = msg.get("data")
+        if channel == "trades" and isinstance(data, list):
+            for trade in data:
+                self.mids[trade["coin"]] = float(trade["px"])
+        elif channel == "l2Book" and isinstance(data, dict):
+            self.books[data["coin"]] = data
+            bids, asks = data["levels"]
+            if bids and asks:
+                self.mids[data["coin"]] = (float(bids[0]["px"]) + float(asks[0]["px"])) / 2
+        elif channel == "allMids" and isinstance(data, dict):
+            for coin, px in data.get("mids", {}).items():
+                self.mids[coin] = float(px)
+
+    def asset_ctx(self, coin: str) -> dict:
+        """Contexto do ativo no formato da API (funding fixo, sem open interest simulado)"""
+        mid = self.mids.get(coin)
+        px = fmt(mid) if mid else None
+        return {
+            "funding": "0.0000125", "openInterest": "0", "prevDayPx": px, "dayNtlVlm": "0",
+            "premium": "0", "oraclePx": px, "markPx": px, "midPx": px, "impactPxs": [px, px],
+        }
+
+    def candles(self, coin: str, interval: str, start: int, end: int, limit: int = 5000) -> List[dict]:
+        """Candles sintéticos determinísticos ao redor do mid (o mesmo pedido devolve os mesmos candles)"""
+        step = CANDLE_INTERVALS_MS.get(interval)
+        mid = self.mids.get(coin)
+        if step is None or mid is None:
+            return []
+        decimals = self.sz_decimals.get(coin, 2)
+        now = int(time.time() * 1000)
+        candles = []
+        t = max(start - start % step, now // step * step - (limit - 1) * step)  # only the latest `limit` exist
+
+        def wave(x: int) -> float:
+            return mid * (1 + 0.02 * math.sin(x / step / 50))
+
+        while t <= min(end, now) and len(candles) < limit:
+            o, c = wave(t), wave(t + step)
+            candles.append({
+                "t": t, "T": t + step - 1, "s": coin, "i": interval,
+                "o": fmt(round_px(o, decimals)), "c": fmt(round_px(c, decimals)),
+                "h": fmt(round_px(max(o, c) * 1.001, decimals)), "l": fmt(round_px(min(o, c) * 0.999, decimals)),
+                "v": "1", "n": 10,
+            })
+            t += step
+        return candles
+
+    def l2_book(self, coin: str, depth: int = 20) -> Optional[dict]:
+        """Livro gravado mais recente, ou um livro sintético ao redor do mid"""
+        mid = self.mids.get(coin)
+        book = self.books.get(coin)
+        if book is not None:
+            bids, asks = book["levels"]
+            # Recorded book is only trusted while it still brackets the replayed mid
+            if mid is None or (bids and asks and float(bids[0]["px"]) <= mid <= float(asks[0]["px"])):
+                return book
+        if mid is None:
+            return None
+        return synthetic_book(coin, mid, self.sz_decimals.get(coin, 2), depth, int(time.time() * 1000))
+
+    def best_bid_ask(self, coin: str) -> Tuple[Optional[float], Optional[float]]:
+        book = self.l2_book(coin, depth=1)
+        if not book:
+            return None, None
+        bids, asks = book["levels"]
+        return (float(bids[0]["px"]) if bids else None, float(asks[0]["px"]) if asks else None)
+
+
+class SimulatedAccount:
+    """Conta simulada: ordens em repouso, posições e fills contra o mercado reproduzido"""
+
+    def __init__(self, market: MarketState):
+        self.market = market
+        self.next_oid = 1
+        self.next_tid = 1
+        self.open_orders: Dict[int, dict] = {}
+        self.positions: Dict[str, dict] = {}
+        self.fills: List[dict] = []
+        self.leverage: Dict[str, int] = {}
+        self.account_value = 100000.0
+        # Last known status per oid (orderStatus queries)
+        self.order_status: Dict[int, dict] = {}
+        # Set by the engine: receives (channel, data) for the user WebSocket channels
+        self.listener: Optional[Callable[[str, object], None]] = None
+
+    def _emit(self, channel: str, data):
+        if self.listener is not None:
+            self.listener(channel, data)
+
+    def _order_update(self, order: dict, status: str):
+        update = {
+            "order": {k: v for k, v in order.items() if v is not None},
+            "status": status,
+            "statusTimestamp": int(time.time() * 1000),
+        }
+        self.order_status[order["oid"]] = update
+        self._emit("orderUpdates", [update])
+
+    def web_data(self, user: str = "") -> dict:
+        """Snapshot do canal webData2 (estado da conta + ordens abertas)"""
+        return {
+            "clearinghouseState": self.clearinghouse_state(),
+            "openOrders": list(self.open_orders.values()),
+            "user": user,
+            "serverTime": int(time.time() * 1000),
+        }
+
+    def _fill(self, coin: str, is_buy: bool, size: float, px: float, oid: int) -> dict:
+        position = self.positions.setdefault(coin, {"szi": 0.0, "entryPx": px})
+        signed = size if is_buy else -size
+        old = position["szi"]
+        new = old + signed
+        closed_pnl = 0.0
+        if old == 0 or (old > 0) == is_buy:
+            position["entryPx"] = (abs(old) * position["entryPx"] + size * px) / abs(new)
+        else:
+            closed = min(abs(old), size)
+            closed_pnl = closed * (px - position["entryPx"]) * (1 if old > 0 else -1)
+            if abs(new) > 0 and (new > 0) != (old > 0):
+                position["entryPx"] = px
+        position["szi"] = new
+        self.account_value += closed_pnl
+        fill = {
+            "coin": coin,
+            "px": fmt(px),
+            "sz": fmt(size),
+            "side": "B" if is_buy else "A",
+            "time": int(time.time() * 1000),
+            "startPosition": fmt(old),
+            "dir": "Open Long" if is_buy else "Open Short",
+            "closedPnl": fmt(closed_pnl),
+            "hash": f"0x{self.next_tid:064x}",
+            "oid": oid,
+            "crossed": True,
+            "fee": fmt(px * size * 0.00045),
+            "tid": self.next_tid,
+            "feeToken": "USDC",
+        }
+        self.next_tid += 1
+        self.account_value -= px * size * 0.00045
+        self.fills.append(fill)
+        self._emit("userFills", {"isSnapshot": False, "user": "", "fills": [fill]})
+        self._emit("webData2", self.web_data())
+        return fill
+
+    def place(self, wire: dict) -> dict:
+        coin = self.market.coin_for_asset(wire["a"])
+        if coin is None:
+            return {"error": "Asset not found."}
+        is_buy = bool(wire["b"])
+        px = float(wire["p"])
+        size = float(wire["s"])
+        tif = wire.get("t", {}).get("limit", {}).get("tif", "Gtc")
+        if px <= 0 or size <= 0:
+            return {"error": "Order has invalid size or price."}
+        bid, ask = self.market.best_bid_ask(coin)
+        marketable = (is_buy and ask is not None and px >= ask) or (not is_buy and bid is not None and px <= bid)
+        oid = self.next_oid
+        self.next_oid += 1
+        if marketable:
+            fill_px = ask if is_buy else bid
+            self._order_update({"coin": coin, "side": "B" if is_buy else "A", "limitPx": fmt(px), "sz": "0",
+                                "origSz": fmt(size), "oid": oid, "timestamp": int(time.time() * 1000),
+                                "cloid": wire.get("c")}, "filled")
+            self._fill(coin, is_buy, size, fill_px, oid)
+            return {"filled": {"totalSz": fmt(size), "avgPx": fmt(fill_px), "oid": oid}}
+        if tif == "Ioc":
+            return {"error": "Order could not immediately match against any resting orders. asset=%d" % wire["a"]}
+        self.open_orders[oid] = {
+            "coin": coin,
+            "side": "B" if is_buy else "A",
+            "limitPx": fmt(px),
+            "sz": fmt(size),
+            "origSz": fmt(size),
+            "oid": oid,
+            "timestamp": int(time.time() * 1000),
+            "cloid": wire.get("c"),
+        }
+        self._order_update(self.open_orders[oid], "open")
+        self._emit("webData2", self.web_data())
+        return {"resting": {"oid": oid, **({"cloid": wire["c"]} if wire.get("c") else {})}}
+
+    def cancel(self, coin: str, oid: Optional[int] = None, cloid: Optional[str] = None):
+        for order_id, order in list(self.open_orders.items()):
+            if order["coin"] == coin and (order_id == oid or (cloid and order.get("cloid") == cloid)):
+                del self.open_orders[order_id]
+                self._order_update(order, "canceled")
+                self._emit("webData2", self.web_data())
+                return "success"
+        return {"error": "Order was never placed, already canceled, or filled."}
+
+    def modify(self, oid, wire: dict):
+        target = None
+        for order_id, order in self.open_orders.items():
+            if order_id == oid or (isinstance(oid, str) and order.get("cloid") == oid):
+                target = order_id
+                break
+        if target is None:
+            return {"error": "Cannot modify canceled or filled order"}
+        self._order_update(self.open_orders.pop(target), "canceled")
+        return self.place(wire)
+
+    def match_resting(self, coin: str):
+        """Executa ordens em repouso que passaram a cruzar o livro"""
+        bid, ask = self.market.best_bid_ask(coin)
+        for oid, order in list(self.open_orders.items()):
+            if order["coin"] != coin:
+                continue
+            px = float(order["limitPx"])
+            is_buy = order["side"] == "B"
+            if (is_buy and ask is not None and px >= ask) or (not is_buy and bid is not None and px <= bid):
+                del self.open_orders[oid]
+                self._order_update({**order, "sz": "0"}, "filled")
+                self._fill(coin, is_buy, float(order["sz"]), px, oid)
+
+    def clearinghouse_state(self) -> dict:
+        asset_positions = []
+        total_ntl = 0.0
+        margin_used = 0.0
+        unrealized = 0.0
+        for coin, position in self.positions.items():
+            if position["szi"] == 0:
+                continue
+            mark = self.market.mids.get(coin, position["entryPx"])
+            ntl = abs(position["szi"]) * mark
+            upnl = position["szi"] * (mark - position["entryPx"])
+            leverage = self.leverage.get(coin, 20)
+            total_ntl += ntl
+            margin_used += ntl / leverage
+            unrealized += upnl
+            asset_positions.append({
+                "type": "oneWay",
+                "position": {
+                    "coin": coin,
+                    "szi": fmt(position["szi"]),
+                    "entryPx": fmt(position["entryPx"]),
+                    "positionValue": fmt(ntl),
+                    "unrealizedPnl": fmt(upnl),
+                    "returnOnEquity": fmt(upnl / (ntl / leverage)) if ntl else "0",
+                    "liquidationPx": None,
+                    "marginUsed": fmt(ntl / leverage),
+                    "leverage": {"type": "cross", "value": leverage},
+                    "maxLeverage": 50,
+                    "cumFunding": {"allTime": "0", "sinceOpen": "0", "sinceChange": "0"},
+                },
+            })
+        account_value = self.account_value + unrealized
+        summary = {
+            "accountValue": fmt(account_value),
+            "totalNtlPos": fmt(total_ntl),
+            "totalRawUsd": fmt(self.account_value),
+            "totalMarginUsed": fmt(margin_used),
+        }
+        return {
+            "marginSummary": summary,
+            "crossMarginSummary": summary,
+            "crossMaintenanceMarginUsed": fmt(margin_used / 2),
+            "withdrawable": fmt(max(account_value - margin_used, 0.0)),
+            "assetPositions": asset_positions,
+            "time": int(time.time() * 1000),
+        }
+
+
+async def file_source(path: str, loop: bool) -> AsyncIterator[Tuple[float, dict]]:
+    """Lê ticks gravados (uma linha JSON por mensagem: {"t": ms, "msg": {...}})"""
+    while True:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                record = json.loads(line)
+                if "msg" in record:
+                    yield float(record["t"]), record["msg"]
+        if not loop:
+            return
+
+
+async def synthetic_source(universe: List[dict], rate: float, seed: int) -> AsyncIterator[Tuple[float, dict]]:
+    """Random walk reprodutível: `rate` trades por segundo (tempo virtual), cada um seguido do l2Book do ativo"""
+    rng = random.Random(seed)
+    mids = {asset["name"]: float(asset["px"]) for asset in universe}
+    decimals = {asset["name"]: asset["szDecimals"] for asset in universe}
+    t = 0.0
+    step = 0
+    while True:
+        t += 1000.0 / rate
+        step += 1
+        coin = rng.choice(universe)["name"]
+        mid = mids[coin] * math.exp(rng.gauss(0, 0.0004))
+        mids[coin] = mid
+        sz_decimals = decimals[coin]
+        trades = []
+        for _ in range(rng.randint(1, 3)):
+            trades.append({
+                "coin": coin,
+                "side": rng.choice(["A", "B"]),
+                "px": fmt(round_px(mid, sz_decimals)),
+                "sz": fmt(max(round(rng.expovariate(1.0) * 500.0 / mid, sz_decimals), 10 ** -sz_decimals)),
+                "hash": f"0x{step:064x}",
+                "time": int(t),
+                "tid": step,
+            })
+        yield t, {"channel": "trades", "data": trades}
+        # Like the venue, the book of the traded coin moves with it (depth pricing, snapshot bid/ask)
+        yield t, {"channel": "l2Book", "data": synthetic_book(coin, mid, sz_decimals, 20, int(t))}
+        if step % 10 == 0:
+            yield t, {"channel": "allMids", "data": {"mids": {c: fmt(round_px(p, decimals[c])) for c, p in mids.items()}}}
+
+
+class ReplayEngine:
+    """Reproduz a fonte de ticks e distribui as mensagens para os clientes /ws inscritos"""
+
+    def __init__(self, source: AsyncIterator[Tuple[float, dict]], market: MarketState,
+                 account: SimulatedAccount, speed: float = 1.0):
+        self.source = source
+        self.market = market
+        self.account = account
+        self.speed = speed  # 0 = as fast as possible
+        self.paused = asyncio.Event()
+        self.paused.set()
+        self.subscribers: Dict[str, Set["ReplayClient"]] = {}
+        self.messages_replayed = 0
+        self.messages_sent = 0
+        self.messages_dropped = 0
+        self.finished = False
+        self.started_at = time.time()
+        # Fault injection: while stalled, /ws connections stay open but go silent (no data, no pongs)
+        self.stalled_until = 0.0
+        self.clients: Set["ReplayClient"] = set()
+        account.listener = self.publish_user
+
+    def stalled(self) -> bool:
+        return time.monotonic() < self.stalled_until
+
+    async def run(self):
+        last_t = None
+        async for t, msg in self.source:
+            await self.paused.wait()
+            if last_t is not None and self.speed > 0:
+                delay = (t - last_t) / 1000.0 / self.speed
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            elif self.messages_replayed % 100 == 0:
+                # As fast as possible, but let the HTTP side breathe
+                await asyncio.sleep(0)
+            last_t = t
+            self.publish(self.restamp(msg))
+        self.finished = True
+        logger.info(f"Replay finished after {self.messages_replayed} messages")
+
+    @staticmethod
+    def restamp(msg: dict) -> dict:
+        """Reescreve timestamps para o relógio atual (o backend mede idade dos dados)"""
+        now = int(time.time() * 1000)
+        data = msg.get("data")
+        if msg.get("channel") == "trades" and isinstance(data, list):
+            for trade in data:
+                trade["time"] = now
+        elif isinstance(data, dict) and "time" in data:
+            data["time"] = now
+        return msg
+
+    def publish(self, msg: dict):
+        self.messages_replayed += 1
+        self.market.apply(msg)
+        key = message_key(msg)
+        if msg.get("channel") in ("trades", "l2Book"):
+            coin = key.split(":", 1)[1].upper() if key else None
+            if coin and self.account.open_orders:
+                self.account.match_resting(coin)
+        subscribers = self.subscribers.get(key) if key else None
+        if not subscribers:
+            return
+        encoded = json.dumps(msg)
+        for client in subscribers:
+            client.enqueue(encoded)
+
+    def publish_user(self, channel: str, data):
+        """Mensagens dos canais de usuário (ordens, fills, webData2) da conta simulada"""
+        subscribers = self.subscribers.get(channel)
+        if not subscribers:
+            return
+        encoded = json.dumps({"channel": channel, "data": data})
+        for client in subscribers:
+            client.enqueue(encoded)
+
+    async def web_data_ticker(self, interval: float = 1.0):
+        """Como a venue, reenvia webData2 e activeAssetCtx periodicamente (marcação muda sem eventos da conta)"""
+        while True:
+            await asyncio.sleep(interval)
+            if self.subscribers.get("webData2"):
+                self.publish_user("webData2", self.account.web_data())
+            # activeAssetCtx is also pushed on a timer by the venue
+            for key, subscribers in list(self.subscribers.items()):
+                if key.startswith("activeAssetCtx:") and subscribers:
+                    coin = key.split(":", 1)[1].upper()
+                    encoded = json.dumps({"channel": "activeAssetCtx",
+                                          "data": {"coin": coin, "ctx": self.market.asset_ctx(coin)}})
+                    for client in subscribers:
+                        client.enqueue(encoded)
+
+    def subscribe(self, client: "ReplayClient", key: str):
+        self.subscribers.setdefault(key, set()).add(client)
+
+    def unsubscribe(self, client: "ReplayClient", key: Optional[str] = None):
+        keys = [key] if key else list(self.subscribers)
+        for k in keys:
+            self.subscribers.get(k, set()).discard(client)
+
+    def status(self) -> dict:
+        return {
+            "speed": self.speed,
+            "paused": not self.paused.is_set(),
+            "finished": self.finished,
+            "messages_replayed": self.messages_replayed,
+            "messages_sent": self.messages_sent,
+            "messages_dropped": self.messages_dropped,
+            "clients": len(self.clients),
+            "stalled": self.stalled(),
+            "uptime_seconds": round(time.time() - self.started_at, 3),
+        }
+
+
+class ReplayClient:
+    """Conexão /ws com fila própria, para que um cliente lento não trave o replay"""
+
+    def __init__(self, websocket: WebSocket, engine: ReplayEngine, max_queue: int = 10000):
+        self.websocket = websocket
+        self.engine = engine
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+
+    def enqueue(self, text: str):
+        if self.engine.stalled():
+            self.engine.messages_dropped += 1
+            return
+        try:
+            self.queue.put_nowait(text)
+        except asyncio.QueueFull:
+            self.engine.messages_dropped += 1
+
+    async def sender(self):
+        while True:
+            text = await self.queue.get()
+            await self.websocket.send_text(text)
+            self.engine.messages_sent += 1
+
+
+def create_app(source: AsyncIterator[Tuple[float, dict]], universe: List[dict],
+               mids: Optional[Dict[str, float]] = None, speed: float = 1.0) -> FastAPI:
+    """Cria o app de replay (também usado pelo benchmark)"""
+    market = MarketState(universe, mids)
+    account = SimulatedAccount(market)
+    engine = ReplayEngine(source, market, account, speed)
+    app = FastAPI()
+    app.state.engine = engine
+
+    @app.on_event("startup")
+    async def start_replay():
+        app.state.replay_task = asyncio.create_task(engine.run())
+        app.state.web_data_task = asyncio.create_task(engine.web_data_ticker())
+        logger.info(f"🎬 Replay started (speed={speed or 'max'})")
+
+    @app.post("/info")
+    async def info(request: Request):
+        body = await request.json()
+        req_type = body.get("type")
+        if req_type == "meta":
+            return {"universe": market.universe}
+        if req_type == "spotMeta":
+            return {"universe": [], "tokens": []}
+        if req_type == "perpDexs":
+            return [None]
+        if req_type == "allMids":
+            return {coin: fmt(round_px(px, market.sz_decimals.get(coin, 2))) for coin, px in market.mids.items()}
+        if req_type == "l2Book":
+            return market.l2_book(body.get("coin", ""))
+        if req_type == "candleSnapshot":
+            req = body.get("req", {})
+            return market.candles(req.get("coin", ""), req.get("interval", ""), int(req.get("startTime", 0)),
+                                  int(req.get("endTime", 0)))
+        if req_type == "metaAndAssetCtxs":
+            return [{"universe": market.universe}, [market.asset_ctx(asset["name"]) for asset in market.universe]]
+        if req_type == "clearinghouseState":
+            return account.clearinghouse_state()
+        if req_type in ("openOrders", "frontendOpenOrders"):
+            return list(account.open_orders.values())
+        if req_type == "orderStatus":
+            status = account.order_status.get(body.get("oid"))
+            return {"status": "order", "order": status} if status else {"status": "unknownOid"}
+        if req_type == "userFills":
+            return list(reversed(account.fills[-2000:]))
+        return JSONResponse(content=None, status_code=422)
+
+    @app.post("/exchange")
+    async def exchange_action(request: Request):
+        # Signatures are not verified: this is a local stand-in, never a real venue
+        body = await request.json()
+        action = body.get("action", {})
+        action_type = action.get("type")
+        if action_type == "order":
+            statuses = [account.place(wire) for wire in action.get("orders", [])]
+            return {"status": "ok", "response": {"type": "order", "data": {"statuses": statuses}}}
+        if action_type == "cancel":
+            statuses = [account.cancel(market.coin_for_asset(c["a"]), oid=c["o"]) for c in action.get("cancels", [])]
+            return {"status": "ok", "response": {"type": "cancel", "data": {"statuses": statuses}}}
+        if action_type == "cancelByCloid":
+            statuses = [account.cancel(market.coin_for_asset(c["asset"]), cloid=c["cloid"]) for c in action.get("cancels", [])]
+            return {"status": "ok", "response": {"type": "cancel", "data": {"statuses": statuses}}}
+        if action_type == "batchModify":
+            statuses = [account.modify(m["oid"], m["order"]) for m in action.get("modifies", [])]
+            return {"status": "ok", "response": {"type": "batchModify", "data": {"statuses": statuses}}}
+        if action_type == "updateLeverage":
+            coin = market.coin_for_asset(action.get("asset", -1))
+            if coin:
+                account.leverage[coin] = int(action.get("leverage", 20))
+            return {"status": "ok", "response": {"type": "default"}}
+        return {"status": "err", "response": f"Unsupported action type: {action_type}"}
+
+    @app.get("/replay/status")
+    async def replay_status():
+        return engine.status()
+
+    @app.post("/replay/control")
+    async def replay_control(control: dict):
+        """Ajusta velocidade (0 = máximo), pausa/retoma o replay e injeta falhas no /ws.
+
+        stall_ws_seconds: conexões ficam abertas mas mudas (simula conexão meio-morta)
+        drop_ws: fecha todas as conexões /ws
+        """
+        if "stall_ws_seconds" in control:
+            engine.stalled_until = time.monotonic() + max(float(control["stall_ws_seconds"]), 0.0)
+        if control.get("drop_ws"):
+            for client in list(engine.clients):
+                try:
+                    await client.websocket.close(code=1012)
+                except Exception:
+                    pass
+        if "speed" in control:
+            engine.speed = max(float(control["speed"]), 0.0)
+        if "paused" in control:
+            if control["paused"]:
+                engine.paused.clear()
+            else:
+                engine.paused.set()
+        return engine.status()
+
+    @app.websocket("/ws")
+    async def ws_endpoint(websocket: WebSocket):
+        await websocket.accept()
+        await websocket.send_text("Websocket connection established.")
+        client = ReplayClient(websocket, engine)
+        engine.clients.add(client)
+        sender = asyncio.create_task(client.sender())
+        try:
+            while True:
+                text = await websocket.receive_text()
+                try:
+                    msg = json.loads(text)
+                except json.JSONDecodeError:
+                    continue
+                method = msg.get("method")
+                if method == "ping":
+                    client.enqueue(json.dumps({"channel": "pong"}))
+                elif method in ("subscribe", "unsubscribe"):
+                    subscription = msg.get("subscription", {})
+                    key = subscription_key(subscription)
+                    if key is None:
+                        client.enqueue(json.dumps({"channel": "error", "data": f"Invalid subscription {text}"}))
+                        continue
+                    if method == "subscribe":
+                        engine.subscribe(client, key)
+                        # Like the real venue, l2Book subscriptions start with a snapshot
+                        if subscription.get("type") == "l2Book":
+                            book = market.l2_book(str(subscription.get("coin", "")).upper())
+                            if book:
+                                client.enqueue(json.dumps({"channel": "l2Book", "data": book}))
+                        elif subscription.get("type") == "activeAssetCtx":
+                            coin = str(subscription.get("coin", "")).upper()
+                            client.enqueue(json.dumps({"channel": "activeAssetCtx",
+                                                       "data": {"coin": coin, "ctx": market.asset_ctx(coin)}}))
+                        # ...and account channels with the current state
+                        user = subscription.get("user", "")
+                        if key == "webData2":
+                            client.enqueue(json.dumps({"channel": "webData2", "data": account.web_data(user)}))
+                        elif key == "userFills":
+                            client.enqueue(json.dumps({"channel": "userFills", "data": {
+                                "isSnapshot": True, "user": user, "fills": list(reversed(account.fills[-2000:]))}}))
+                        elif key == "userFundings":
+                            # No funding is simulated: an empty snapshot keeps the subscription honest
+                            client.enqueue(json.dumps({"channel": "userFundings", "data": {
+                                "isSnapshot": True, "user": user, "fundings": []}}))
+                    else:
+                        engine.unsubscribe(client, key)
+                    client.enqueue(json.dumps({
+                        "channel": "subscriptionResponse",
+                        "data": {"method": method, "subscription": subscription},
+                    }))
+        except WebSocketDisconnect:
+            pass
+        except RuntimeError:
+            pass  # closed by drop_ws
+        finally:
+            engine.clients.discard(client)
+            engine.unsubscribe(client)
+            sender.cancel()
+
+    return app
+
+
+def load_recording_header(path: str) -> Tuple[List[dict], Dict[str, float]]:
+    """Lê o universo/mids gravados na primeira linha do arquivo (se houver)"""
+    with open(path, "r", encoding="utf-8") as f:
+        first = json.loads(f.readline() or "{}")
+    if "meta" not in first:
+        return SYNTHETIC_UNIVERSE, {}
+    universe = first["meta"].get("universe", [])
+    mids = {coin: float(px) for coin, px in first.get("mids", {}).items()}
+    return universe, mids
+
+
+async def record(out: str, coins: List[str], duration: float, api_url: str, ws_url: str):
+    """Grava ticks reais (trades + l2Book) em JSONL para replay posterior"""
+    import requests
+    import websockets
+
+    meta = requests.post(f"{api_url}/info", json={"type": "meta"}, timeout=10).json()
+    mids = requests.post(f"{api_url}/info", json={"type": "allMids"}, timeout=10).json()
+    count = 0
+    with open(out, "w", encoding="utf-8") as f:
+        f.write(json.dumps({"meta": meta, "mids": mids}) + "\n")
+        async with websockets.connect(ws_url, ping_interval=None) as ws:
+            for coin in coins:
+                for sub_type in ("trades", "l2Book"):
+                    await ws.send(json.dumps({"method": "subscribe", "subscription": {"type": sub_type, "coin": coin}}))
+            deadline = time.time() + duration
+            while time.time() < deadline:
+                try:
+                    text = await asyncio.wait_for(ws.recv(), timeout=min(20.0, max(deadline - time.time(), 0.01)))
+                except asyncio.TimeoutError:
+                    await ws.send(json.dumps({"method": "ping"}))
+                    continue
+                try:
+                    msg = json.loads(text)
+                except json.JSONDecodeError:
+                    continue
+                if message_key(msg) is None:
+                    continue
+                f.write(json.dumps({"t": int(time.time() * 1000), "msg": msg}) + "\n")
+                count += 1
+    logger.info(f"✅ Recorded {count} messages to {out}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay local da API da Hyperliquid")
+    sub = parser.add_subparsers(dest="command")
+
+    rec = sub.add_parser("record", help="grava ticks da testnet em JSONL")
+    rec.add_argument("--out", required=True)
+    rec.add_argument("--coins", default="BTC,ETH,SOL")
+    rec.add_argument("--duration", type=float, default=300.0, help="segundos de gravação")
+    rec.add_argument("--api-url", default=TESTNET_API_URL)
+    rec.add_argument("--ws-url", default=TESTNET_WS_URL)
+
+    parser.add_argument("--file", help="arquivo JSONL gravado com `record`")
+    parser.add_argument("--synthetic", action="store_true", help="gera ticks sintéticos (padrão sem --file)")
+    parser.add_argument("--rate", type=float, default=20.0, help="trades/s sintéticos (tempo virtual)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--speed", type=float, default=1.0, help="multiplicador de velocidade; 0 = o mais rápido possível")
+    parser.add_argument("--loop", action="store_true", help="reinicia o arquivo ao chegar no fim")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    args = parser.parse_args()
+
+    if args.command == "record":
+        coins = [c.strip().upper() for c in args.coins.split(",") if c.strip()]
+        asyncio.run(record(args.out, coins, args.duration, args.api_url.rstrip("/"), args.ws_url))
+        return
+
+    if args.file and not args.synthetic:
+        universe, mids = load_recording_header(args.file)
+        source = file_source(args.file, args.loop)
+    else:
+        universe, mids = SYNTHETIC_UNIVERSE, {}
+        source = synthetic_source(SYNTHETIC_UNIVERSE, args.rate, args.seed)
+
+    import uvicorn
+    app = create_app(source, universe, mids, args.speed)
+    logger.info(f"Replay server on http://{args.host}:{args.port} (ws://{args.host}:{args.port}/ws)")
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""
+Checagem de risco pré-trade, antes de a ordem ser assinada.
+
+Regras síncronas, em processo, contra estado já em memória (conta, metadata,
+livro L2 local) - nenhuma chamada de rede no caminho da ordem:
+
+- order_notional: notional da ordem <= limite
+- position_notional: notional da posição resultante <= limite
+- open_orders: quantidade de ordens abertas < limite
+- leverage: alavancagem pedida <= maxLeverage do ativo
+- price_deviation: ordem marketable não pode passar do mid por mais que X
+- book_depth: ordem marketable não pode ser maior que fração da profundidade visível
+- margin: margem inicial da parte que aumenta a posição <= saldo sacável
+
+Limites vêm do runtime settings (0 desliga a regra). Regras sem o dado
+necessário (conta não semeada, sem livro) são puladas e reportadas como tal.
+"""
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional
+
+DEFAULT_LEVERAGE = 20.0
+
+
+class RiskRejected(Exception):
+    """Ordem barrada por uma ou mais regras"""
+
+    def __init__(self, violations: List[dict]):
+        super().__init__("; ".join(f"{v['rule']}: {v['message']}" for v in violations))
+        self.violations = violations
+
+
+class PreTradeRisk:
+    def __init__(self, settings):
+        self.configure(settings)
+        self.stats = {"checks": 0, "rejected": 0, "skipped_rules": 0}
+        self.rejections: Dict[str, int] = {}
+        self._latency_us = deque(maxlen=1000)
+        self._rules: List[Callable[[dict], Optional[str]]] = [
+            self._order_notional, self._position_notional, self._open_orders, self._leverage,
+            self._price_deviation, self._book_depth, self._margin,
+        ]
+
+    def configure(self, settings):
+        self.enabled = settings.risk_enabled
+        self.max_order_notional = settings.risk_max_order_notional_usd
+        self.max_position_notional = settings.risk_max_position_notional_usd
+        self.max_open_orders = settings.risk_max_open_orders
+        self.max_price_deviation = settings.risk_max_price_deviation
+        self.max_book_fraction = settings.risk_max_book_fraction
+        self.margin_check = settings.risk_margin_check
+
+    def check(self, symbol: str, is_buy: bool, size: float, price: float, *, mid: Optional[float],
+              leverage: Optional[float], asset: Optional[dict], account, book: Optional[dict],
+              new_order: bool = True, replaces: float = 0.0) -> dict:
+        """Avalia todas as regras; levanta RiskRejected com todas as violações.
+
+        new_order=False para modificações: a ordem já conta entre as abertas.
+        replaces: tamanho da ordem em repouso que esta substitui (mesmo lado); posição
+        e margem contam só a diferença, notional e profundidade a ordem inteira.
+        """
+        if not self.enabled:
+            return {"checked": False}
+        start = time.perf_counter_ns()
+        position = account.positions.get(symbol) if account is not None and account.seeded else None
+        current = position["size"] if position else 0.0
+        # A modify only adds what it grows the resting order by; shrinking frees exposure
+        added = max(size - replaces, 0.0)
+        signed = added if is_buy else -added
+        ctx = {
+            "symbol": symbol, "is_buy": is_buy, "size": size, "price": price, "mid": mid or price,
+            "leverage": leverage or (position or {}).get("leverage"), "asset": asset or {},
+            "account": account if account is not None and account.seeded else None, "book": book,
+            "current": current, "resulting": current + signed, "new_order": new_order,
+            # Only the part that grows the position needs new margin
+            "increase": max(abs(current + signed) - abs(current), 0.0),
+            "skipped": [],
+        }
+        violations = []
+        for rule in self._rules:
+            message = rule(ctx)
+            if message:
+                violations.append({"rule": rule.__name__.lstrip("_"), "message": message})
+        elapsed_us = (time.perf_counter_ns() - start) / 1000
+        self._latency_us.append(elapsed_us)
+        self.stats["checks"] += 1
+        self.stats["skipped_rules"] += len(ctx["skipped"])
+        if violations:
+            self.stats["rejected"] += 1
+            for violation in violations:
+                self.rejections[violation["rule"]] = self.rejections.get(violation["rule"], 0) + 1
+            raise RiskRejected(violations)
+        return {"checked": True, "skipped": ctx["skipped"], "latency_us": round(elapsed_us, 1)}
+
+    @staticmethod
+    def _marketable(ctx: dict) -> bool:
+        book = ctx["book"]
+        if book:
+            side = book["asks"] if ctx["is_buy"] else book["bids"]
+            if side:
+                best = side[0][0]
+                return ctx["price"] >= best if ctx["is_buy"] else ctx["price"] <= best
+        return ctx["price"] >= ctx["mid"] if ctx["is_buy"] else ctx["price"] <= ctx["mid"]
+
+    def _order_notional(self, ctx: dict) -> Optional[str]:
+        notional = ctx["size"] * ctx["price"]
+        if self.max_order_notional and notional > self.max_order_notional:
+            return f"order notional {notional:,.2f} USD exceeds {self.max_order_notional:,.2f}"
+        return None
+
+    def _position_notional(self, ctx: dict) -> Optional[str]:
+        if not self.max_position_notional:
+            return None
+        resulting = abs(ctx["resulting"]) * ctx["mid"]
+        if ctx["increase"] > 0 and resulting > self.max_position_notional:
+            return f"resulting {ctx['symbol']} position {resulting:,.2f} USD exceeds {self.max_position_notional:,.2f}"
+        return None
+
+    def _open_orders(self, ctx: dict) -> Optional[str]:
+        if not self.max_open_orders or not ctx["new_order"]:
+            return None
+        if ctx["account"] is None:
+            ctx["skipped"].append("open_orders")
+            return None
+        count = len(ctx["account"].open_orders)
+        if count >= self.max_open_orders:
+            return f"{count} open orders, limit is {self.max_open_orders}"
+        return None
+
+    def _leverage(self, ctx: dict) -> Optional[str]:
+        max_leverage = ctx["asset"].get("maxLeverage")
+        if ctx["leverage"] and max_leverage and ctx["leverage"] > max_leverage:
+            return f"leverage {ctx['leverage']:g}x above {ctx['symbol']} max {max_leverage}x"
+        return None
+
+    def _price_deviation(self, ctx: dict) -> Optional[str]:
+        if not self.max_price_deviation or not self._marketable(ctx):
+            return None
+        deviation = abs(ctx["price"] / ctx["mid"] - 1)
+        if deviation > self.max_price_deviation:
+            return f"price {ctx['price']:g} is {deviation:.2%} from mid {ctx['mid']:g} (max {self.max_price_deviation:.2%})"
+        return None
+
+    def _book_depth(self, ctx: dict) -> Optional[str]:
+        if not self.max_book_fraction or not self._marketable(ctx):
+            return None
+        book = ctx["book"]
+        side = (book or {}).get("asks" if ctx["is_buy"] else "bids")
+        if not side:
+            ctx["skipped"].append("book_depth")
+            return None
+        depth = sum(size for _, size in side)
+        if ctx["size"] > depth * self.max_book_fraction:
+            return (f"size {ctx['size']:g} exceeds {self.max_book_fraction:.0%} of visible depth "
+                    f"({depth:g} over {len(side)} levels)")
+        return None
+
+    def _margin(self, ctx: dict) -> Optional[str]:
+        if not self.margin_check or ctx["increase"] <= 0:
+            return None
+        account = ctx["account"]
+        if account is None or account.withdrawable is None:
+            ctx["skipped"].append("margin")
+            return None
+        leverage = ctx["leverage"] or min(DEFAULT_LEVERAGE, ctx["asset"].get("maxLeverage") or DEFAULT_LEVERAGE)
+        required = ctx["increase"] * ctx["price"] / leverage
+        if required > account.withdrawable:
+            return f"needs {required:,.2f} USD initial margin at {leverage:g}x, {account.withdrawable:,.2f} available"
+        return None
+
+    def metrics(self) -> dict:
+        latencies = sorted(self._latency_us)
+        return {
+            "enabled": self.enabled,
+            **self.stats,
+            "rejections_by_rule": dict(self.rejections),
+            "latency_us": {
+                "p50": round(latencies[len(latencies) // 2], 1) if latencies else None,
+                "max": round(latencies[-1], 1) if latencies else None,
+            },
+        }
+
+    def limits(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "max_order_notional_usd": self.max_order_notional,
+            "max_position_notional_usd": self.max_position_notional,
+            "max_open_orders": self.max_open_orders,
+            "max_price_deviation": self.max_price_deviation,
+            "max_book_fraction": self.max_book_fraction,
+            "margin_check": self.margin_check,
+        }
@@ -0,0 +1,108 @@
+"""
+Cenários de margem e liquidação (cross margin), vetorizados com NumPy.
+
+Para N ativos e S cenários de choque de preço, calcula de uma vez (matrizes S x N):
+
+- PnL do cenário (contra a marcação atual) e PnL não realizado (contra a entrada)
+- equity, margem de manutenção e margin ratio (manutenção / equity; >= 1 liquida)
+- preço de liquidação de cada ativo no cenário, com os demais ativos nos preços do cenário
+
+Modelo da Hyperliquid: margem de manutenção = notional / (2 * maxLeverage).
+"""
+from typing import Dict, List, Optional, Sequence, Union
+
+import numpy as np
+
+DEFAULT_MAX_LEVERAGE = 50.0
+MAX_SCENARIOS = 10_000
+
+
+class ScenarioError(ValueError):
+    """Entrada inválida (ativo sem marcação, grade de choques com formato errado)"""
+
+
+def maintenance_rate(max_leverage: Optional[float]) -> float:
+    return 1.0 / (2.0 * (max_leverage or DEFAULT_MAX_LEVERAGE))
+
+
+def shock_matrix(coins: Sequence[str], shocks: Union[List[float], Dict[str, List[float]], None],
+                 range_pct: float = 0.2, steps: int = 41) -> np.ndarray:
+    """Grade S x N de choques relativos (-0.1 = -10%).
+
+    - None: linspace(-range_pct, +range_pct, steps) aplicado a todos os ativos
+    - lista: os mesmos choques para todos os ativos
+    - dict ativo -> lista: choques por ativo (todas as listas com o mesmo tamanho; ausentes = 0)
+    """
+    n = len(coins)
+    if shocks is None:
+        grid = np.linspace(-range_pct, range_pct, steps)
+        matrix = np.repeat(grid[:, None], n, axis=1)
+    elif isinstance(shocks, dict):
+        lengths = {len(values) for values in shocks.values()}
+        if len(lengths) != 1:
+            raise ScenarioError("All per-asset shock lists must have the same length")
+        unknown = set(shocks) - set(coins)
+        if unknown:
+            raise ScenarioError(f"Shocks given for assets without a position: {', '.join(sorted(unknown))}")
+        matrix = np.zeros((lengths.pop(), n))
+        for j, coin in enumerate(coins):
+            if coin in shocks:
+                matrix[:, j] = shocks[coin]
+    else:
+        matrix = np.repeat(np.asarray(shocks, dtype=float)[:, None], n, axis=1)
+    if matrix.shape[0] == 0 or matrix.shape[0] > MAX_SCENARIOS:
+        raise ScenarioError(f"Between 1 and {MAX_SCENARIOS} scenarios are supported")
+    if np.any(matrix <= -1.0):
+        raise ScenarioError("Shocks must be greater than -100%")
+    return matrix
+
+
+def margin_scenarios(sizes: np.ndarray, entries: np.ndarray, marks: np.ndarray, mmr: np.ndarray,
+                     account_value: float, shocks: np.ndarray) -> Dict[str, np.ndarray]:
+    """Um passe vetorizado sobre todos os cenários (shocks: S x N, vetores: N)"""
+    prices = marks * (1.0 + shocks)                          # S x N
+    notional = np.abs(sizes) * prices
+    pnl = (prices - marks) @ sizes                           # S
+    unrealized = (prices - entries) @ sizes                  # S
+    equity = account_value + pnl
+    maint_by_asset = notional * mmr                          # S x N
+    maintenance = maint_by_asset.sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        margin_ratio = np.where(equity > 0, maintenance / equity, np.inf)
+        # Per asset, others fixed at the scenario prices:
+        # equity - s*p + s*x = maint - |s|*m*p + |s|*m*x  ->  x = p - (equity - maint) / (s - |s|*m)
+        denom = sizes - np.abs(sizes) * mmr
+        liquidation = prices - (equity - maintenance)[:, None] / denom
+    liquidation = np.where((sizes != 0) & (liquidation > 0), liquidation, np.nan)
+    return {
+        "prices": prices,
+        "pnl": pnl,
+        "unrealized_pnl": unrealized,
+        "equity": equity,
+        "maintenance_margin": maintenance,
+        "margin_ratio": margin_ratio,
+        "liquidated": margin_ratio >= 1.0,
+        "liquidation_prices": liquidation,
+    }
+
+
+def merge_positions(base: List[dict], extra: List[dict]) -> List[dict]:
+    """Soma posições hipotéticas (ex.: a ordem sendo digitada) às posições atuais, por ativo"""
+    merged = {p["coin"].upper(): dict(p, coin=p["coin"].upper()) for p in base}
+    for p in extra:
+        coin = p["coin"].upper()
+        current = merged.get(coin)
+        if current is None:
+            merged[coin] = dict(p, coin=coin)
+            continue
+        old, add = current["size"], p["size"]
+        new = old + add
+        entry = current.get("entry_price") or p.get("entry_price")
+        if old == 0 or (new != 0 and (new > 0) != (old > 0)):
+            entry = p.get("entry_price")  # opened or flipped
+        elif (add > 0) == (old > 0) and entry and p.get("entry_price"):
+            entry = (abs(old) * entry + abs(add) * p["entry_price"]) / abs(new)
+        current.update(size=new, entry_price=entry, mark_price=p.get("mark_price") or current.get("mark_price"))
+        if p.get("leverage"):
+            current["leverage"] = p["leverage"]
+    return [p for p in merged.values() if p["size"]]
@@ -0,0 +1,185 @@
+"""
+Configuração de runtime tipada.
+
+O .env é lido uma única vez no import; depois disso a fonte da verdade é o
+objeto em memória. Subsistemas se inscrevem com `runtime.subscribe(callback)`
+e recebem as mudanças feitas via `runtime.update(...)` (ex.: POST /api/config),
+em vez de consultar os.getenv no caminho quente.
+"""
+import logging
+import os
+from threading import RLock
+from typing import Any, Callable, Dict, List, Literal, Tuple
+
+from dotenv import load_dotenv
+from pydantic import BaseModel, ConfigDict, Field, model_validator
+
+logger = logging.getLogger(__name__)
+
+TESTNET_API_URL = "https://api.hyperliquid-testnet.xyz"
+# Weight of an ordinary info call (meta, user_fills...): the budget left outside the order reserve must fit one
+MIN_UPSTREAM_REQUEST_WEIGHT = 20
+
+# changed fields -> (old, new), plus the new snapshot
+SettingsListener = Callable[[Dict[str, Tuple[Any, Any]], "Settings"], None]
+
+
+def _env_str(name: str, default: str = "") -> str:
+    return os.getenv(name, default).strip().strip('"\'')
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None or not value.strip():
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def _env_number(name: str, default: float, cast: Callable[[str], Any] = float):
+    value = os.getenv(name)
+    if value is None or not value.strip():
+        return default
+    try:
+        return cast(value.strip())
+    except ValueError:
+        logger.warning(f"Invalid {name}={value!r}, using {default}")
+        return default
+
+
+class Settings(BaseModel):
+    """Snapshot imutável da configuração"""
+    model_config = ConfigDict(frozen=True)
+
+    account_address: str = ""
+    secret_key: str = ""
+    api_url: str = TESTNET_API_URL
+    ws_url: str = ""
+    price_source: Literal["rest", "websocket"] = "rest"
+    rest_enabled: bool = True
+    websocket_enabled: bool = False
+    # Upstream REST budget (Hyperliquid: 1200 weight/min per IP); the reserve is kept for orders
+    upstream_weight_per_minute: int = Field(1200, gt=0)
+    upstream_order_reserve: float = Field(0.1, ge=0, lt=1)
+    # SDK request timeout and circuit breaker thresholds (per endpoint class)
+    upstream_timeout_seconds: float = Field(5.0, gt=0)
+    breaker_failure_ratio: float = Field(0.5, gt=0, le=1)
+    breaker_slow_call_seconds: float = Field(2.0, gt=0)
+    breaker_open_seconds: float = Field(5.0, gt=0)
+    # WebSocket feed: ping cadence (traffic or not) and the floor of the pong deadline. The deadline
+    # itself follows the measured ping RTT (srtt + 4 x rttvar, capped at 5s), so a slow testnet link
+    # widens it on its own instead of being declared dead; a dead link is seen in about
+    # deadline + cadence, well under a second on a healthy connection
+    feed_heartbeat_seconds: float = Field(0.25, gt=0)
+    feed_heartbeat_timeout_seconds: float = Field(0.5, gt=0)
+    # Backend-side REST refresh for push clients while the WebSocket feed is off
+    rest_poll_seconds: float = Field(2.0, gt=0)
+    # Market orders: IOC limit = estimated worst fill from L2 depth +/- this fraction
+    market_slippage_tolerance: float = Field(0.001, ge=0, lt=0.5)
+    # Pre-trade risk limits, checked before an order is signed (0 disables a limit)
+    risk_enabled: bool = True
+    risk_max_order_notional_usd: float = Field(100_000.0, ge=0)
+    risk_max_position_notional_usd: float = Field(500_000.0, ge=0)
+    risk_max_open_orders: int = Field(200, ge=0)
+    # Marketable orders only: limit price vs mid, and size vs visible depth on the side taken
+    risk_max_price_deviation: float = Field(0.05, ge=0)
+    risk_max_book_fraction: float = Field(1.0, ge=0)
+    risk_margin_check: bool = True
+    # Event-loop lag monitor: tick period and the stall length that captures the blocking stack
+    loop_monitor_interval_ms: float = Field(100.0, gt=0)
+    loop_lag_threshold_ms: float = Field(100.0, gt=0)
+    # Required as X-Admin-Token by the profiling/diagnostic endpoints when set
+    admin_token: str = ""
+
+    @model_validator(mode="after")
+    def check_upstream_budget(self) -> "Settings":
+        available = self.upstream_weight_per_minute * (1 - self.upstream_order_reserve)
+        if available < MIN_UPSTREAM_REQUEST_WEIGHT:
+            raise ValueError(
+                f"upstream_weight_per_minute * (1 - upstream_order_reserve) = {available:g} leaves no room for an "
+                f"info call (weight {MIN_UPSTREAM_REQUEST_WEIGHT}); raise the budget or lower the reserve")
+        return self
+
+    @classmethod
+    def from_env(cls) -> "Settings":
+        api_url = _env_str("HYPERLIQUID_API_URL").rstrip("/") or TESTNET_API_URL
+        price_source = _env_str("PRICE_SOURCE", "rest").lower()
+        return cls(
+            account_address=_env_str("ACCOUNT_ADDRESS"),
+            secret_key=_env_str("SECRET_KEY"),
+            api_url=api_url,
+            ws_url=_env_str("HYPERLIQUID_WS_URL") or "ws" + api_url[len("http"):] + "/ws",
+            price_source=price_source if price_source in ("rest", "websocket") else "rest",
+            rest_enabled=_env_bool("REST_ENABLED", True),
+            websocket_enabled=_env_bool("WEBSOCKET_ENABLED", False),
+            upstream_weight_per_minute=_env_number("UPSTREAM_WEIGHT_PER_MINUTE", 1200, int),
+            upstream_order_reserve=_env_number("UPSTREAM_ORDER_RESERVE", 0.1),
+            upstream_timeout_seconds=_env_number("UPSTREAM_TIMEOUT_SECONDS", 5.0),
+            breaker_failure_ratio=_env_number("BREAKER_FAILURE_RATIO", 0.5),
+            breaker_slow_call_seconds=_env_number("BREAKER_SLOW_CALL_SECONDS", 2.0),
+            breaker_open_seconds=_env_number("BREAKER_OPEN_SECONDS", 5.0),
+            feed_heartbeat_seconds=_env_number("FEED_HEARTBEAT_SECONDS", 0.25),
+            feed_heartbeat_timeout_seconds=_env_number("FEED_HEARTBEAT_TIMEOUT_SECONDS", 0.5),
+            rest_poll_seconds=_env_number("REST_POLL_SECONDS", 2.0),
+            market_slippage_tolerance=_env_number("MARKET_SLIPPAGE_TOLERANCE", 0.001),
+            risk_enabled=_env_bool("RISK_ENABLED", True),
+            risk_max_order_notional_usd=_env_number("RISK_MAX_ORDER_NOTIONAL_USD", 100_000.0),
+            risk_max_position_notional_usd=_env_number("RISK_MAX_POSITION_NOTIONAL_USD", 500_000.0),
+            risk_max_open_orders=_env_number("RISK_MAX_OPEN_ORDERS", 200, int),
+            risk_max_price_deviation=_env_number("RISK_MAX_PRICE_DEVIATION", 0.05),
+            risk_max_book_fraction=_env_number("RISK_MAX_BOOK_FRACTION", 1.0),
+            risk_margin_check=_env_bool("RISK_MARGIN_CHECK", True),
+            loop_monitor_interval_ms=_env_number("LOOP_MONITOR_INTERVAL_MS", 100.0),
+            loop_lag_threshold_ms=_env_number("LOOP_LAG_THRESHOLD_MS", 100.0),
+            admin_token=_env_str("ADMIN_TOKEN"),
+        )
+
+
+class RuntimeSettings:
+    """Guarda o snapshot atual e notifica inscritos quando ele muda"""
+
+    def __init__(self, settings: Settings):
+        self._settings = settings
+        self._listeners: List[SettingsListener] = []
+        self._lock = RLock()
+
+    @property
+    def current(self) -> Settings:
+        return self._settings
+
+    def __getattr__(self, name: str):
+        # runtime.websocket_enabled reads straight from the current snapshot
+        return getattr(self._settings, name)
+
+    def subscribe(self, listener: SettingsListener) -> SettingsListener:
+        """Registra um callback (também utilizável como decorator)"""
+        self._listeners.append(listener)
+        return listener
+
+    def update(self, **changes) -> Settings:
+        """Aplica mudanças validadas e notifica apenas se algo mudou"""
+        with self._lock:
+            old = self._settings
+            new = Settings.model_validate({**old.model_dump(), **changes})
+            changed = {
+                field: (getattr(old, field), getattr(new, field))
+                for field in Settings.model_fields
+                if getattr(old, field) != getattr(new, field)
+            }
+            if not changed:
+                return old
+            self._settings = new
+        for listener in list(self._listeners):
+            try:
+                listener(changed, new)
+            except Exception as e:
+                logger.error(f"Settings listener {getattr(listener, '__name__', listener)} failed: {e}")
+        return new
+
+    def reload_credentials(self) -> Settings:
+        """Relê ACCOUNT_ADDRESS/SECRET_KEY do .env (ação explícita, fora do caminho quente)"""
+        load_dotenv(override=True)
+        return self.update(account_address=_env_str("ACCOUNT_ADDRESS"), secret_key=_env_str("SECRET_KEY"))
+
+
+load_dotenv()
+runtime = RuntimeSettings(Settings.from_env())
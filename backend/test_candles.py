@@ -0,0 +1,119 @@
+"""Testes do cache de candles (faixas cobertas, cauda rebuscada, arquivo só de acréscimo)"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from candles import COMPACT_AFTER_LINES, CandleHistory, merge_ranges, missing_ranges
+
+STEP = 60_000
+
+
+class FakeUpstream:
+    async def run(self, fn, *args, weight, priority):
+        return fn(*args)
+
+
+class FakeInfo:
+    """candles_snapshot com um candle por minuto a partir de `listed`, sem os `unpublished` últimos"""
+
+    def __init__(self, listed=0, unpublished=0):
+        self.listed = listed
+        self.unpublished = unpublished
+        self.calls = []
+
+    def candles_snapshot(self, symbol, interval, start, end):
+        self.calls.append((start, end + 1))
+        newest = (int(time.time() * 1000) // STEP - self.unpublished) * STEP
+        first = max(start, self.listed)
+        first += -first % STEP
+        return [{"t": t, "T": t + STEP - 1, "o": "1", "h": "1", "l": "1", "c": "1", "v": "0", "n": 0}
+                for t in range(first, min(end + 1, newest + 1), STEP)]
+
+
+def history(info, cache_dir=None):
+    async def get_info_client():
+        return info
+
+    return CandleHistory(FakeUpstream(), get_info_client, cache_dir, live_ttl=60.0)
+
+
+def now_bucket():
+    return int(time.time() * 1000) // STEP * STEP
+
+
+def test_merge_and_missing_ranges():
+    assert merge_ranges([(5, 8), (0, 3), (3, 4), (7, 10)]) == [(0, 4), (5, 10)]
+    assert missing_ranges([(0, 4), (5, 10)], 0, 12) == [(4, 5), (10, 12)]
+    assert missing_ranges([(0, 4)], 1, 3) == []
+    assert missing_ranges([], 2, 6) == [(2, 6)]
+
+
+def test_second_request_is_served_from_cache():
+    info = FakeInfo()
+    candles = history(info)
+    start = now_bucket() - 100 * STEP
+    first = asyncio.run(candles.get("BTC", "1m", start, start + 50 * STEP))
+    second = asyncio.run(candles.get("BTC", "1m", start + 10 * STEP, start + 40 * STEP))
+    assert first["count"] == 50 and not first["cached"]
+    assert second["count"] == 30 and second["cached"]
+    assert len(info.calls) == 1
+
+
+def test_empty_tail_is_not_marked_covered():
+    # The last closed candle is not published yet: the upstream answers the tail empty
+    info = FakeInfo(unpublished=2)
+    candles = history(info)
+    open_bucket = now_bucket()
+    asyncio.run(candles.get("BTC", "1m", open_bucket - 10 * STEP, open_bucket + STEP))
+    series = candles.series[("BTC", "1m")]
+    assert series.covered[-1][1] <= open_bucket - STEP
+    assert missing_ranges(series.covered, open_bucket - 10 * STEP, open_bucket) != []
+
+
+def test_closed_empty_range_before_listing_is_covered():
+    start = now_bucket() - 100 * STEP
+    info = FakeInfo(listed=start + 50 * STEP)
+    candles = history(info)
+    asyncio.run(candles.get("BTC", "1m", start, start + 20 * STEP))
+    again = asyncio.run(candles.get("BTC", "1m", start, start + 20 * STEP))
+    assert again["count"] == 0 and again["cached"]
+    assert len(info.calls) == 1
+
+
+def test_cache_file_is_appended_and_reloaded():
+    with tempfile.TemporaryDirectory() as cache_dir:
+        start = now_bucket() - 100 * STEP
+        candles = history(FakeInfo(), cache_dir)
+        asyncio.run(candles.get("BTC", "1m", start, start + 10 * STEP))
+        asyncio.run(candles.get("BTC", "1m", start + 20 * STEP, start + 30 * STEP))
+        path = os.path.join(cache_dir, "BTC_1m.jsonl")
+        with open(path, "rb") as f:
+            assert len(f.read().splitlines()) == 2
+
+        info = FakeInfo()
+        reloaded = history(info, cache_dir)
+        result = asyncio.run(reloaded.get("BTC", "1m", start, start + 10 * STEP))
+        assert result["cached"] and result["count"] == 10
+        assert info.calls == []
+
+
+def test_cache_file_is_compacted_on_load():
+    with tempfile.TemporaryDirectory() as cache_dir:
+        start = now_bucket() - 1000 * STEP
+        candles = history(FakeInfo(), cache_dir)
+        for i in range(COMPACT_AFTER_LINES + 1):
+            asyncio.run(candles.get("BTC", "1m", start + 2 * i * STEP, start + (2 * i + 1) * STEP))
+        path = os.path.join(cache_dir, "BTC_1m.jsonl")
+        with open(path, "ab") as f:
+            f.write(b'{"covered": [[')  # torn last append
+
+        reloaded = history(FakeInfo(), cache_dir)
+        asyncio.run(reloaded.get("BTC", "1m", start, start + STEP))
+        assert reloaded.stats["compactions"] == 1
+        with open(path, "rb") as f:
+            assert len(f.read().splitlines()) == 1
+        assert len(reloaded.series[("BTC", "1m")].covered) == COMPACT_AFTER_LINES + 1
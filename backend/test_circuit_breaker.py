@@ -0,0 +1,83 @@
+"""Testes do circuit breaker (abertura, prova meio-aberta, backoff)"""
+import os
+import sys
+import time
+
+import pytest
+import requests
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError, is_upstream_failure
+
+
+class HTTPError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+def tripped(open_seconds=0.05, open_max_seconds=0.15) -> CircuitBreaker:
+    breaker = CircuitBreaker("test", failure_ratio=0.5, min_calls=2, window=4,
+                             open_seconds=open_seconds, open_max_seconds=open_max_seconds)
+    breaker.record_failure(TimeoutError("slow"))
+    breaker.record_failure(TimeoutError("slow"))
+    assert breaker.state == OPEN
+    return breaker
+
+
+def test_upstream_failure_classification():
+    assert is_upstream_failure(HTTPError(503))
+    assert is_upstream_failure(HTTPError(429))
+    assert not is_upstream_failure(HTTPError(400))
+    assert is_upstream_failure(requests.exceptions.ConnectionError())
+    assert not is_upstream_failure(ValueError("bad input"))
+
+
+def test_opens_on_failure_ratio_and_rejects():
+    breaker = tripped(open_seconds=60.0)
+    with pytest.raises(CircuitOpenError) as excinfo:
+        breaker.before_call()
+    assert excinfo.value.retry_after > 0
+    assert breaker.stats["rejected"] == 1
+
+
+def test_slow_calls_count_as_bad():
+    breaker = CircuitBreaker("test", failure_ratio=0.5, min_calls=2, slow_call_seconds=1.0)
+    breaker.record_success(0.1)
+    breaker.record_success(2.0)
+    assert breaker.state == OPEN
+
+
+def test_half_open_lets_a_single_probe_through():
+    breaker = tripped()
+    time.sleep(0.06)
+    breaker.before_call()
+    assert breaker.state == HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record_success(0.01)
+    assert breaker.state == CLOSED
+    breaker.before_call()
+
+
+def test_failed_probe_reopens_with_doubled_timeout():
+    breaker = tripped()
+    time.sleep(0.06)
+    breaker.before_call()
+    breaker.record_failure(TimeoutError("still down"))
+    assert breaker.state == OPEN
+    assert breaker.retry_after() == pytest.approx(0.1, abs=0.02)
+    time.sleep(0.11)
+    breaker.before_call()
+    breaker.record_failure(TimeoutError("still down"))
+    assert breaker.retry_after() <= 0.15  # capped at open_max_seconds
+
+
+def test_released_probe_frees_the_slot():
+    breaker = tripped()
+    time.sleep(0.06)
+    breaker.before_call()
+    breaker.release_probe()  # e.g. our own 4xx: says nothing about the upstream
+    assert breaker.state == HALF_OPEN
+    breaker.before_call()
@@ -0,0 +1,17 @@
+"""Testes da deduplicação limitada de chaves"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from dedup import RecentKeys
+
+
+def test_recent_keys_forget_the_oldest():
+    keys = RecentKeys(3)
+    assert [keys.seen(k) for k in (1, 2, 1, 3, 4)] == [False, False, True, False, False]
+    assert len(keys) == 3
+    assert 1 not in keys and 4 in keys
+    assert not keys.seen(1)  # forgotten, so new again
+    keys.clear()
+    assert len(keys) == 0
@@ -0,0 +1,195 @@
+"""Testes do agendador de execução (twap, iceberg, pov) com submit/status falsos"""
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from execution import MAX_CONSECUTIVE_CHILD_ERRORS, POV_STALL_INTERVALS, ExecutionScheduler
+from risk import RiskRejected
+
+
+class FakeVenue:
+    """Executa IOCs em `fill_ratio` do tamanho a `price`; ordens limitadas ficam em repouso"""
+
+    def __init__(self, price=100.0, fill_ratio=1.0, errors=0, resting_avg_price=None):
+        self.price = price
+        self.fill_ratio = fill_ratio
+        self.errors = errors
+        self.resting_avg_price = resting_avg_price
+        self.sent = []
+        self.canceled = []
+        self.volume = 0.0
+        self._oids = iter(range(1, 10_000))
+        self.resting = {}
+
+    async def submit(self, symbol, is_buy, size, limit_price, reduce_only):
+        self.sent.append((size, limit_price))
+        if self.errors:
+            self.errors -= 1
+            raise ConnectionError("upstream down")
+        if limit_price is not None:
+            oid = next(self._oids)
+            self.resting[oid] = size
+            return {"status": "resting", "oid": oid, "filled": 0.0}
+        filled = size * self.fill_ratio
+        return {"status": "filled" if filled else "canceled", "filled": filled, "avg_price": self.price}
+
+    async def status(self, symbol, oid):
+        # Each resting clip is filled completely on the first poll
+        return {"status": "filled", "filled": self.resting.pop(oid, 0.0), "avg_price": self.resting_avg_price}
+
+    async def cancel(self, symbol, oid):
+        self.canceled.append(oid)
+
+    def scheduler(self, volume_available=None) -> ExecutionScheduler:
+        return ExecutionScheduler(self.submit, self.status, self.cancel, lambda symbol: self.volume,
+                                  lambda symbol: 0.01, volume_available=volume_available)
+
+
+async def finish(parent, timeout=2.0):
+    await asyncio.wait_for(asyncio.shield(parent.task), timeout)
+    return parent
+
+
+def test_twap_rolls_unfilled_size_forward():
+    async def scenario():
+        venue = FakeVenue(fill_ratio=0.5)
+        scheduler = venue.scheduler()
+        parent = scheduler.start("BTC", True, 4.0, "twap", {"duration_seconds": 0.04, "slices": 4})
+        return venue, await finish(parent)
+
+    venue, parent = asyncio.run(scenario())
+    assert [size for size, _ in venue.sent] == pytest.approx([1.0, 1.1666667, 1.4583333, 2.1875])
+    assert parent.status == "partial"
+    assert parent.progress()["avg_price"] == 100.0
+
+
+def test_start_validates_params():
+    async def scenario():
+        scheduler = FakeVenue().scheduler(volume_available=lambda: False)
+        with pytest.raises(ValueError, match="limit_price"):
+            scheduler.start("BTC", True, 1.0, "iceberg", {"display_size": 0.1})
+        with pytest.raises(ValueError, match="slices"):
+            scheduler.start("BTC", True, 1.0, "twap", {"slices": 0})
+        with pytest.raises(ValueError, match="trades feed"):
+            scheduler.start("BTC", True, 1.0, "pov", {})
+        with pytest.raises(ValueError):
+            scheduler.start("BTC", True, 1.0, "vwap", {})
+
+    asyncio.run(scenario())
+
+
+def test_consecutive_child_errors_fail_the_parent():
+    async def scenario():
+        venue = FakeVenue(errors=100)
+        scheduler = venue.scheduler()
+        parent = scheduler.start("BTC", True, 1.0, "twap", {"duration_seconds": 0.01, "slices": 100})
+        return scheduler, await finish(parent)
+
+    scheduler, parent = asyncio.run(scenario())
+    assert parent.status == "failed"
+    assert scheduler.stats["child_errors"] == MAX_CONSECUTIVE_CHILD_ERRORS
+    assert parent.children_sent == MAX_CONSECUTIVE_CHILD_ERRORS
+
+
+def test_risk_rejection_stops_the_parent():
+    async def scenario():
+        venue = FakeVenue()
+
+        async def reject(*args):
+            raise RiskRejected([{"rule": "max_order_notional", "message": "too big"}])
+
+        scheduler = ExecutionScheduler(reject, venue.status, venue.cancel, lambda symbol: 0.0, lambda symbol: 0.01)
+        parent = scheduler.start("BTC", True, 1.0, "twap", {"duration_seconds": 1, "slices": 10})
+        return await finish(parent)
+
+    parent = asyncio.run(scenario())
+    assert parent.status == "failed" and "risk" in parent.error
+
+
+def test_iceberg_prices_resting_fills_from_the_fills():
+    async def scenario():
+        venue = FakeVenue(resting_avg_price=99.0)
+        scheduler = venue.scheduler()
+        parent = scheduler.start("BTC", True, 1.0, "iceberg",
+                                 {"display_size": 0.4, "limit_price": 101.0, "poll_seconds": 0.001})
+        return venue, await finish(parent)
+
+    venue, parent = asyncio.run(scenario())
+    assert [size for size, _ in venue.sent] == pytest.approx([0.4, 0.4, 0.2])
+    assert parent.status == "completed"
+    assert parent.progress()["avg_price"] == pytest.approx(99.0)
+
+
+def test_iceberg_falls_back_to_the_limit_and_flags_it():
+    async def scenario():
+        venue = FakeVenue()
+        scheduler = venue.scheduler()
+        parent = scheduler.start("BTC", False, 0.5, "iceberg",
+                                 {"display_size": 0.5, "limit_price": 101.0, "poll_seconds": 0.001})
+        return await finish(parent)
+
+    parent = asyncio.run(scenario())
+    assert parent.progress()["avg_price"] == 101.0
+    assert parent.children[-1]["avg_price_estimated"]
+
+
+def test_cancel_pulls_the_resting_clip():
+    async def scenario():
+        venue = FakeVenue()
+
+        async def still_open(symbol, oid):
+            return {"status": "open", "filled": 0.0}
+
+        scheduler = ExecutionScheduler(venue.submit, still_open, venue.cancel, lambda symbol: 0.0,
+                                       lambda symbol: 0.01)
+        parent = scheduler.start("BTC", True, 1.0, "iceberg",
+                                 {"display_size": 0.5, "limit_price": 100.0, "poll_seconds": 0.001})
+        await asyncio.sleep(0.02)
+        await scheduler.cancel(parent.id)
+        return venue, parent
+
+    venue, parent = asyncio.run(scenario())
+    assert parent.status == "canceled"
+    assert venue.canceled == [1]
+    assert parent.resting_oid is None
+
+
+def test_pov_follows_market_volume_and_fails_when_it_stalls():
+    async def scenario():
+        venue = FakeVenue()
+        scheduler = venue.scheduler(volume_available=lambda: True)
+        parent = scheduler.start("BTC", True, 10.0, "pov", {"participation_rate": 0.1, "interval_seconds": 0.001})
+        await asyncio.sleep(0.005)  # let it take the starting volume
+        for _ in range(3):
+            venue.volume += 5.0
+            await asyncio.sleep(0.01)
+        return venue, await finish(parent, timeout=POV_STALL_INTERVALS * 0.01 + 2)
+
+    venue, parent = asyncio.run(scenario())
+    assert parent.filled == pytest.approx(1.5)
+    assert parent.status == "failed" and "no market volume" in parent.error
+
+
+def test_unknown_min_size_is_rejected_and_skipped_children_end_the_iceberg():
+    async def skipped(symbol, is_buy, size, limit_price, reduce_only):
+        return {"status": "skipped", "filled": 0.0}
+
+    async def scenario():
+        venue = FakeVenue()
+        no_price = ExecutionScheduler(skipped, venue.status, venue.cancel, lambda symbol: 0.0, lambda symbol: 0.0)
+        with pytest.raises(ValueError, match="minimum order size"):
+            no_price.start("XYZ", True, 1.0, "iceberg", {"display_size": 0.5, "limit_price": 1.0})
+
+        # A venue that takes nothing: the parent ends instead of resubmitting without ever yielding
+        scheduler = ExecutionScheduler(skipped, venue.status, venue.cancel, lambda symbol: 0.0, lambda symbol: 0.01)
+        parent = scheduler.start("BTC", True, 1.0, "iceberg",
+                                 {"display_size": 0.5, "limit_price": 100.0, "poll_seconds": 0.001})
+        return scheduler, await finish(parent, timeout=1.0)
+
+    scheduler, parent = asyncio.run(scenario())
+    assert parent.status == "partial"
+    assert scheduler.stats["children"] == 1
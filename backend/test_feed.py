@@ -0,0 +1,55 @@
+"""Testes do heartbeat do feed WebSocket (cadência fixa, prazo do pong pelo RTT)"""
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from circuit_breaker import CircuitBreaker
+from feed import INITIAL_PONG_DEADLINE, MAX_PONG_DEADLINE, DeadConnection, PriceFeed
+
+
+def feed(**kwargs) -> PriceFeed:
+    async def noop(*args):
+        return None
+
+    return PriceFeed("ws://localhost", [], noop, noop, CircuitBreaker("feed"), **kwargs)
+
+
+class SilentSocket:
+    """Aceita pings e nunca responde"""
+
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, message):
+        self.sent.append(message)
+
+
+def test_pong_deadline_follows_the_measured_rtt():
+    prices = feed(heartbeat_timeout=0.1)
+    assert prices.pong_deadline() == INITIAL_PONG_DEADLINE
+    for sent_at in range(20):
+        prices._pings.append(float(sent_at))
+        prices._pong(sent_at + 0.3)  # slow link: 300ms round trips
+    assert prices.pong_deadline() == pytest.approx(0.3, abs=0.05)
+    prices._pings.append(0.0)
+    prices._pong(30.0)
+    assert prices.pong_deadline() == MAX_PONG_DEADLINE
+
+
+def test_silent_link_is_declared_dead_even_right_after_traffic():
+    async def scenario():
+        prices = feed(heartbeat_interval=0.02, heartbeat_timeout=0.05)
+        prices._srtt, prices._rttvar = 0.001, 0.0
+        ws = SilentSocket()
+        started = asyncio.get_running_loop().time()
+        with pytest.raises(DeadConnection):
+            await asyncio.wait_for(prices._heartbeat(ws), 1.0)
+        return asyncio.get_running_loop().time() - started, ws
+
+    elapsed, ws = asyncio.run(scenario())
+    assert elapsed < 0.2
+    assert len(ws.sent) >= 2  # pings keep going on cadence while one is outstanding
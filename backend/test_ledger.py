@@ -0,0 +1,103 @@
+"""Testes do livro de fills (posição, preço médio, PnL realizado/não realizado, funding)"""
+import asyncio
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from ledger import FillsLedger
+
+
+def fill(tid, side, px, sz, oid=1, time_ms=None, **extra):
+    return {"tid": tid, "oid": oid, "coin": "BTC", "side": side, "px": str(px), "sz": str(sz), "fee": "0.1",
+            "time": time_ms if time_ms is not None else tid, **extra}
+
+
+def test_average_entry_and_realized_pnl():
+    ledger = FillsLedger()
+    ledger.apply_fill(fill(1, "B", 100, 1))
+    ledger.apply_fill(fill(2, "B", 110, 1))
+    entry = ledger.symbols["BTC"]
+    assert entry.position == 2
+    assert entry.avg_entry == pytest.approx(105)
+    ledger.apply_fill(fill(3, "A", 120, 1))
+    assert entry.position == 1
+    assert entry.realized_pnl == pytest.approx(15)
+    assert entry.avg_entry == pytest.approx(105)  # reducing keeps the entry
+
+
+def test_flip_resets_entry_and_exchange_pnl_wins():
+    ledger = FillsLedger()
+    ledger.apply_fill(fill(1, "B", 100, 1))
+    ledger.apply_fill(fill(2, "A", 90, 3, closedPnl="-9.5"))
+    entry = ledger.symbols["BTC"]
+    assert entry.position == -2
+    assert entry.avg_entry == 90
+    assert entry.realized_pnl == pytest.approx(-9.5)
+
+
+def test_duplicates_and_older_snapshot_fills_are_ignored():
+    ledger = FillsLedger()
+    ledger.apply_fill(fill(5, "B", 100, 1, time_ms=50))
+    assert ledger.apply_fill(fill(5, "B", 100, 1, time_ms=50)) is None
+    ledger.apply_message({"channel": "userFills",
+                          "data": {"isSnapshot": True, "fills": [fill(4, "B", 100, 1, time_ms=10)]}})
+    assert ledger.symbols["BTC"].position == 1
+    assert ledger.stats["duplicates"] == 1
+
+
+def test_marks_revalue_only_the_symbol_and_keep_totals():
+    ledger = FillsLedger()
+    ledger.apply_fill(fill(1, "B", 100, 2))
+    payload = ledger.mark("BTC", 103)
+    assert payload["unrealized_pnl"] == pytest.approx(6)
+    assert ledger.summary()["unrealized_pnl"] == pytest.approx(6)
+    ledger.apply_fill(fill(2, "A", 103, 2))
+    assert ledger.summary()["unrealized_pnl"] == pytest.approx(0)
+    assert ledger.summary()["realized_pnl"] == pytest.approx(6)
+
+
+def test_funding_is_counted_once():
+    ledger = FillsLedger()
+    funding = {"time": 1, "coin": "BTC", "usdc": "-1.5"}
+    ledger.apply_message({"channel": "userFundings", "data": {"fundings": [funding, funding]}})
+    assert ledger.symbols["BTC"].funding == pytest.approx(-1.5)
+    assert ledger.summary()["net_pnl"] == pytest.approx(-1.5)
+
+
+def test_order_fills_average_price():
+    ledger = FillsLedger()
+    ledger.apply_fill(fill(1, "B", 100, 1, oid=7))
+    ledger.apply_fill(fill(2, "B", 103, 2, oid=7))
+    ledger.apply_fill(fill(3, "B", 200, 1, oid=8))
+    size, avg = ledger.order_fills(7)
+    assert size == 3
+    assert avg == pytest.approx(102)
+    assert ledger.order_fills(9) == (0.0, None)
+
+
+def test_seen_fundings_are_bounded():
+    ledger = FillsLedger(history=2)
+    for t in range(100):
+        ledger.apply_funding({"time": t, "coin": "BTC", "usdc": "0.01"})
+    assert len(ledger._seen_fundings) == 10
+    assert ledger.stats["fundings"] == 100
+
+
+def test_fill_log_is_written_off_the_event_loop():
+    with tempfile.TemporaryDirectory() as log_dir:
+        ledger = FillsLedger(log_dir=log_dir)
+
+        async def scenario():
+            for tid in range(1, 4):
+                ledger.apply_fill(fill(tid, "B", 100, 1))
+            assert ledger._pending  # queued, not written on the loop
+            await ledger._flush_task
+
+        asyncio.run(scenario())
+        [name] = os.listdir(log_dir)
+        with open(os.path.join(log_dir, name), "rb") as f:
+            assert len(f.read().splitlines()) == 3
@@ -0,0 +1,49 @@
+"""Testes das regras de risco pré-trade"""
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from risk import PreTradeRisk, RiskRejected
+
+
+def engine(**limits) -> PreTradeRisk:
+    settings = {"risk_enabled": True, "risk_max_order_notional_usd": 0, "risk_max_position_notional_usd": 0,
+                "risk_max_open_orders": 0, "risk_max_price_deviation": 0, "risk_max_book_fraction": 0,
+                "risk_margin_check": True, **limits}
+    return PreTradeRisk(SimpleNamespace(**settings))
+
+
+def account(position=0.0, withdrawable=100.0):
+    positions = {"BTC": {"size": position, "leverage": 10.0}} if position else {}
+    return SimpleNamespace(seeded=True, positions=positions, withdrawable=withdrawable, open_orders={})
+
+
+def check(risk, size, price=100.0, **kwargs):
+    return risk.check("BTC", True, size, price, mid=price, leverage=10.0, asset={"maxLeverage": 50},
+                      account=account(), book=None, **kwargs)
+
+
+def test_new_order_margin_counts_the_whole_size():
+    with pytest.raises(RiskRejected, match="margin"):
+        check(engine(), 20.0)  # 2000 USD at 10x needs 200, 100 available
+
+
+def test_modify_counts_only_the_size_change():
+    risk = engine(risk_max_position_notional_usd=1500)
+    # Price amend of a large resting order: nothing new to margin or add to the position
+    assert check(risk, 20.0, price=101.0, new_order=False, replaces=20.0)["checked"]
+    # Shrinking never charges exposure
+    assert check(risk, 5.0, new_order=False, replaces=20.0)["checked"]
+    # Growing charges the increase only: 8 -> 18 adds 10 (1000 USD at 10x = 100 margin)
+    assert check(risk, 18.0, new_order=False, replaces=8.0)["checked"]
+    with pytest.raises(RiskRejected, match="margin"):
+        check(risk, 19.0, new_order=False, replaces=8.0)
+
+
+def test_order_notional_still_applies_to_the_whole_modified_order():
+    with pytest.raises(RiskRejected, match="order_notional"):
+        check(engine(risk_max_order_notional_usd=1000), 20.0, new_order=False, replaces=20.0)
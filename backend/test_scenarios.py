@@ -0,0 +1,46 @@
+"""Testes dos cenários de margem (merge de posições, grade de choques, liquidação)"""
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from scenarios import ScenarioError, maintenance_rate, margin_scenarios, merge_positions, shock_matrix
+
+
+def test_merge_positions_ignores_coin_case():
+    base = [{"coin": "BTC", "size": 1.0, "entry_price": 100.0, "mark_price": 110.0}]
+    merged = merge_positions(base, [{"coin": "btc", "size": 1.0, "entry_price": 120.0}])
+    assert len(merged) == 1
+    assert merged[0]["coin"] == "BTC"
+    assert merged[0]["size"] == 2.0
+    assert merged[0]["entry_price"] == pytest.approx(110.0)
+
+
+def test_merge_positions_flip_and_close():
+    base = [{"coin": "ETH", "size": 2.0, "entry_price": 10.0}, {"coin": "SOL", "size": -1.0, "entry_price": 5.0}]
+    merged = merge_positions(base, [{"coin": "ETH", "size": -3.0, "entry_price": 12.0},
+                                    {"coin": "sol", "size": 1.0, "entry_price": 6.0}])
+    assert merged == [{"coin": "ETH", "size": -1.0, "entry_price": 12.0, "mark_price": None}]
+
+
+def test_shock_matrix_shapes_and_validation():
+    assert shock_matrix(["BTC", "ETH"], None, range_pct=0.1, steps=5).shape == (5, 2)
+    matrix = shock_matrix(["BTC", "ETH"], {"ETH": [-0.1, 0.1]})
+    assert matrix.tolist() == [[0.0, -0.1], [0.0, 0.1]]
+    with pytest.raises(ScenarioError):
+        shock_matrix(["BTC"], {"ETH": [0.1]})
+    with pytest.raises(ScenarioError):
+        shock_matrix(["BTC"], [-1.0])
+
+
+def test_liquidation_price_is_where_margin_ratio_reaches_one():
+    sizes, entries, marks = np.array([1.0]), np.array([100.0]), np.array([100.0])
+    mmr = np.array([maintenance_rate(10)])
+    result = margin_scenarios(sizes, entries, marks, mmr, 20.0, np.array([[0.0]]))
+    liquidation = result["liquidation_prices"][0, 0]
+    at_liquidation = margin_scenarios(sizes, entries, marks, mmr, 20.0, np.array([[liquidation / 100.0 - 1.0]]))
+    assert at_liquidation["margin_ratio"][0] == pytest.approx(1.0)
+    assert not result["liquidated"][0]
@@ -0,0 +1,78 @@
+"""Testes do motor de gatilhos (índices ordenados, disparo, ordens condicionais, persistência)"""
+import asyncio
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from triggers import TriggerEngine
+
+
+def test_only_crossed_triggers_fire():
+    engine = TriggerEngine()
+    above = [engine.add("BTC", price, "above") for price in (110, 120, 130)]
+    below = [engine.add("BTC", price, "below") for price in (90, 80)]
+    engine.add("ETH", 1, "above")
+    assert engine.on_price("BTC", 100) == []
+    assert [t.id for t in engine.on_price("BTC", 120)] == [above[0].id, above[1].id]
+    assert [t.id for t in engine.on_price("BTC", 85)] == [below[0].id]
+    assert engine.triggers.keys() == {above[2].id, below[1].id, "trg-6"}
+    assert engine.get(above[0].id).fired_price == 120
+
+
+def test_equal_prices_fire_together_and_cancel_removes_from_index():
+    engine = TriggerEngine()
+    first = engine.add("BTC", 100, "above")
+    second = engine.add("BTC", 100, "above")
+    third = engine.add("BTC", 100, "above")
+    assert engine.cancel(second.id).status == "canceled"
+    assert engine.cancel(second.id) is None
+    assert {t.id for t in engine.on_price("BTC", 100)} == {first.id, third.id}
+    assert len(engine.indexes["BTC"]) == 0
+
+
+def test_validation():
+    engine = TriggerEngine()
+    with pytest.raises(ValueError):
+        engine.add("BTC", 100, "sideways")
+    with pytest.raises(ValueError):
+        engine.add("BTC", 100, "above", action="order")
+
+
+def test_order_triggers_submit_and_settle():
+    submitted = []
+
+    async def submit_order(trigger):
+        submitted.append(trigger.order)
+        return {"status": "error"} if trigger.order["size"] > 1 else {"status": "ok"}
+
+    async def scenario():
+        engine = TriggerEngine(submit_order=submit_order)
+        ok = engine.add("BTC", 100, "below", action="order", order={"side": "buy", "size": 1})
+        bad = engine.add("BTC", 100, "below", action="order", order={"side": "buy", "size": 2})
+        engine.on_price("BTC", 99)
+        await asyncio.gather(*engine._orders)
+        return engine, ok, bad
+
+    engine, ok, bad = asyncio.run(scenario())
+    assert len(submitted) == 2
+    assert ok.status == "executed" and bad.status == "failed"
+    assert engine.stats["orders_sent"] == 1 and engine.stats["order_errors"] == 1
+
+
+def test_active_triggers_survive_a_restart():
+    with tempfile.TemporaryDirectory() as data_dir:
+        path = os.path.join(data_dir, "triggers.json")
+        engine = TriggerEngine(path=path)
+        kept = engine.add("BTC", 150, "above", note="breakout")
+        engine.add("BTC", 90, "below")
+        engine.on_price("BTC", 80)  # no event loop: each change is written right away
+
+        restored = TriggerEngine(path=path)
+        assert restored.load() == 1
+        assert restored.get(kept.id).note == "breakout"
+        assert restored.add("ETH", 1, "above").id != kept.id
+        assert [t.id for t in restored.on_price("BTC", 151)] == [kept.id]
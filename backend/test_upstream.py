@@ -0,0 +1,85 @@
+"""Testes do limitador ponderado por prioridade e do agendador upstream"""
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from circuit_breaker import OPEN, CircuitBreaker, CircuitOpenError
+from upstream import Priority, UpstreamScheduler, WeightedRateLimiter, exchange_weight, request_weight
+
+
+class HTTPError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+def test_request_weights():
+    assert request_weight("/info", {"type": "allMids"}) == 2
+    assert request_weight("/info", {"type": "candleSnapshot"}) == 20
+    assert request_weight("/exchange", {"action": {"orders": [{}] * 80}}) == exchange_weight(80) == 3
+
+
+def test_market_data_keeps_off_the_order_reserve():
+    async def scenario():
+        limiter = WeightedRateLimiter(weight_per_minute=100, order_reserve=0.5)
+        await limiter.acquire(50, Priority.MARKET_DATA)
+        waiter = asyncio.create_task(limiter.acquire(2, Priority.MARKET_DATA))
+        await asyncio.sleep(0.05)
+        assert not waiter.done()
+        # Orders may spend the reserve, and are not queued behind market data
+        await asyncio.wait_for(limiter.acquire(40, Priority.ORDER), 0.1)
+        waiter.cancel()
+        return limiter.metrics()
+
+    metrics = asyncio.run(scenario())
+    assert metrics["classes"]["order"]["granted"] == 1
+    assert metrics["classes"]["market_data"]["granted"] == 1
+
+
+def test_heavy_request_is_admitted_despite_the_floor():
+    async def scenario():
+        # weight 25 + reserve 15 > capacity 30: the floor is clamped so a full bucket still admits it
+        limiter = WeightedRateLimiter(weight_per_minute=30, order_reserve=0.5)
+        await asyncio.wait_for(limiter.acquire(25, Priority.MARKET_DATA), 0.1)
+        return limiter.tokens
+
+    assert asyncio.run(scenario()) == pytest.approx(5, abs=0.1)
+
+
+def test_queued_heavy_request_is_dispatched():
+    async def scenario():
+        limiter = WeightedRateLimiter(weight_per_minute=120, order_reserve=0.5)
+        limiter.tokens = 0
+        limiter.rate = 1000.0  # refill fast; unclamped, 100 + the 60 floor would never fit in 120
+        await asyncio.wait_for(limiter.acquire(100, Priority.MARKET_DATA), 1.0)
+
+    asyncio.run(scenario())
+
+
+def test_scheduler_feeds_the_breaker():
+    breaker = CircuitBreaker("info", failure_ratio=0.6, min_calls=3, window=4, open_seconds=60.0)
+    scheduler = UpstreamScheduler(WeightedRateLimiter(weight_per_minute=1200), {"info": breaker})
+
+    def rejected():
+        raise HTTPError(400)
+
+    def unavailable():
+        raise HTTPError(503)
+
+    async def scenario():
+        with pytest.raises(HTTPError):
+            await scheduler.run(rejected, weight=2)
+        assert breaker.state != OPEN  # our own bad request says nothing about the upstream
+        for _ in range(2):
+            with pytest.raises(HTTPError):
+                await scheduler.run(unavailable, weight=2)
+        with pytest.raises(CircuitOpenError):
+            await scheduler.run(lambda: "ok", weight=2)
+
+    asyncio.run(scenario())
+    assert breaker.state == OPEN
+    assert breaker.stats["rejected"] == 1
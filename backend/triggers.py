@@ -0,0 +1,284 @@
+"""
+Motor de gatilhos de preço: alertas e ordens condicionais avaliados no servidor.
+
+Cada símbolo tem dois índices ordenados por preço (bisect):
+
+- above: dispara quando o preço >= limite -> a cada tick sai o prefixo <= preço
+- below: dispara quando o preço <= limite -> a cada tick sai o sufixo >= preço
+
+Um tick custa O(log n) para achar o corte mais o número de gatilhos que
+realmente cruzaram; os que não cruzaram nunca são visitados. Inserir e
+cancelar são O(log n) para achar a posição (mais o deslocamento da lista).
+
+Gatilhos ativos são gravados em disco (JSON, escrita atômica e agrupada) e
+recarregados no startup.
+"""
+import asyncio
+import bisect
+import itertools
+import logging
+import os
+import time
+from collections import deque
+from datetime import datetime
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+import orjson
+
+logger = logging.getLogger(__name__)
+
+DIRECTIONS = ("above", "below")
+ACTIONS = ("alert", "order")
+
+
+class Trigger:
+    __slots__ = ("id", "symbol", "direction", "price", "action", "order", "note", "status", "created_at",
+                 "fired_at", "fired_price", "result", "seq")
+
+    def __init__(self, trigger_id: str, symbol: str, direction: str, price: float, action: str,
+                 order: Optional[dict] = None, note: Optional[str] = None, created_at: Optional[str] = None,
+                 seq: int = 0):
+        self.id = trigger_id
+        self.symbol = symbol
+        self.direction = direction
+        self.price = price
+        self.action = action
+        self.order = order  # side, size / quantity_usd, order_type, limit_price, reduce_only
+        self.note = note
+        self.status = "active"
+        self.created_at = created_at or datetime.now().isoformat()
+        self.fired_at: Optional[str] = None
+        self.fired_price: Optional[float] = None
+        self.result: Optional[dict] = None
+        self.seq = seq
+
+    def as_dict(self) -> dict:
+        return {
+            "id": self.id, "symbol": self.symbol, "direction": self.direction, "price": self.price,
+            "action": self.action, "order": self.order, "note": self.note, "status": self.status,
+            "created_at": self.created_at, "fired_at": self.fired_at, "fired_price": self.fired_price,
+            "result": self.result,
+        }
+
+
+class SymbolIndex:
+    """Limites ordenados de um símbolo; chaves (preço, seq) paralelas aos ids"""
+
+    def __init__(self):
+        self.above_keys: List[Tuple[float, int]] = []
+        self.above_ids: List[str] = []
+        self.below_keys: List[Tuple[float, int]] = []
+        self.below_ids: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self.above_ids) + len(self.below_ids)
+
+    def _lists(self, direction: str):
+        return (self.above_keys, self.above_ids) if direction == "above" else (self.below_keys, self.below_ids)
+
+    def add(self, trigger: Trigger):
+        keys, ids = self._lists(trigger.direction)
+        key = (trigger.price, trigger.seq)
+        i = bisect.bisect_left(keys, key)
+        keys.insert(i, key)
+        ids.insert(i, trigger.id)
+
+    def remove(self, trigger: Trigger) -> bool:
+        keys, ids = self._lists(trigger.direction)
+        i = bisect.bisect_left(keys, (trigger.price, trigger.seq))
+        if i < len(keys) and ids[i] == trigger.id:
+            del keys[i]
+            del ids[i]
+            return True
+        return False
+
+    def crossed(self, price: float) -> List[str]:
+        """Remove e retorna os ids que cruzaram neste preço"""
+        fired: List[str] = []
+        # seq never exceeds the sentinel, so (price, inf) keeps equal prices on the fired side
+        cut = bisect.bisect_right(self.above_keys, (price, float("inf")))
+        if cut:
+            fired.extend(self.above_ids[:cut])
+            del self.above_keys[:cut]
+            del self.above_ids[:cut]
+        cut = bisect.bisect_left(self.below_keys, (price, -1))
+        if cut < len(self.below_keys):
+            fired.extend(self.below_ids[cut:])
+            del self.below_keys[cut:]
+            del self.below_ids[cut:]
+        return fired
+
+
+class TriggerEngine:
+    def __init__(self, path: Optional[str] = None, submit_order: Optional[Callable[[Trigger], Awaitable[dict]]] = None,
+                 on_fire: Optional[Callable[[Trigger], None]] = None, history: int = 1000, save_delay: float = 1.0):
+        self.path = path
+        self.submit_order = submit_order  # places the conditional order, returns its result
+        self.on_fire = on_fire  # alert/notification hook (fired, then again when an order settles)
+        self.triggers: Dict[str, Trigger] = {}
+        self.indexes: Dict[str, SymbolIndex] = {}
+        self.fired: Deque[Trigger] = deque(maxlen=history)
+        self.save_delay = save_delay
+        self._seq = itertools.count(1)
+        self._dirty = False
+        self._save_task: Optional[asyncio.Task] = None
+        self._orders: set = set()
+        self.stats = {"created": 0, "fired": 0, "canceled": 0, "orders_sent": 0, "order_errors": 0,
+                      "ticks": 0, "saves": 0, "eval_ns_max": 0}
+
+    # --- lifecycle ---
+
+    def add(self, symbol: str, price: float, direction: str, action: str = "alert", order: Optional[dict] = None,
+            note: Optional[str] = None) -> Trigger:
+        if direction not in DIRECTIONS:
+            raise ValueError(f"direction must be one of {', '.join(DIRECTIONS)}")
+        if action not in ACTIONS:
+            raise ValueError(f"action must be one of {', '.join(ACTIONS)}")
+        if action == "order" and not order:
+            raise ValueError("Order triggers need the order to place")
+        seq = next(self._seq)
+        trigger = Trigger(f"trg-{seq}", symbol, direction, price, action, order, note, seq=seq)
+        self._insert(trigger)
+        self.stats["created"] += 1
+        self._schedule_save()
+        return trigger
+
+    def _insert(self, trigger: Trigger):
+        self.triggers[trigger.id] = trigger
+        index = self.indexes.get(trigger.symbol)
+        if index is None:
+            index = self.indexes[trigger.symbol] = SymbolIndex()
+        index.add(trigger)
+
+    def cancel(self, trigger_id: str) -> Optional[Trigger]:
+        trigger = self.triggers.pop(trigger_id, None)
+        if trigger is None:
+            return None
+        self.indexes[trigger.symbol].remove(trigger)
+        trigger.status = "canceled"
+        self.stats["canceled"] += 1
+        self._schedule_save()
+        return trigger
+
+    def get(self, trigger_id: str) -> Optional[Trigger]:
+        trigger = self.triggers.get(trigger_id)
+        if trigger is None:
+            trigger = next((t for t in self.fired if t.id == trigger_id), None)
+        return trigger
+
+    def list(self, symbol: Optional[str] = None, status: Optional[str] = None, limit: int = 1000) -> List[Trigger]:
+        pool = list(self.triggers.values()) if status in (None, "active") else []
+        if status != "active":
+            pool += list(self.fired)
+        return [t for t in pool if (symbol is None or t.symbol == symbol) and (status is None or t.status == status)][:limit]
+
+    # --- hot path ---
+
+    def on_price(self, symbol: str, price: float) -> List[Trigger]:
+        """Tick: dispara só os gatilhos do símbolo que cruzaram"""
+        index = self.indexes.get(symbol)
+        if not index:
+            return []
+        start = time.perf_counter_ns()
+        fired_ids = index.crossed(price)
+        self.stats["ticks"] += 1
+        if not fired_ids:
+            self.stats["eval_ns_max"] = max(self.stats["eval_ns_max"], time.perf_counter_ns() - start)
+            return []
+        now = datetime.now().isoformat()
+        fired = []
+        for trigger_id in fired_ids:
+            trigger = self.triggers.pop(trigger_id)
+            trigger.status = "fired"
+            trigger.fired_at = now
+            trigger.fired_price = price
+            self.fired.append(trigger)
+            fired.append(trigger)
+        self.stats["fired"] += len(fired)
+        self.stats["eval_ns_max"] = max(self.stats["eval_ns_max"], time.perf_counter_ns() - start)
+        logger.info(f"🎯 {len(fired)} trigger(s) fired on {symbol} @ {price}")
+        for trigger in fired:
+            self._notify(trigger)
+            if trigger.action == "order":
+                task = asyncio.create_task(self._place(trigger))
+                self._orders.add(task)
+                task.add_done_callback(self._orders.discard)
+        self._schedule_save()
+        return fired
+
+    async def _place(self, trigger: Trigger):
+        if self.submit_order is None:
+            trigger.status = "failed"
+            trigger.result = {"error": "Order submission not configured"}
+        else:
+            try:
+                trigger.result = await self.submit_order(trigger)
+                trigger.status = "failed" if trigger.result.get("status") == "error" else "executed"
+            except Exception as e:
+                trigger.status = "failed"
+                trigger.result = {"error": f"{type(e).__name__}: {e}"}
+        if trigger.status == "failed":
+            self.stats["order_errors"] += 1
+            logger.error(f"❌ Trigger {trigger.id} order failed: {trigger.result}")
+        else:
+            self.stats["orders_sent"] += 1
+        self._notify(trigger)
+
+    def _notify(self, trigger: Trigger):
+        if self.on_fire is not None:
+            self.on_fire(trigger)
+
+    # --- persistence ---
+
+    def load(self) -> int:
+        """Recarrega os gatilhos ativos gravados (no startup)"""
+        if not self.path or not os.path.exists(self.path):
+            return 0
+        try:
+            with open(self.path, "rb") as f:
+                saved = orjson.loads(f.read())
+        except (OSError, orjson.JSONDecodeError) as e:
+            logger.error(f"Could not load triggers from {self.path}: {e}")
+            return 0
+        for item in saved.get("triggers", []):
+            seq = next(self._seq)
+            trigger = Trigger(item["id"], item["symbol"], item["direction"], item["price"], item["action"],
+                              item.get("order"), item.get("note"), item.get("created_at"), seq=seq)
+            self._insert(trigger)
+        # Keep new ids past the restored ones
+        restored = [int(t.split("-")[1]) for t in self.triggers if t.split("-")[-1].isdigit()]
+        self._seq = itertools.count(max([*restored, len(self.triggers)], default=0) + 1)
+        return len(self.triggers)
+
+    def _schedule_save(self):
+        if not self.path:
+            return
+        self._dirty = True
+        if self._save_task is None or self._save_task.done():
+            try:
+                self._save_task = asyncio.get_running_loop().create_task(self._save_later())
+            except RuntimeError:
+                self._write(list(self.triggers.values()))  # no loop (tests, scripts): write now
+
+    async def _save_later(self):
+        # Bursts of changes (many triggers fired by one tick) become one write
+        await asyncio.sleep(self.save_delay)
+        while self._dirty:
+            self._dirty = False
+            # Copy the list on the loop; serializing 100k triggers happens off it
+            await asyncio.to_thread(self._write, list(self.triggers.values()))
+
+    def _write(self, triggers: List[Trigger]):
+        try:
+            data = orjson.dumps({"saved_at": datetime.now().isoformat(), "triggers": [t.as_dict() for t in triggers]})
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp = f"{self.path}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, self.path)
+            self.stats["saves"] += 1
+        except OSError as e:
+            logger.error(f"Could not save triggers to {self.path}: {e}")
+
+    def metrics(self) -> dict:
+        return {**self.stats, "active": len(self.triggers), "symbols": sum(1 for i in self.indexes.values() if i)}
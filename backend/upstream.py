@@ -0,0 +1,252 @@
+"""
+Agendador central das chamadas upstream (REST /info e /exchange da Hyperliquid).
+
+A Hyperliquid limita requisições REST por peso (1200 por minuto por IP). Todas as
+chamadas do SDK passam por aqui: um token bucket ponderado com filas por
+prioridade, para que polling de dashboard nunca atrase envio/cancelamento de ordens,
+e um circuit breaker por classe de endpoint, para falhar rápido durante quedas.
+
+    await upstream.info(info_client, "all_mids")                          # market data
+    await upstream.exchange(exchange, "order", ..., priority=Priority.ORDER)
+"""
+import asyncio
+import contextvars
+import heapq
+import itertools
+import logging
+import time
+from enum import IntEnum
+from threading import Lock
+from typing import Any, Callable, Dict, List, Optional
+
+from circuit_breaker import CircuitBreaker, is_upstream_failure
+from profiling import thread_profiled
+
+logger = logging.getLogger(__name__)
+
+
+class Priority(IntEnum):
+    """Classes de prioridade (menor = mais urgente)"""
+    ORDER = 0         # order placement / cancel / modify
+    ACCOUNT = 1       # account state (positions, margin, open orders)
+    MARKET_DATA = 2   # prices, books, metadata, debug probes
+
+
+# Request weights per Hyperliquid's rate limit docs
+INFO_WEIGHTS: Dict[str, int] = {
+    "all_mids": 2,
+    "l2_snapshot": 2,
+    "user_state": 2,
+    "spot_user_state": 2,
+    "query_order_by_oid": 2,
+    "query_order_by_cloid": 2,
+    "user_role": 60,
+}
+DEFAULT_INFO_WEIGHT = 20
+INFO_TYPE_WEIGHTS: Dict[str, int] = {
+    "allMids": 2, "l2Book": 2, "clearinghouseState": 2, "orderStatus": 2,
+    "spotClearinghouseState": 2, "exchangeStatus": 2, "userRole": 60,
+}
+
+# Set while a call runs under the scheduler, so the accounting hook doesn't count it twice
+_scheduled: contextvars.ContextVar[bool] = contextvars.ContextVar("upstream_scheduled", default=False)
+
+
+def exchange_weight(batch_length: int = 1) -> int:
+    """Ações em /exchange pesam 1 + floor(tamanho_do_lote / 40)"""
+    return 1 + batch_length // 40
+
+
+def candle_weight(candles: int) -> int:
+    """candleSnapshot pesa 20 + 1 a cada 60 candles retornados (estimado pelo intervalo pedido)"""
+    return DEFAULT_INFO_WEIGHT + candles // 60
+
+
+def request_weight(url_path: str, payload: Any) -> int:
+    """Peso de uma requisição crua do SDK (usado para contabilizar chamadas fora do agendador)"""
+    payload = payload or {}
+    if url_path == "/exchange":
+        action = payload.get("action", {})
+        batch = action.get("orders") or action.get("cancels") or action.get("modifies") or [None]
+        return exchange_weight(len(batch))
+    return INFO_TYPE_WEIGHTS.get(payload.get("type"), DEFAULT_INFO_WEIGHT)
+
+
+class WeightedRateLimiter:
+    """Token bucket ponderado com filas por prioridade.
+
+    Prioridades mais baixas não podem consumir a reserva (fração da capacidade)
+    guardada para ordens, e nunca passam na frente de um pedido mais urgente na fila.
+    """
+
+    def __init__(self, weight_per_minute: int = 1200, order_reserve: float = 0.1):
+        self._lock = Lock()
+        self._queue: List[list] = []  # heap of [priority, seq, weight, future, enqueued_at]
+        self._seq = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.configure(weight_per_minute, order_reserve)
+        self.tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self.stats = {
+            p.name.lower(): {"granted": 0, "weight": 0, "throttled": 0, "wait_total_s": 0.0, "wait_max_s": 0.0}
+            for p in Priority
+        }
+        self.unscheduled_weight = 0
+
+    def configure(self, weight_per_minute: int, order_reserve: float):
+        self.capacity = max(int(weight_per_minute), 1)
+        self.rate = self.capacity / 60.0
+        self.reserve = self.capacity * min(max(order_reserve, 0.0), 0.9)
+        if hasattr(self, "tokens"):
+            self.tokens = min(self.tokens, self.capacity)
+
+    def _floor(self, priority: Priority) -> float:
+        """Tokens que precisam sobrar depois de atender esta prioridade"""
+        if priority == Priority.ORDER:
+            return 0.0
+        if priority == Priority.ACCOUNT:
+            return self.reserve / 2
+        return self.reserve
+
+    def _admission_floor(self, priority: Priority, weight: int) -> float:
+        """Piso da prioridade, limitado para que um pedido pesado ainda caiba com o bucket cheio"""
+        return min(self._floor(priority), self.capacity - weight)
+
+    def _refill(self):
+        now = time.monotonic()
+        with self._lock:
+            self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+            self._updated = now
+
+    def _record(self, priority: Priority, weight: int, waited: float):
+        stats = self.stats[priority.name.lower()]
+        stats["granted"] += 1
+        stats["weight"] += weight
+        if waited > 0:
+            stats["throttled"] += 1
+            stats["wait_total_s"] += waited
+            stats["wait_max_s"] = max(stats["wait_max_s"], waited)
+
+    def consume(self, weight: int):
+        """Debita peso de uma chamada que não passou pelo agendador (pode ficar negativo)"""
+        self._refill()
+        with self._lock:
+            self.tokens -= weight
+            self.unscheduled_weight += weight
+
+    def _blocked_by_queue(self, priority: Priority) -> bool:
+        return any(entry[0] <= priority and not entry[3].done() for entry in self._queue)
+
+    async def acquire(self, weight: int, priority: Priority = Priority.MARKET_DATA):
+        weight = min(max(int(weight), 1), self.capacity)
+        self._refill()
+        if not self._blocked_by_queue(priority) and self.tokens - weight >= self._admission_floor(priority, weight):
+            with self._lock:
+                self.tokens -= weight
+            self._record(priority, weight, 0.0)
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, [priority, next(self._seq), weight, future, time.monotonic()])
+        self._dispatch()
+        await future
+
+    def _dispatch(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._refill()
+        while self._queue:
+            priority, _, weight, future, enqueued_at = self._queue[0]
+            if future.done():  # cancelled while waiting
+                heapq.heappop(self._queue)
+                continue
+            deficit = weight + self._admission_floor(priority, weight) - self.tokens
+            if deficit > 0:
+                self._timer = asyncio.get_running_loop().call_later(deficit / self.rate, self._dispatch)
+                return
+            heapq.heappop(self._queue)
+            with self._lock:
+                self.tokens -= weight
+            self._record(Priority(priority), weight, time.monotonic() - enqueued_at)
+            future.set_result(None)
+
+    def metrics(self) -> dict:
+        self._refill()
+        depth = {p.name.lower(): 0 for p in Priority}
+        for entry in self._queue:
+            if not entry[3].done():
+                depth[Priority(entry[0]).name.lower()] += 1
+        return {
+            "capacity_per_minute": self.capacity,
+            "tokens_available": round(self.tokens, 2),
+            "budget_used_percent": round(100 * (1 - max(self.tokens, 0) / self.capacity), 1),
+            "order_reserve": round(self.reserve, 1),
+            "queue_depth": depth,
+            "unscheduled_weight": self.unscheduled_weight,
+            "classes": {name: {**s, "wait_total_s": round(s["wait_total_s"], 3), "wait_max_s": round(s["wait_max_s"], 3)}
+                        for name, s in self.stats.items()},
+        }
+
+
+class UpstreamScheduler:
+    """Porta única para chamadas bloqueantes do SDK: breaker, limite por peso/prioridade, fora do event loop"""
+
+    def __init__(self, limiter: WeightedRateLimiter, breakers: Dict[str, CircuitBreaker]):
+        self.limiter = limiter
+        self.breakers = breakers
+
+    async def run(self, fn: Callable, *args, weight: int, priority: Priority = Priority.MARKET_DATA,
+                  endpoint: str = "info", **kwargs) -> Any:
+        breaker = self.breakers[endpoint]
+        # Fail fast before spending budget or a worker thread (raises CircuitOpenError)
+        breaker.before_call()
+        try:
+            await self.limiter.acquire(weight, priority)
+        except BaseException:
+            breaker.release_probe()
+            raise
+        token = _scheduled.set(True)
+        start = time.monotonic()
+        try:
+            # to_thread copies the context, so the accounting hook sees _scheduled=True
+            result = await asyncio.to_thread(thread_profiled(fn), *args, **kwargs)
+        except Exception as e:
+            if is_upstream_failure(e):
+                breaker.record_failure(e)
+            elif hasattr(e, "status_code"):
+                breaker.record_success(time.monotonic() - start)  # upstream answered (4xx)
+            else:
+                breaker.release_probe()
+            raise
+        except BaseException:
+            breaker.release_probe()
+            raise
+        finally:
+            _scheduled.reset(token)
+        breaker.record_success(time.monotonic() - start)
+        return result
+
+    async def info(self, client, method: str, *args, priority: Priority = Priority.MARKET_DATA, **kwargs) -> Any:
+        weight = INFO_WEIGHTS.get(method, DEFAULT_INFO_WEIGHT)
+        return await self.run(getattr(client, method), *args, weight=weight, priority=priority,
+                              endpoint="info", **kwargs)
+
+    async def exchange(self, client, method: str, *args, priority: Priority = Priority.ORDER,
+                       batch_length: int = 1, **kwargs) -> Any:
+        return await self.run(getattr(client, method), *args, weight=exchange_weight(batch_length),
+                              priority=priority, endpoint="exchange", **kwargs)
+
+    def instrument(self, client):
+        """Contabiliza no bucket as requisições que o SDK faz por conta própria"""
+        post = client.post
+
+        def accounted_post(url_path, payload=None):
+            if not _scheduled.get():
+                self.limiter.consume(request_weight(url_path, payload))
+            return post(url_path, payload)
+
+        client.post = accounted_post
+        return client
+
+    def metrics(self) -> dict:
+        return {**self.limiter.metrics(), "circuits": {name: b.metrics() for name, b in self.breakers.items()}}
@@ -29,7 +29,8 @@ function App() {
 
   // Fetch market price (REST or WebSocket)
   useEffect(() => {
-    let priceInterval = null
+    let priceStream = null
+    let websocketFailed = false // shared with the REST price stream fallback
     let wsConnection = null
     let reconnectTimeout = null
     let reconnectAttempts = 0
@@ -60,7 +61,7 @@ function App() {
           window._priceSourceSetupLogged = true
         }
         
-        let websocketFailed = false
+        websocketFailed = false
         
         // PRIORITY 1: WebSocket (if enabled)
         if (websocketEnabled) {
@@ -79,11 +80,11 @@ function App() {
                 reconnectAttempts = 0 // Reset on successful connection
                 websocketFailed = false // Reset failure flag
                 
-                // Stop REST polling immediately - WebSocket has priority
-                if (priceInterval) {
-                  console.log('🛑 Stopping REST polling - WebSocket has priority and is connected')
-                  clearInterval(priceInterval)
-                  priceInterval = null
+                // Stop the REST price stream immediately - WebSocket has priority
+                if (priceStream) {
+                  console.log('🛑 Stopping REST price stream - WebSocket has priority and is connected')
+                  priceStream.close()
+                  priceStream = null
                 }
                 
                 // Always get initial price from cache (source of truth)
@@ -233,7 +234,7 @@ function App() {
                 websocketFailed = true
                 // Fallback to REST if WebSocket fails and REST is enabled
                 const currentRestEnabled = localStorage.getItem('rest_enabled') === 'true'
-                if (currentRestEnabled && restEnabled && !priceInterval) {
+                if (currentRestEnabled && restEnabled && !priceStream) {
                   console.log('⚠️ WebSocket error, falling back to REST API')
                   setupRestPriceSource()
                 }
@@ -255,10 +256,10 @@ function App() {
                   if (currentRestEnabled && restEnabled && reconnectAttempts >= maxReconnectAttempts) {
                     console.log('⚠️ WebSocket max reconnection attempts reached, falling back to REST')
                     websocketFailed = true
-                    if (!priceInterval) {
+                    if (!priceStream) {
                       setupRestPriceSource()
                     }
-                  } else if (currentRestEnabled && restEnabled && !priceInterval) {
+                  } else if (currentRestEnabled && restEnabled && !priceStream) {
                     // Fallback to REST if WebSocket fails (only if REST is enabled)
                     console.log('⚠️ WebSocket failed, falling back to REST API')
                     websocketFailed = true
@@ -271,7 +272,7 @@ function App() {
               websocketFailed = true
               // Fallback to REST if WebSocket fails and REST is enabled
               const currentRestEnabled = localStorage.getItem('rest_enabled') === 'true'
-              if (currentRestEnabled && restEnabled && !priceInterval) {
+              if (currentRestEnabled && restEnabled && !priceStream) {
                 console.log('⚠️ WebSocket connection failed, falling back to REST API')
                 setupRestPriceSource()
               }
@@ -314,7 +315,7 @@ function App() {
       }
       
       // Don't setup REST if already running
-      if (priceInterval) {
+      if (priceStream) {
         return // Already running
       }
       
@@ -322,14 +323,18 @@ function App() {
       const storedWebsocket = localStorage.getItem('websocket_enabled')
       const websocketActive = storedWebsocket === 'true'
       
-      const fetchPrice = async () => {
+      // Push from the backend (it refreshes REST once for every client) instead of polling
+      // EventSource reconnects by itself and resumes from the last event id
+      priceStream = new EventSource(getApiUrl(`/api/stream/prices?symbols=${symbol}`))
+      
+      priceStream.addEventListener('price_update', (event) => {
         // Double-check REST is still enabled
         const currentRestEnabled = localStorage.getItem('rest_enabled') === 'true'
         if (!currentRestEnabled) {
           console.log('⚠️ REST was disabled, stopping REST price updates')
-          if (priceInterval) {
-            clearInterval(priceInterval)
-            priceInterval = null
+          if (priceStream) {
+            priceStream.close()
+            priceStream = null
           }
           return
         }
@@ -339,87 +344,51 @@ function App() {
           return // WebSocket is active, don't override with REST
         }
         
-        setFetchingPrice(true)
         try {
-          // ALWAYS use cache first (faster and has latest data)
-          const cacheResponse = await axios.get(getApiUrl(`/api/cache/prices/${symbol}`))
+          const data = JSON.parse(event.data)
+          const cacheData = data.cache_data
+          if (data.symbol !== symbol || !cacheData) {
+            return
+          }
           
-          if (cacheResponse.data && cacheResponse.data.success && cacheResponse.data.data) {
-            const cacheData = cacheResponse.data.data
+          // Only update if WebSocket is not active or has failed
+          if (!websocketActive || websocketFailed) {
+            // Update all prices from cache (source of truth)
+            if (cacheData.mid_price) {
+              const midPrice = parseFloat(cacheData.mid_price)
+              setMidPrice(midPrice)
+              // Use MID_PRICE for askPrice field (not ask_price)
+              setAskPrice(midPrice)
+            }
             
-            // Only update if WebSocket is not active or has failed
-            if (!websocketActive || websocketFailed) {
-              // Update all prices from cache (source of truth)
-              if (cacheData.mid_price) {
-                const midPrice = parseFloat(cacheData.mid_price)
-                setMidPrice(midPrice)
-                // Use MID_PRICE for askPrice field (not ask_price)
-                setAskPrice(midPrice)
-              }
-              
-              if (cacheData.bid_price) {
-                setBidPrice(parseFloat(cacheData.bid_price))
-              } else if (cacheData.mid_price) {
-                setBidPrice(parseFloat(cacheData.mid_price) * 0.9995) // Fallback estimate
-              }
-              
-              if (cacheData.spread) {
-                setSpread(parseFloat(cacheData.spread))
-              } else if (cacheData.ask_price && cacheData.bid_price) {
-                setSpread(parseFloat(cacheData.ask_price) - parseFloat(cacheData.bid_price))
-              }
-              
-              console.log('📊 Market data updated from cache:', {
-                bid: cacheData.bid_price,
-                askPrice_field: cacheData.mid_price, // Using mid_price for askPrice field
-                mid: cacheData.mid_price,
-                spread: cacheData.spread,
-                source: cacheData.source || 'cache'
-              })
+            if (cacheData.bid_price) {
+              setBidPrice(parseFloat(cacheData.bid_price))
+            } else if (cacheData.mid_price) {
+              setBidPrice(parseFloat(cacheData.mid_price) * 0.9995) // Fallback estimate
             }
-          } else {
-            // Fallback to REST API if cache is empty
-            const response = await axios.get(getApiUrl(`/api/market/${symbol}`))
-            if (response.data) {
-              if (!websocketActive || websocketFailed) {
-                if (response.data.mid_price) {
-                  const midPrice = parseFloat(response.data.mid_price)
-                  setMidPrice(midPrice)
-                  // Use MID_PRICE for askPrice field (not ask_price)
-                  setAskPrice(midPrice)
-                }
-                
-                if (response.data.bid_price) {
-                  setBidPrice(parseFloat(response.data.bid_price))
-                } else if (response.data.mid_price) {
-                  setBidPrice(parseFloat(response.data.mid_price) * 0.9995)
-                }
-                
-                if (response.data.spread) {
-                  setSpread(parseFloat(response.data.spread))
-                } else if (response.data.ask_price && response.data.bid_price) {
-                  setSpread(parseFloat(response.data.ask_price) - parseFloat(response.data.bid_price))
-                }
-                
-                console.log('📊 Market data updated via REST (fallback):', {
-                  bid: response.data.bid_price,
-                  askPrice_field: response.data.mid_price, // Using mid_price for askPrice field
-                  mid: response.data.mid_price,
-                  spread: response.data.spread,
-                  source: 'rest'
-                })
-              }
+            
+            if (cacheData.spread) {
+              setSpread(parseFloat(cacheData.spread))
+            } else if (cacheData.ask_price && cacheData.bid_price) {
+              setSpread(parseFloat(cacheData.ask_price) - parseFloat(cacheData.bid_price))
             }
+            
+            console.log('📊 Market data updated from price stream:', {
+              bid: cacheData.bid_price,
+              askPrice_field: cacheData.mid_price, // Using mid_price for askPrice field
+              mid: cacheData.mid_price,
+              spread: cacheData.spread,
+              source: cacheData.source || 'cache'
+            })
           }
         } catch (err) {
-          console.error('Error fetching price from cache/REST:', err)
-        } finally {
-          setFetchingPrice(false)
+          console.error('Error parsing price stream event:', err)
         }
-      }
+      })
       
-      fetchPrice()
-      priceInterval = setInterval(fetchPrice, 1500) // Update every 1.5 seconds (faster updates from cache)
+      priceStream.onerror = () => {
+        console.warn('⚠️ Price stream interrupted, reconnecting...')
+      }
     }
     
     setupPriceSource()
@@ -450,67 +419,13 @@ function App() {
     // Also listen for custom events (for same-tab changes)
     window.addEventListener('websocket-config-changed', handleStorageChange)
     
-    // Separate polling for askPrice from cache (ensures real-time updates)
-    // BUT: Only if WebSocket is NOT active (WebSocket has priority)
-    const cachePollingInterval = setInterval(async () => {
-      try {
-        // Check if WebSocket is active and working - if so, skip REST polling
-        const storedWebsocket = localStorage.getItem('websocket_enabled')
-        const websocketActive = storedWebsocket === 'true'
-        
-        // If WebSocket is enabled and connected, don't poll cache (WebSocket has priority)
-        if (websocketActive && wsConnection && wsConnection.readyState === WebSocket.OPEN) {
-          return // WebSocket is active and working - skip REST polling
-        }
-        
-        // Only poll cache if WebSocket is disabled or not working
-        const cacheResponse = await axios.get(getApiUrl(`/api/cache/prices/${symbol}`))
-        if (cacheResponse.data && cacheResponse.data.success && cacheResponse.data.data) {
-          const cacheData = cacheResponse.data.data
-          
-          // Always update askPrice from cache MID_PRICE (not ask_price)
-          if (cacheData.mid_price !== null && cacheData.mid_price !== undefined) {
-            const newMidPrice = parseFloat(cacheData.mid_price)
-            if (!isNaN(newMidPrice) && newMidPrice > 0) {
-              setAskPrice(prev => {
-                // Always update, even if value is the same (forces re-render)
-                if (prev !== newMidPrice) {
-                  console.log('💰 AskPrice atualizado do cache (MID_PRICE) - REST fallback:', prev?.toFixed(2), '→', newMidPrice.toFixed(2))
-                  return newMidPrice
-                }
-                // Even if same, return new value to force re-render
-                return newMidPrice
-              })
-            }
-          }
-          
-          // Update other prices too
-          if (cacheData.mid_price) {
-            const newMid = parseFloat(cacheData.mid_price)
-            setMidPrice(prev => prev !== newMid ? newMid : prev)
-          }
-          if (cacheData.bid_price) {
-            const newBid = parseFloat(cacheData.bid_price)
-            setBidPrice(prev => prev !== newBid ? newBid : prev)
-          }
-          if (cacheData.spread) {
-            const newSpread = parseFloat(cacheData.spread)
-            setSpread(prev => prev !== newSpread ? newSpread : prev)
-          }
-        }
-      } catch (err) {
-        // Silent fail - don't spam console
-      }
-    }, 500) // Poll every 0.5 seconds for faster updates
-    
     return () => {
-      clearInterval(cachePollingInterval)
       window.removeEventListener('storage', handleStorageChange)
       window.removeEventListener('websocket-config-changed', handleStorageChange)
       isSettingUp = false // Reset flag on cleanup
-      if (priceInterval) {
-        clearInterval(priceInterval)
-        priceInterval = null
+      if (priceStream) {
+        priceStream.close()
+        priceStream = null
       }
       if (wsConnection) {
         wsConnection._connectedLogged = false // Reset log flag
@@ -575,8 +490,34 @@ function App() {
         const liqPrice = price * (1 + (1 / lev) - 0.005) // Simplified
         setLiquidation(liqPrice.toFixed(2))
       }
+
+      // Server-side estimate (real maintenance rates, whole account); replaces the local one when available
+      let cancelled = false
+      const size = (side === 'buy' ? 1 : -1) * qty / price
+      const timer = setTimeout(async () => {
+        try {
+          const response = await axios.post(getApiUrl('/api/account/scenarios'), {
+            positions: [],
+            add_positions: [{ coin: symbol, size, entry_price: price, mark_price: price, leverage: lev }],
+            shocks: [0],
+          })
+          const position = response.data.current?.positions?.find(p => p.coin === symbol)
+          if (!cancelled && position) {
+            setMaintMargin(position.maintenance_margin.toFixed(2))
+            if (position.liquidation_price) {
+              setLiquidation(position.liquidation_price.toFixed(2))
+            }
+          }
+        } catch (err) {
+          // Keep the local estimate
+        }
+      }, 300)
+      return () => {
+        cancelled = true
+        clearTimeout(timer)
+      }
     }
-  }, [askPrice, quantityUsd, leverage, side])
+  }, [askPrice, quantityUsd, leverage, side, symbol])
 
   const handleSubmit = async (e) => {
     e.preventDefault()
@@ -17,72 +17,49 @@ function Settings() {
     loadConfig()
   }, []) // Empty dependency array - only run once on mount
 
-  // Separate effect for polling WebSocket status and REST prices
+  // Separate effect for WebSocket status and REST prices: one push stream instead of polling
   useEffect(() => {
-    // Poll WebSocket status
-    const pollWebSocketStatus = setInterval(async () => {
+    const storedRest = localStorage.getItem('rest_enabled')
+    const isRestEnabled = storedRest === 'true' || (storedRest === null && restEnabled)
+    
+    // EventSource reconnects by itself and resumes from the last event id
+    const priceStream = new EventSource(getApiUrl('/api/stream/prices?symbols=all'))
+    
+    priceStream.addEventListener('status', (event) => {
       try {
-        const response = await axios.get(getApiUrl('/api/config'))
-        setWebsocketStatus(response.data.websocket_running || false)
-        setWebsocketPrices(response.data.websocket_prices || {})
+        const data = JSON.parse(event.data)
+        setWebsocketStatus(data.websocket_running || false)
+        setWebsocketPrices(data.websocket_prices || {})
       } catch (err) {
-        console.error('Error polling WebSocket status:', err)
+        console.error('Error parsing status event:', err)
       }
-    }, 2000) // Check status every 2 seconds
+    })
     
-    const storedRest = localStorage.getItem('rest_enabled')
-    const isRestEnabled = storedRest === 'true' || (storedRest === null && restEnabled)
+    priceStream.addEventListener('price_update', (event) => {
+      try {
+        const data = JSON.parse(event.data)
+        const cacheData = data.cache_data
+        if (!cacheData || !cacheData.mid_price) {
+          return
+        }
+        if (cacheData.source === 'websocket') {
+          setWebsocketPrices(prev => ({ ...prev, [data.symbol]: cacheData.mid_price }))
+        }
+        if (isRestEnabled && localStorage.getItem('rest_enabled') !== 'false') {
+          setRestPrices(prev => ({ ...prev, [data.symbol]: cacheData.mid_price }))
+          setRestStatus(true)
+        }
+      } catch (err) {
+        console.error('Error parsing price event:', err)
+      }
+    })
     
-    if (!isRestEnabled) {
-      return () => clearInterval(pollWebSocketStatus) // Only clear WebSocket polling
+    priceStream.onerror = () => {
+      setRestStatus(false)
     }
     
-    // Poll REST prices from cache (faster) if REST is enabled
-    const pollRestPrices = setInterval(() => {
-      const currentStoredRest = localStorage.getItem('rest_enabled')
-      if (currentStoredRest === 'true') {
-        // Try cache first (faster, no API calls)
-        axios.get(getApiUrl('/api/cache/prices'))
-          .then(response => {
-            if (response.data && response.data.success && response.data.cache) {
-              const cache = response.data.cache
-              const prices = {}
-              if (cache.BTC?.mid_price) prices.BTC = cache.BTC.mid_price
-              if (cache.ETH?.mid_price) prices.ETH = cache.ETH.mid_price
-              if (cache.SOL?.mid_price) prices.SOL = cache.SOL.mid_price
-              
-              if (Object.keys(prices).length > 0) {
-                setRestPrices(prices)
-                setRestStatus(true)
-              }
-            }
-          })
-          .catch(() => {
-            // Fallback to direct REST API if cache fails
-            Promise.all([
-              axios.get(getApiUrl('/api/market/BTC')).catch(() => null),
-              axios.get(getApiUrl('/api/market/ETH')).catch(() => null),
-              axios.get(getApiUrl('/api/market/SOL')).catch(() => null)
-            ]).then(([btcRes, ethRes, solRes]) => {
-              const prices = {}
-              if (btcRes?.data?.mid_price) prices.BTC = btcRes.data.mid_price
-              if (ethRes?.data?.mid_price) prices.ETH = ethRes.data.mid_price
-              if (solRes?.data?.mid_price) prices.SOL = solRes.data.mid_price
-              
-              if (Object.keys(prices).length > 0) {
-                setRestPrices(prices)
-                setRestStatus(true)
-              }
-            }).catch(() => {
-              setRestStatus(false)
-            })
-          })
-      }
-    }, 2000) // Update every 2 seconds (faster with cache)
-    
     return () => {
-      clearInterval(pollWebSocketStatus)
-      clearInterval(pollRestPrices)
+      priceStream.close()
     }
   }, [restEnabled])
 